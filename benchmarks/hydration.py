@@ -0,0 +1,106 @@
+import argparse
+import time
+
+from psycopg2.extras import RealDictCursor
+
+from gainy.data_access.models import SlotsModel, classproperty
+from gainy.trading.models import TradingAccount
+from gainy.utils import db_connect, get_logger
+
+logger = get_logger(__name__)
+
+QUERY = """
+    select i                 as id,
+           i                 as profile_id,
+           'Account ' || i   as name,
+           i::numeric        as cash_available_for_trade,
+           i::numeric        as cash_available_for_withdrawal,
+           i::numeric        as cash_balance,
+           i::numeric        as equity_value,
+           'ACC' || i        as account_no,
+           false             as is_artificial,
+           now()             as created_at,
+           now()             as updated_at
+    from generate_series(1, %(rows)s) i
+"""
+
+
+class SlottedTradingAccount(SlotsModel):
+    __slots__ = ("id", "profile_id", "name", "cash_available_for_trade",
+                 "cash_available_for_withdrawal", "cash_balance",
+                 "equity_value", "account_no", "is_artificial", "created_at",
+                 "updated_at")
+
+    key_fields = ["id"]
+
+    @classproperty
+    def schema_name(self) -> str:
+        return "app"
+
+    @classproperty
+    def table_name(self) -> str:
+        return "trading_accounts"
+
+
+def _legacy_set_from_dict(entity, row: dict):
+    for field, value in row.items():
+        if hasattr(entity, field):
+            setattr(entity, field, value)
+    return entity
+
+
+def _load_legacy(db_conn, rows: int) -> list:
+    with db_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(QUERY, {"rows": rows})
+        return [_legacy_set_from_dict(TradingAccount(), row) for row in cursor]
+
+
+def _load_set_from_dict(db_conn, rows: int) -> list:
+    with db_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(QUERY, {"rows": rows})
+        return [TradingAccount().set_from_dict(row) for row in cursor]
+
+
+def _load_hydrator(cls):
+
+    def load(db_conn, rows: int) -> list:
+        with db_conn.cursor() as cursor:
+            cursor.execute(QUERY, {"rows": rows})
+            hydrate = cls.hydrator(
+                [column.name for column in cursor.description])
+            return [hydrate(row) for row in cursor]
+
+    return load
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(
+        description='Compare model hydration methods on generated rows.')
+    parser.add_argument('--rows', dest='rows', type=int, default=1000000)
+    args = parser.parse_args(args)
+
+    methods = [
+        ("legacy set_from_dict", _load_legacy),
+        ("set_from_dict", _load_set_from_dict),
+        ("hydrator", _load_hydrator(TradingAccount)),
+        ("slots hydrator", _load_hydrator(SlottedTradingAccount)),
+    ]
+
+    with db_connect() as db_conn:
+        for name, method in methods:
+            start_time = time.time()
+            entities = method(db_conn, args.rows)
+            duration = time.time() - start_time
+            logger.info("hydrate %s: %d rows in %f",
+                        name,
+                        len(entities),
+                        duration,
+                        extra={
+                            "method": name,
+                            "rows": len(entities),
+                            "duration": duration,
+                        })
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,76 @@
+import argparse
+import time
+import uuid
+
+from gainy.data_access import repository as repository_module
+from gainy.data_access.repository import Repository
+from gainy.trading.drivewealth.models import DriveWealthInstrument, DriveWealthInstrumentStatus
+from gainy.utils import db_connect, get_logger
+
+logger = get_logger(__name__)
+
+
+def _create_instruments(count: int) -> list[DriveWealthInstrument]:
+    entities = []
+    for i in range(count):
+        ref_id = str(uuid.uuid4())
+        entity = DriveWealthInstrument()
+        entity.set_from_response({
+            "id": ref_id,
+            "symbol": f"BENCH{i}",
+            "status": DriveWealthInstrumentStatus.ACTIVE.name,
+            "name": f"Benchmark instrument {i}",
+        })
+        entities.append(entity)
+    return entities
+
+
+def _measure(repo: Repository, entities, bulk_persist_threshold) -> float:
+    repository_module.BULK_PERSIST_THRESHOLD = bulk_persist_threshold
+
+    start_time = time.time()
+    repo.persist(entities)
+    duration = time.time() - start_time
+
+    repo.rollback()
+    return duration
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare chunked execute_values persist with COPY-based bulk persist.')
+    parser.add_argument('--sizes',
+                        dest='sizes',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3)
+    args = parser.parse_args(args)
+
+    bulk_persist_threshold = repository_module.BULK_PERSIST_THRESHOLD
+    try:
+        with db_connect() as db_conn:
+            repo = Repository(db_conn)
+            for size in args.sizes:
+                for mode, threshold in [("execute_values", size + 1),
+                                        ("copy", 1)]:
+                    durations = [
+                        _measure(repo, _create_instruments(size), threshold)
+                        for _ in range(args.repeat)
+                    ]
+                    logger.info("persist %s: %d entities in %f",
+                                mode,
+                                size,
+                                min(durations),
+                                extra={
+                                    "mode": mode,
+                                    "size": size,
+                                    "durations": durations,
+                                })
+    finally:
+        repository_module.BULK_PERSIST_THRESHOLD = bulk_persist_threshold
+
+
+if __name__ == "__main__":
+    cli()
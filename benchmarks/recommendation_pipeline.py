@@ -0,0 +1,446 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+
+from gainy.recommendation import repository as recommendation_repository_module
+from gainy.recommendation.job import ENGINE_NUMPY, ENGINE_SQL, ENGINE_SQL_FEATURES, MatchScoreJob, split_in_chunks
+from gainy.recommendation.repository import RecommendationRepository, RecommendedCollectionAlgorithm
+from gainy.utils import db_connect, get_logger
+
+logger = get_logger(__name__)
+
+REPORT_VERSION = 1
+
+# Seeded rows use id ranges and a symbol prefix of their own, so that they can be told apart from the fixtures
+PROFILE_ID_OFFSET = 900_000_000
+FEATURE_ID_OFFSET = 900_000
+COLLECTION_ID_OFFSET = 900_000
+SYMBOL_PREFIX = "BENCH_"
+
+# Categories and interests picked by each profile, before duplicates are dropped
+PROFILE_FEATURES_COUNT = 3
+
+SEED_STATEMENTS = [
+    """select setseed(%(seed)s)""",
+    """insert into tickers (symbol, name, ms_enabled)
+       select %(symbol_prefix)s || i, 'Benchmark ticker ' || i, true
+       from generate_series(1, %(tickers)s) i""",
+    """insert into ticker_risk_scores (symbol, risk_score, updated_at)
+       select %(symbol_prefix)s || i, random(), now()
+       from generate_series(1, %(tickers)s) i""",
+    """insert into ticker_categories_continuous (id, category_id, symbol, sim_dif, updated_at)
+       select c || '_' || %(symbol_prefix)s || t, c, %(symbol_prefix)s || t, random() * 2 - 1, now()
+       from generate_series(1, %(tickers)s) t
+                cross join generate_series(%(feature_id_offset)s + 1, %(feature_id_offset)s + %(categories)s) c
+       where random() < %(ticker_features_density)s""",
+    """insert into ticker_interests (id, symbol, interest_id, sim_dif, updated_at)
+       select %(symbol_prefix)s || t || '_' || i, %(symbol_prefix)s || t, i, random() * 2 - 1, now()
+       from generate_series(1, %(tickers)s) t
+                cross join generate_series(%(feature_id_offset)s + 1, %(feature_id_offset)s + %(interests)s) i
+       where random() < %(ticker_features_density)s""",
+    """insert into ticker_actual_recommendation_state (symbol, state_hash)
+       select %(symbol_prefix)s || i, md5(random()::text)
+       from generate_series(1, %(tickers)s) i""",
+    """insert into app.profiles (id, email)
+       select i, 'benchmark_' || i || '@example.com'
+       from generate_series(%(profile_id_offset)s + 1, %(profile_id_offset)s + %(profiles)s) i""",
+    """insert into app.profile_scoring_settings (profile_id, created_at, risk_level, average_market_return,
+                                                 investment_horizon, unexpected_purchases_source, damage_of_failure,
+                                                 stock_market_risk_level, trading_experience,
+                                                 if_market_drops_20_i_will_buy, if_market_drops_40_i_will_buy,
+                                                 risk_score)
+       select i,
+              now(),
+              random(),
+              (array [6, 15, 25, 50])[1 + floor(random() * 4)::int],
+              random(),
+              (array ['checking_savings', 'stock_investments', 'credit_card', 'other_loans'])[1 + floor(random() * 4)::int],
+              random(),
+              (array ['very_risky', 'somewhat_risky', 'neutral', 'somewhat_safe', 'very_safe'])[1 + floor(random() * 5)::int],
+              (array ['never_tried', 'very_little', 'etfs_and_safe_stocks', 'advanced', 'daily_trader'])[1 + floor(random() * 5)::int],
+              random(),
+              random(),
+              1 + floor(random() * 3)::int
+       from generate_series(%(profile_id_offset)s + 1, %(profile_id_offset)s + %(profiles)s) i""",
+    """insert into app.profile_categories (profile_id, category_id)
+       select i, %(feature_id_offset)s + 1 + floor(random() * %(categories)s)::int
+       from generate_series(%(profile_id_offset)s + 1, %(profile_id_offset)s + %(profiles)s) i
+                cross join generate_series(1, %(profile_features_count)s)
+       on conflict do nothing""",
+    """insert into app.profile_interests (profile_id, interest_id)
+       select i, %(feature_id_offset)s + 1 + floor(random() * %(interests)s)::int
+       from generate_series(%(profile_id_offset)s + 1, %(profile_id_offset)s + %(profiles)s) i
+                cross join generate_series(1, %(profile_features_count)s)
+       on conflict do nothing""",
+    """insert into profile_actual_recommendation_state (profile_id, state_hash)
+       select i, md5(random()::text)
+       from generate_series(%(profile_id_offset)s + 1, %(profile_id_offset)s + %(profiles)s) i""",
+    """insert into collections (id, name, enabled, personalized, size)
+       select i, 'Benchmark collection ' || i, '1', '0', %(collection_size)s
+       from generate_series(%(collection_id_offset)s + 1, %(collection_id_offset)s + %(collections)s) i""",
+    """insert into collection_ticker_actual_weights (date, profile_id, collection_id, collection_uniq_id, symbol, weight)
+       select distinct on (c, t) now()::date, null::int, c, '0_' || c, %(symbol_prefix)s || t, random()
+       from (select c, 1 + floor(random() * %(tickers)s)::int as t
+             from generate_series(%(collection_id_offset)s + 1, %(collection_id_offset)s + %(collections)s) c
+                      cross join generate_series(1, %(collection_size)s)) pairs""",
+]
+
+SEEDED_TABLES = [
+    "tickers", "ticker_risk_scores", "ticker_categories_continuous",
+    "ticker_interests", "ticker_actual_recommendation_state", "app.profiles",
+    "app.profile_scoring_settings", "app.profile_categories",
+    "app.profile_interests", "profile_actual_recommendation_state",
+    "collections", "collection_ticker_actual_weights"
+]
+
+# Seeded rows and everything computed from them
+CLEANUP_STATEMENTS = [
+    """delete from app.profile_ticker_match_score
+       where profile_id between %(profile_id_min)s and %(profile_id_max)s
+          or starts_with(symbol, %(symbol_prefix)s)""",
+    """delete from app.profile_collection_match_score
+       where profile_id between %(profile_id_min)s and %(profile_id_max)s
+          or collection_id between %(collection_id_min)s and %(collection_id_max)s""",
+    """delete from app.personalized_ticker_collections
+       where profile_id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from app.personalized_collection_sizes
+       where profile_id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from app.profile_recommendations_metadata
+       where profile_id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from app.object_recommendation_state
+       where (object_type = 'profile' and object_id ~ '^[0-9]+$'
+                  and object_id::bigint between %(profile_id_min)s and %(profile_id_max)s)
+          or (object_type = 'ticker' and starts_with(object_id, %(symbol_prefix)s))
+          or (object_type = 'collection' and object_id ~ '^0_[0-9]+$'
+                  and substr(object_id, 3)::bigint between %(collection_id_min)s and %(collection_id_max)s)""",
+    """delete from app.ticker_match_score_features where starts_with(symbol, %(symbol_prefix)s)""",
+    """delete from collection_ticker_actual_weights
+       where collection_id between %(collection_id_min)s and %(collection_id_max)s""",
+    """delete from collections where id between %(collection_id_min)s and %(collection_id_max)s""",
+    """delete from profile_actual_recommendation_state
+       where profile_id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from app.profile_interests where profile_id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from app.profile_categories where profile_id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from app.profile_scoring_settings
+       where profile_id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from app.profiles where id between %(profile_id_min)s and %(profile_id_max)s""",
+    """delete from ticker_actual_recommendation_state where starts_with(symbol, %(symbol_prefix)s)""",
+    """delete from ticker_interests where starts_with(symbol, %(symbol_prefix)s)""",
+    """delete from ticker_categories_continuous where starts_with(symbol, %(symbol_prefix)s)""",
+    """delete from ticker_risk_scores where starts_with(symbol, %(symbol_prefix)s)""",
+    """delete from tickers where starts_with(symbol, %(symbol_prefix)s)""",
+]
+
+# Forgets the computed states of the seeded objects, so that every MatchScoreJob run recomputes all of them
+RESET_STATE_STATEMENT = """delete from app.object_recommendation_state
+    where (object_type = 'profile' and object_id ~ '^[0-9]+$'
+               and object_id::bigint between %(profile_id_min)s and %(profile_id_max)s)
+       or (object_type = 'ticker' and starts_with(object_id, %(symbol_prefix)s))"""
+
+# Seeded ids are removed by range, whatever scale they were seeded at
+CLEANUP_PARAMS = {
+    "profile_id_min": PROFILE_ID_OFFSET + 1,
+    "profile_id_max": PROFILE_ID_OFFSET + 99_999_999,
+    "collection_id_min": COLLECTION_ID_OFFSET + 1,
+    "collection_id_max": COLLECTION_ID_OFFSET + 99_999,
+    "symbol_prefix": SYMBOL_PREFIX,
+}
+
+
+def _execute(repo: RecommendationRepository, statements: List[str],
+             params: dict):
+    with repo.db_conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement, params)
+
+
+def _seed(repo: RecommendationRepository, args) -> float:
+    start_time = time.perf_counter()
+    _execute(repo, CLEANUP_STATEMENTS, CLEANUP_PARAMS)
+    _execute(
+        repo, SEED_STATEMENTS, {
+            "seed": args.seed,
+            "profiles": args.profiles,
+            "tickers": args.tickers,
+            "categories": args.categories,
+            "interests": args.interests,
+            "collections": args.collections,
+            "collection_size": args.collection_size,
+            "ticker_features_density": args.ticker_features_density,
+            "profile_features_count": PROFILE_FEATURES_COUNT,
+            "profile_id_offset": PROFILE_ID_OFFSET,
+            "feature_id_offset": FEATURE_ID_OFFSET,
+            "collection_id_offset": COLLECTION_ID_OFFSET,
+            "symbol_prefix": SYMBOL_PREFIX,
+        })
+    with repo.db_conn.cursor() as cursor:
+        for table_name in SEEDED_TABLES:
+            cursor.execute(f"analyze {table_name}")
+    repo.commit()
+    return time.perf_counter() - start_time
+
+
+def _summarize(durations: List[float], items_count: int = None) -> dict:
+    durations = sorted(durations)
+    total = sum(durations)
+    summary = {
+        "count": len(durations),
+        "total": total,
+        "min": durations[0],
+        "median": durations[len(durations) // 2],
+        "p95": durations[int(len(durations) * 0.95)],
+        "max": durations[-1],
+    }
+    if items_count is not None:
+        summary["items"] = items_count
+        summary["throughput"] = items_count / total if total else None
+    return summary
+
+
+def _measure_batches(repo: RecommendationRepository, func: Callable,
+                     batches: List[List[int]]) -> dict:
+    """
+    Rolls back after every batch, so that all batches start from the same data.
+    """
+    durations = []
+    for profile_ids in batches:
+        start_time = time.perf_counter()
+        func(profile_ids)
+        durations.append(time.perf_counter() - start_time)
+        repo.rollback()
+    return _summarize(durations, sum(map(len, batches)))
+
+
+def _measure_match_score_job(repo: RecommendationRepository, args) -> dict:
+    durations = []
+    for _ in range(args.repeat):
+        _execute(repo, [RESET_STATE_STATEMENT], CLEANUP_PARAMS)
+        repo.commit()
+
+        job = MatchScoreJob(repo,
+                            args.batch_size,
+                            args.engine,
+                            workers=args.workers)
+        start_time = time.perf_counter()
+        job.run()
+        repo.commit()
+        durations.append(time.perf_counter() - start_time)
+
+    profiles_count = sum(
+        map(len, repo.read_ms_batch_profile_ids(args.batch_size)))
+    repo.rollback()
+    return _summarize(durations, profiles_count * args.repeat)
+
+
+def _measure_recommended_collections(repo: RecommendationRepository,
+                                     profile_ids: List[int],
+                                     limit: int) -> Dict[str, dict]:
+    """
+    Algorithms that fail, e.g. because their source tables are missing from the database, are reported with
+    the error instead of the timings.
+    """
+    results = {}
+    for algorithm in RecommendedCollectionAlgorithm:
+        name = f"get_recommended_collections.{algorithm.name.lower()}"
+        try:
+            # warm up the plans and the prepared statements
+            repo.get_recommended_collections(profile_ids[0], limit, algorithm)
+
+            durations = []
+            for profile_id in profile_ids:
+                start_time = time.perf_counter()
+                repo.get_recommended_collections(profile_id, limit, algorithm)
+                durations.append(time.perf_counter() - start_time)
+            results[name] = _summarize(durations, len(profile_ids))
+        except Exception as e:
+            logger.exception(e, extra={"algorithm": algorithm.name})
+            results[name] = {"error": str(e)}
+        finally:
+            repo.rollback()
+
+    return results
+
+
+def _get_environment(repo: RecommendationRepository) -> dict:
+    with repo.db_conn.cursor() as cursor:
+        cursor.execute("show server_version")
+        server_version, = cursor.fetchone()
+    repo.rollback()
+
+    return {
+        "python":
+        platform.python_version(),
+        "postgres":
+        server_version,
+        "collection_ranking_top_k_pruning":
+        recommendation_repository_module.COLLECTION_RANKING_TOP_K_PRUNING,
+    }
+
+
+def _find_regressions(report: dict, baseline: dict,
+                      max_regression: float) -> List[str]:
+    if baseline.get("parameters") != report["parameters"]:
+        raise ValueError(
+            "The baseline report was made with different parameters: %s" %
+            json.dumps(baseline.get("parameters")))
+
+    regressions = []
+    for name, result in report["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if "median" not in result or not baseline_result or "median" not in baseline_result:
+            continue
+
+        if result["median"] > baseline_result["median"] * (1 + max_regression):
+            regressions.append(
+                "%s: median %f, baseline %f" %
+                (name, result["median"], baseline_result["median"]))
+    return regressions
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(
+        description=
+        'Seed synthetic profiles, tickers and collections and measure the recommendation pipeline. '
+        'Seeded rows are committed and removed at the end unless --keep is passed.'
+    )
+    parser.add_argument('--profiles', dest='profiles', type=int, default=1000)
+    parser.add_argument('--tickers', dest='tickers', type=int, default=500)
+    parser.add_argument('--categories',
+                        dest='categories',
+                        type=int,
+                        default=20)
+    parser.add_argument('--interests', dest='interests', type=int, default=50)
+    parser.add_argument('--collections',
+                        dest='collections',
+                        type=int,
+                        default=100)
+    parser.add_argument('--collection-size',
+                        dest='collection_size',
+                        type=int,
+                        default=20)
+    parser.add_argument(
+        '--ticker-features-density',
+        dest='ticker_features_density',
+        type=float,
+        default=0.2,
+        help=
+        'Share of (ticker, category) and (ticker, interest) pairs with a sim_dif'
+    )
+    parser.add_argument('--seed', dest='seed', type=float, default=0.42)
+    parser.add_argument('--batch-size',
+                        dest='batch_size',
+                        type=int,
+                        default=100)
+    parser.add_argument(
+        '--batches',
+        dest='batches',
+        type=int,
+        default=10,
+        help='Number of profile batches generate_*_match_scores are timed on')
+    parser.add_argument(
+        '--engine',
+        dest='engine',
+        choices=[ENGINE_SQL, ENGINE_SQL_FEATURES, ENGINE_NUMPY],
+        default=ENGINE_SQL)
+    parser.add_argument('--workers', dest='workers', type=int, default=1)
+    parser.add_argument('--repeat',
+                        dest='repeat',
+                        type=int,
+                        default=1,
+                        help='Number of MatchScoreJob runs')
+    parser.add_argument(
+        '--requests',
+        dest='requests',
+        type=int,
+        default=100,
+        help='Number of profiles get_recommended_collections is timed on')
+    parser.add_argument('--limit', dest='limit', type=int, default=10)
+    parser.add_argument('--output',
+                        dest='output',
+                        default='-',
+                        help='Path of the JSON report, stdout by default')
+    parser.add_argument('--baseline',
+                        dest='baseline',
+                        help='JSON report of a previous run to compare with')
+    parser.add_argument(
+        '--max-regression',
+        dest='max_regression',
+        type=float,
+        default=0.2,
+        help=
+        'Relative increase of a median over the baseline that fails the run')
+    parser.add_argument('--keep', dest='keep', action='store_true')
+    args = parser.parse_args(args)
+
+    parameters = {
+        name: getattr(args, name)
+        for name in [
+            "profiles", "tickers", "categories", "interests", "collections",
+            "collection_size", "ticker_features_density", "seed", "batch_size",
+            "batches", "engine", "workers", "requests", "limit"
+        ]
+    }
+
+    with db_connect() as db_conn:
+        repo = RecommendationRepository(db_conn)
+        try:
+            seed_duration = _seed(repo, args)
+            logger.info("Seeded in %f", seed_duration, extra=parameters)
+
+            profile_ids = list(
+                range(PROFILE_ID_OFFSET + 1,
+                      PROFILE_ID_OFFSET + args.profiles + 1))
+            batches = list(split_in_chunks(profile_ids,
+                                           args.batch_size))[:args.batches]
+
+            results = {
+                "match_score_job":
+                _measure_match_score_job(repo, args),
+                "generate_ticker_match_scores":
+                _measure_batches(repo, repo.generate_ticker_match_scores,
+                                 batches),
+                "generate_collection_match_scores":
+                _measure_batches(repo, repo.generate_collection_match_scores,
+                                 batches),
+            }
+            results.update(
+                _measure_recommended_collections(repo,
+                                                 profile_ids[:args.requests],
+                                                 args.limit))
+        finally:
+            repo.rollback()
+            if not args.keep:
+                _execute(repo, CLEANUP_STATEMENTS, CLEANUP_PARAMS)
+                repo.commit()
+
+        report = {
+            "version": REPORT_VERSION,
+            "parameters": parameters,
+            "environment": _get_environment(repo),
+            "seed_duration": seed_duration,
+            "results": results,
+        }
+
+    report_json = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(report_json)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report_json)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = _find_regressions(report, baseline, args.max_regression)
+        if regressions:
+            logger.error("Performance regressions: %s",
+                         "; ".join(regressions),
+                         extra={"regressions": regressions})
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
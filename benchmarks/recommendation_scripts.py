@@ -0,0 +1,95 @@
+import argparse
+import os
+import time
+
+from psycopg2 import sql
+
+from gainy.recommendation import repository as recommendation_repository_module
+from gainy.recommendation.repository import RecommendationRepository
+from gainy.utils import db_connect, get_logger
+
+logger = get_logger(__name__)
+
+MATCH_SCORE_SCRIPTS = [
+    ('generate_ticker_match_scores.sql',
+     recommendation_repository_module.ALL_TICKERS),
+    ('cleanup_ticker_match_scores.sql', None),
+    ('generate_collection_match_scores.sql',
+     recommendation_repository_module.ALL_COLLECTIONS),
+    ('cleanup_collection_match_scores.sql', None),
+]
+
+
+def _recompute_from_files(repo: RecommendationRepository, profile_id: int):
+    """
+    Per-call file reads, composition and unprepared execution, as done before the scripts were cached.
+    """
+    params = {"profile_ids": [profile_id]}
+    with repo.db_conn.cursor() as cursor:
+        for filename, variant in MATCH_SCORE_SCRIPTS:
+            with open(
+                    os.path.join(recommendation_repository_module.script_dir,
+                                 "sql", filename)) as f:
+                template = f.read()
+
+            substitutions = recommendation_repository_module._SCRIPT_SUBSTITUTIONS[
+                filename][variant]
+            query = sql.SQL(template).format(
+                **{
+                    placeholder: sql.SQL(value)
+                    for placeholder, value in substitutions.items()
+                })
+            cursor.execute(query, params)
+
+
+def _recompute_prepared(repo: RecommendationRepository, profile_id: int):
+    repo._generate_match_scores(MATCH_SCORE_SCRIPTS, [profile_id])
+
+
+def _measure(repo: RecommendationRepository, func, profile_ids,
+             repeat: int) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        for profile_id in profile_ids:
+            start_time = time.perf_counter()
+            func(repo, profile_id)
+            durations.append(time.perf_counter() - start_time)
+            repo.rollback()
+    return sorted(durations)
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare per-profile match score recompute latency with scripts read from disk and with cached prepared scripts.'
+    )
+    parser.add_argument('--profile-ids',
+                        dest='profile_ids',
+                        type=int,
+                        nargs='+',
+                        default=[1])
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20)
+    args = parser.parse_args(args)
+
+    with db_connect() as db_conn:
+        repo = RecommendationRepository(db_conn)
+        for mode, func in [("from_files", _recompute_from_files),
+                           ("prepared", _recompute_prepared)]:
+            # warm up the plan and the prepared statements
+            _measure(repo, func, args.profile_ids, 1)
+
+            durations = _measure(repo, func, args.profile_ids, args.repeat)
+            median = durations[len(durations) // 2]
+            logger.info("recompute %s: median %f, p95 %f",
+                        mode,
+                        median,
+                        durations[int(len(durations) * 0.95)],
+                        extra={
+                            "mode": mode,
+                            "median": median,
+                            "durations": durations,
+                        })
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,85 @@
+import argparse
+import time
+
+from gainy.recommendation import TOP_20_FOR_YOU_COLLECTION_ID
+from gainy.recommendation.repository import RecommendationRepository
+from gainy.utils import db_connect, get_logger
+
+logger = get_logger(__name__)
+
+TOP_TICKERS_COUNT = 20
+
+
+def _update_per_profile(repo: RecommendationRepository, profile_ids):
+    """
+    One read and up to four writes per profile, as done before the refresh was set-based.
+    """
+    for profile_id in profile_ids:
+        top_tickers = repo.read_top_match_score_tickers(
+            profile_id, TOP_TICKERS_COUNT)
+        repo.update_personalized_collection(profile_id,
+                                            TOP_20_FOR_YOU_COLLECTION_ID,
+                                            top_tickers)
+
+
+def _update_set_based(repo: RecommendationRepository, profile_ids):
+    repo.update_top_collection_tickers(profile_ids,
+                                       TOP_20_FOR_YOU_COLLECTION_ID,
+                                       TOP_TICKERS_COUNT)
+
+
+def _measure(repo: RecommendationRepository, func, batches,
+             repeat: int) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        for profile_ids in batches:
+            start_time = time.perf_counter()
+            func(repo, profile_ids)
+            durations.append(time.perf_counter() - start_time)
+            repo.rollback()
+    return sorted(durations)
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare per-batch latency of the Top-20 personalized collection refresh done per profile and set-based.'
+    )
+    parser.add_argument('--batch_size',
+                        dest='batch_size',
+                        type=int,
+                        default=15)
+    parser.add_argument('--batches', dest='batches', type=int, default=10)
+    parser.add_argument('--repeat', dest='repeat', type=int, default=5)
+    args = parser.parse_args(args)
+
+    with db_connect() as db_conn:
+        repo = RecommendationRepository(db_conn)
+        batches = []
+        for profile_ids in repo.read_ms_batch_profile_ids(args.batch_size):
+            batches.append(profile_ids)
+            if len(batches) >= args.batches:
+                break
+        repo.rollback()
+
+        for mode, func in [("per_profile", _update_per_profile),
+                           ("set_based", _update_set_based)]:
+            # warm up the plans and the prepared statements
+            _measure(repo, func, batches, 1)
+
+            durations = _measure(repo, func, batches, args.repeat)
+            median = durations[len(durations) // 2]
+            logger.info("top 20 refresh %s: median %f, p95 %f per batch",
+                        mode,
+                        median,
+                        durations[int(len(durations) * 0.95)],
+                        extra={
+                            "mode": mode,
+                            "batch_size": args.batch_size,
+                            "median": median,
+                            "durations": durations,
+                        })
+
+
+if __name__ == "__main__":
+    cli()
@@ -385,3 +385,15 @@ create table app.object_recommendation_state
     updated_at  timestamp default now(),
     primary key (object_id, object_type)
 );
+
+create table app.ticker_match_score_features
+(
+    symbol            text primary key,
+    state_hash        text,
+    risk_score        double precision,
+    category_ids      int[]              not null default '{}',
+    category_sim_difs double precision[] not null default '{}',
+    interest_ids      int[]              not null default '{}',
+    interest_sim_difs double precision[] not null default '{}',
+    updated_at        timestamp default now()
+);
@@ -1,4 +1,5 @@
 from gainy.context_container import ContextContainer
+from gainy.data_access.db_lock import lock_wait_stats
 from gainy.utils import get_logger
 
 logger = get_logger(__name__)
@@ -12,3 +13,5 @@ def cli():
     except Exception as e:
         logger.exception(e)
         raise e
+    finally:
+        lock_wait_stats.log_report()
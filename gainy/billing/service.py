@@ -1,3 +1,7 @@
+from itertools import islice
+
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+
 from gainy.analytics.service import AnalyticsService
 from gainy.billing.exceptions import PaymentProviderNotSupportedException, InvoiceSealedException
 from gainy.billing.interfaces import BillingServiceInterface
@@ -5,12 +9,15 @@ from gainy.billing.locking_functions import ChargeInvoice
 from gainy.billing.models import Invoice, PaymentMethod, InvoiceStatus
 from gainy.billing.provider import AbstractPaymentProvider
 from gainy.billing.repository import BillingRepository
-from gainy.data_access.db_lock import LockAcquisitionTimeout
+from gainy.data_access.db_lock import LockAcquisitionTimeout, DatabaseLock, ResourceType
 from gainy.trading.exceptions import InsufficientFundsException
 from gainy.utils import get_logger
 
 logger = get_logger(__name__)
 
+# Number of unpaid invoices claimed with a single advisory lock statement
+CHARGE_INVOICES_PAGE_SIZE = 100
+
 
 class BillingService(BillingServiceInterface):
 
@@ -25,12 +32,37 @@ class BillingService(BillingServiceInterface):
         self.repo.create_invoices()
 
     def charge_invoices(self):
-        for invoice in self.repo.iterate_unpaid_invoices_due():
-            func = ChargeInvoice(self.repo, self, invoice)
-            try:
-                func.execute()
-            except LockAcquisitionTimeout as e:
-                logger.exception(e)
+        invoices = iter(self.repo.iterate_unpaid_invoices_due())
+        while True:
+            page = list(islice(invoices, CHARGE_INVOICES_PAGE_SIZE))
+            if not page:
+                break
+            self._charge_invoices_page(page)
+
+    def _charge_invoices_page(self, invoices: list[Invoice]):
+        # Claim the whole page in one round trip. The claim is session-scoped, as charge commits after
+        # each invoice; ChargeInvoice re-acquires the same advisory lock, which is re-entrant within a session.
+        db_lock = DatabaseLock(self.repo.db_conn, ResourceType.INVOICE)
+        claimed_ids = db_lock.try_lock_many(invoice.id for invoice in invoices)
+        try:
+            for invoice in invoices:
+                if (invoice.id or -1) not in claimed_ids:
+                    logger.info(
+                        "Invoice %s is being charged by another worker",
+                        invoice.id)
+                    continue
+
+                func = ChargeInvoice(self.repo, self, invoice)
+                try:
+                    func.execute()
+                except LockAcquisitionTimeout as e:
+                    logger.exception(e)
+        finally:
+            # the claim survives a rollback, but can not be released in an aborted transaction
+            if self.repo.db_conn.get_transaction_status(
+            ) == TRANSACTION_STATUS_INERROR:
+                self.repo.rollback()
+            db_lock.unlock_many(claimed_ids)
 
     def charge(self, invoice: Invoice):
         try:
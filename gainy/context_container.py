@@ -1,7 +1,8 @@
+import weakref
 from contextlib import AbstractContextManager
 
 from psycopg2._psycopg import connection
-from functools import cached_property, cache
+from functools import cached_property
 
 from gainy.analytics.amplitude.service import AmplitudeService
 from gainy.analytics.appsflyer import AppsflyerService
@@ -16,6 +17,7 @@ from gainy.billing.service import BillingService
 from gainy.billing.stripe.api import StripeApi
 from gainy.billing.stripe.provider import StripePaymentProvider
 from gainy.billing.stripe.repository import StripeRepository
+from gainy.data_access.connection_pool import ConnectionPool, get_connection_pool
 from gainy.data_access.repository import Repository
 from gainy.optimization.collection.repository import CollectionOptimizerRepository
 from gainy.plaid.service import PlaidService
@@ -31,29 +33,49 @@ from gainy.trading.service import TradingService
 from gainy.trading.repository import TradingRepository
 from gainy.trading.drivewealth.provider.provider import DriveWealthProvider
 from gainy.trading.drivewealth import DriveWealthRepository, DriveWealthApi
-from gainy.utils import db_connect
 
 
 class ContextContainer(AbstractContextManager):
     _db_conn = None
+    _connection_pool = None
+
+    def __init__(self, connection_pool: ConnectionPool = None):
+        self._connection_pool = connection_pool
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self._db_conn:
-            self._db_conn.commit()
-            self._db_conn.close()
+            self._release_db_conn.detach()
+            try:
+                self._db_conn.commit()
+            finally:
+                self.connection_pool.putconn(self._db_conn)
+                self._db_conn = None
+
+    @property
+    def connection_pool(self) -> ConnectionPool:
+        if not self._connection_pool:
+            self._connection_pool = get_connection_pool()
+
+        return self._connection_pool
 
     @property
     def db_conn(self) -> connection:
         if not self._db_conn:
-            self._db_conn = db_connect()
+            self._db_conn = self.connection_pool.getconn()
+            # a container dropped without being exited closes its connection instead of holding the pool slot
+            self._release_db_conn = weakref.finalize(
+                self, self.connection_pool.putconn, self._db_conn, True)
 
         return self._db_conn
 
-    @cache
     def get_repository(self, cls=None):
         if cls:
             raise Exception('get_repository for a class is not supported')
 
+        return self._repository
+
+    @cached_property
+    def _repository(self) -> Repository:
         return Repository(self.db_conn)
 
     @cached_property
@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Iterator
+
+from psycopg2._psycopg import connection
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+
+from gainy.data_access.prepared_statements import forget_prepared_statements
+from gainy.utils import db_connect, get_logger
+
+logger = get_logger(__name__)
+
+# Number of connections kept open for reuse
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 4))
+# Number of extra connections opened when all pooled connections are in use, closed once returned.
+# Negative for no limit, so that an exhausted pool opens new connections like db_connect does.
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", -1))
+# Connections older than this are closed instead of being reused, in seconds
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 1800))
+# Connections idle for longer than this are pinged before being handed out, in seconds
+DB_POOL_HEALTH_CHECK_INTERVAL = float(
+    os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+# How long getconn waits for a connection to be returned when the pool is exhausted, in seconds
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+# Executed on connections returned to the pool: drops temp tables, session advisory locks, prepared statements
+# and session settings.
+# search_path is passed as a connection option, so it survives the reset and is set once per connection.
+RESET_QUERY = "DISCARD ALL"
+
+
+class _PooledConnection:
+
+    def __init__(self, conn: connection, overflow: bool = False):
+        self.conn = conn
+        # opened beyond max_size, closed instead of being returned to the pool
+        self.overflow = overflow
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Connections are checked for liveness before being handed out if they have been idle for longer than
+    `health_check_interval`, closed once they are older than `max_lifetime` and reset with `RESET_QUERY`
+    when returned.
+
+    Up to `max_size` connections are pooled. Once all of them are in use, up to `max_overflow` more are opened
+    and closed when returned, getconn only waits for a connection if `max_overflow` is reached.
+    """
+
+    def __init__(self,
+                 connect: Callable[[], connection] = db_connect,
+                 max_size: int = DB_POOL_MAX_SIZE,
+                 max_overflow: int = DB_POOL_MAX_OVERFLOW,
+                 max_lifetime: float = DB_POOL_MAX_LIFETIME,
+                 health_check_interval: float = DB_POOL_HEALTH_CHECK_INTERVAL,
+                 timeout: float = DB_POOL_TIMEOUT):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_overflow = max_overflow
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        self._condition = threading.Condition()
+        self._idle: List[_PooledConnection] = []
+        self._used: Dict[int, _PooledConnection] = {}
+        self._connecting = 0
+
+    def getconn(self) -> connection:
+        """
+        :raises PoolError: if no connection is returned to a pool with no overflow left within `timeout`
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                while self._idle:
+                    pooled = self._idle.pop()
+                    if self._is_usable(pooled):
+                        self._used[id(pooled.conn)] = pooled
+                        return pooled.conn
+                    self._close(pooled)
+
+                opened = len(self._used) + self._connecting
+                if opened < self.max_size:
+                    overflow = False
+                    break
+                if self.max_overflow < 0 or opened < self.max_size + self.max_overflow:
+                    overflow = True
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError("connection pool exhausted")
+                self._condition.wait(remaining)
+
+            # the slot is reserved while connecting outside of the lock
+            self._connecting += 1
+
+        try:
+            pooled = _PooledConnection(self._connect(), overflow)
+        except Exception:
+            with self._condition:
+                self._connecting -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._connecting -= 1
+            self._used[id(pooled.conn)] = pooled
+        return pooled.conn
+
+    def putconn(self, conn: connection, close: bool = False):
+        with self._condition:
+            pooled = self._used.get(id(conn))
+        if pooled is None:
+            raise PoolError("trying to put unkeyed connection")
+
+        # the connection keeps its slot until it is reset, so the pool never exceeds max_size + max_overflow
+        reusable = not close and not pooled.overflow and self._reset(
+            pooled) and not self._is_expired(pooled)
+        if not reusable:
+            self._close(pooled)
+        pooled.released_at = time.monotonic()
+
+        with self._condition:
+            del self._used[id(conn)]
+            if reusable:
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    def closeall(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close(pooled)
+
+    @contextmanager
+    def connection(self) -> Iterator[connection]:
+        """
+        Checks out a connection, commits on success and rolls back on error before returning it to the pool.
+        """
+        conn = self.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.putconn(conn)
+
+    def _is_expired(self, pooled: _PooledConnection) -> bool:
+        return time.monotonic() - pooled.created_at > self.max_lifetime
+
+    def _is_usable(self, pooled: _PooledConnection) -> bool:
+        if pooled.conn.closed or self._is_expired(pooled):
+            return False
+
+        if time.monotonic() - pooled.released_at <= self.health_check_interval:
+            return True
+
+        try:
+            with pooled.conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            pooled.conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning("Discarding broken pooled connection: %s", e)
+            return False
+
+    @staticmethod
+    def _reset(pooled: _PooledConnection) -> bool:
+        conn = pooled.conn
+        if conn.closed:
+            return False
+
+        try:
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+
+            autocommit = conn.autocommit
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(RESET_QUERY)
+                forget_prepared_statements(conn)
+            finally:
+                conn.autocommit = autocommit
+            return True
+        except Exception as e:
+            logger.warning("Failed to reset pooled connection: %s", e)
+            return False
+
+    @staticmethod
+    def _close(pooled: _PooledConnection):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool, so that warm Lambda / ECS workers reuse connections
+    across handled messages.
+    """
+    global _connection_pool
+
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ConnectionPool()
+
+        return _connection_pool
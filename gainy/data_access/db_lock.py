@@ -1,12 +1,18 @@
 import enum
+import threading
+import time
 from contextlib import AbstractContextManager
+from typing import Iterable, List, Set
 
 import logging
 
-import backoff
-from backoff import full_jitter
+import psycopg2.errors
 from psycopg2._psycopg import connection
 
+from gainy.utils import get_logger
+
+logger = get_logger(__name__)
+
 
 class ResourceType(enum.Enum):
     GENERAL = 0
@@ -27,32 +33,151 @@ class LockAcquisitionTimeout(Exception):
 
 
 class DatabaseLock:
+    """
+    Advisory locks on (resource_type, resource_id).
+
+    Session-level locks are held until unlocked or until the connection is closed or returned to the pool.
+    Transaction-scoped locks (`xact=True`) are released on commit or rollback, so they can not leak,
+    but the locked code must not commit before it is done.
+    """
 
     def __init__(self, db_conn: connection, resource_type: ResourceType):
         self.db_conn = db_conn
         self.resource_type = resource_type
 
-    def try_lock(self, resource_id: int) -> bool:
+    def try_lock(self, resource_id: int, xact: bool = False) -> bool:
+        function = "pg_try_advisory_xact_lock" if xact else "pg_try_advisory_lock"
         with self.db_conn.cursor() as cursor:
             cursor.execute(
-                "SELECT pg_try_advisory_lock(%(resource_type)s, %(resource_id)s)",
-                {
+                f"SELECT {function}(%(resource_type)s, %(resource_id)s)", {
                     "resource_type": self.resource_type.value,
                     "resource_id": resource_id or -1
                 })
             return cursor.fetchone()[0]
 
-    def lock(self, resource_id: int, await_sec: float = 1):
-        backoff_on_predicate = backoff.on_predicate(
-            lambda: backoff.expo(base=2, factor=0.01),
-            max_time=await_sec,
-            giveup_log_level=logging.WARNING,
-            jitter=lambda w: w / 2 + full_jitter(w / 2))
-        is_locked = backoff_on_predicate(lambda: self.try_lock(resource_id))()
+    def lock(self, resource_id: int, await_sec: float = 1, xact: bool = False):
+        """
+        Waits in `pg_advisory_lock` for at most `await_sec`, so that the waiter wakes up as soon as the lock
+        is released. The wait is bounded by a transaction-local `lock_timeout` set inside a savepoint,
+        so a timeout does not abort the caller's transaction.
+
+        :raises LockAcquisitionTimeout:
+        """
+        function = "pg_advisory_xact_lock" if xact else "pg_advisory_lock"
+        statement = f"SELECT {function}(%(resource_type)s, %(resource_id)s)"
+        params = {
+            "resource_type": self.resource_type.value,
+            "resource_id": resource_id or -1
+        }
+
+        start_time = time.monotonic()
+        is_locked = False
+        try:
+            if await_sec > 0:
+                is_locked = self._wait_lock(statement, params, await_sec, xact)
+            else:
+                # lock_timeout = 0 disables the timeout
+                is_locked = self.try_lock(resource_id, xact)
+        finally:
+            lock_wait_stats.record(self.resource_type,
+                                   time.monotonic() - start_time, is_locked)
 
         if not is_locked:
             raise LockAcquisitionTimeout(self.resource_type, resource_id)
 
+    def try_lock_many(self,
+                      resource_ids: Iterable[int],
+                      xact: bool = False) -> Set[int]:
+        """
+        Tries to lock all `resource_ids` in one statement, in ascending order.
+
+        :return: ids of the locked resources, the rest are locked by other sessions
+        """
+        resource_ids = _normalize_resource_ids(resource_ids)
+        if not resource_ids:
+            return set()
+
+        function = "pg_try_advisory_xact_lock" if xact else "pg_try_advisory_lock"
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                f"""SELECT resource_id, {function}(%(resource_type)s, resource_id)
+                    FROM unnest(%(resource_ids)s::int[]) WITH ORDINALITY AS t (resource_id, ord)
+                    ORDER BY ord""", {
+                    "resource_type": self.resource_type.value,
+                    "resource_ids": resource_ids
+                })
+            return {
+                resource_id
+                for resource_id, is_locked in cursor.fetchall() if is_locked
+            }
+
+    def lock_many(self, resource_ids: Iterable[int], await_sec: float = 1):
+        """
+        Locks all `resource_ids` for the current transaction in one statement. The locks are taken in ascending
+        order, so that concurrent callers locking overlapping sets can not deadlock. Either all resources
+        are locked or none.
+
+        :raises LockAcquisitionTimeout:
+        """
+        resource_ids = _normalize_resource_ids(resource_ids)
+        if not resource_ids:
+            return
+
+        statement = """SELECT pg_advisory_xact_lock(%(resource_type)s, resource_id)
+                       FROM unnest(%(resource_ids)s::int[]) WITH ORDINALITY AS t (resource_id, ord)
+                       ORDER BY ord"""
+        params = {
+            "resource_type": self.resource_type.value,
+            "resource_ids": resource_ids
+        }
+
+        start_time = time.monotonic()
+        is_locked = False
+        try:
+            is_locked = self._wait_lock(statement, params, await_sec, True)
+        finally:
+            lock_wait_stats.record(self.resource_type,
+                                   time.monotonic() - start_time, is_locked)
+
+        if not is_locked:
+            raise LockAcquisitionTimeout(self.resource_type, resource_ids[0])
+
+    def _wait_lock(self, statement: str, params: dict, await_sec: float,
+                   xact: bool) -> bool:
+        if self.db_conn.autocommit:
+            if xact:
+                raise Exception(
+                    "Transaction-scoped locks require a transaction")
+            begin, release, rollback = "BEGIN", "COMMIT", "ROLLBACK"
+        else:
+            begin = "SAVEPOINT db_lock"
+            release = "RELEASE SAVEPOINT db_lock"
+            rollback = "ROLLBACK TO SAVEPOINT db_lock; RELEASE SAVEPOINT db_lock"
+
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(begin)
+            try:
+                cursor.execute(
+                    "SELECT current_setting('lock_timeout'), set_config('lock_timeout', %(lock_timeout)s, true)",
+                    {"lock_timeout": f"{max(1, round(await_sec * 1000))}ms"})
+                prev_lock_timeout = cursor.fetchone()[0]
+                cursor.execute(statement, params)
+            except psycopg2.errors.LockNotAvailable:
+                cursor.execute(rollback)
+                return False
+            except Exception:
+                cursor.execute(rollback)
+                raise
+
+            # rolling back the savepoint would release transaction-scoped locks taken in it
+            cursor.execute(release)
+            if not self.db_conn.autocommit:
+                cursor.execute(
+                    "SELECT set_config('lock_timeout', %(lock_timeout)s, true)",
+                    {"lock_timeout": prev_lock_timeout})
+
+        return True
+
     def unlock(self, resource_id: int):
         with self.db_conn.cursor() as cursor:
             cursor.execute(
@@ -62,28 +187,106 @@ class DatabaseLock:
                     "resource_id": resource_id or -1
                 })
 
+    def unlock_many(self, resource_ids: Iterable[int]):
+        resource_ids = _normalize_resource_ids(resource_ids)
+        if not resource_ids:
+            return
+
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_unlock(%(resource_type)s, resource_id) FROM unnest(%(resource_ids)s::int[]) AS resource_id",
+                {
+                    "resource_type": self.resource_type.value,
+                    "resource_ids": resource_ids
+                })
+
+
+def _normalize_resource_ids(resource_ids: Iterable[int]) -> List[int]:
+    return sorted(set(resource_id or -1 for resource_id in resource_ids))
+
 
 class DatabaseLockContext(AbstractContextManager):
 
-    def __init__(self, db_conn: connection, resource_type: ResourceType,
-                 resource_id: int, await_sec: float):
+    def __init__(self,
+                 db_conn: connection,
+                 resource_type: ResourceType,
+                 resource_id: int,
+                 await_sec: float,
+                 xact: bool = False):
         self.db_lock = DatabaseLock(db_conn, resource_type)
         self.resource_id = resource_id
         self.await_sec = await_sec
+        self.xact = xact
 
     def __enter__(self):
         try:
-            self.db_lock.lock(self.resource_id, self.await_sec)
+            self.db_lock.lock(self.resource_id, self.await_sec, self.xact)
         except LockAcquisitionTimeout as lat:
             logging.info(lat)
             raise lat
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.db_lock.unlock(self.resource_id)
+        # transaction-scoped locks are released with the transaction
+        if not self.xact:
+            self.db_lock.unlock(self.resource_id)
         if exc_value:
             raise exc_value
 
 
+class LockWaitStats:
+    """
+    Lock acquisition wait times per resource type.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, resource_type: ResourceType, wait_duration: float,
+               acquired: bool):
+        with self._lock:
+            stats = self._stats.setdefault(resource_type, {
+                "count": 0,
+                "timeouts": 0,
+                "total_wait": 0.,
+                "max_wait": 0.,
+            })
+            stats["count"] += 1
+            stats["timeouts"] += 0 if acquired else 1
+            stats["total_wait"] += wait_duration
+            stats["max_wait"] = max(stats["max_wait"], wait_duration)
+
+        logger.debug("Lock %s for %s in %f",
+                     "acquired" if acquired else "timed out",
+                     resource_type.name,
+                     wait_duration,
+                     extra={
+                         "resource_type": resource_type.name,
+                         "wait_duration": wait_duration,
+                         "acquired": acquired,
+                     })
+
+    def get(self, resource_type: ResourceType) -> dict:
+        with self._lock:
+            return dict(self._stats.get(resource_type, {}))
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def log_report(self):
+        with self._lock:
+            stats = {
+                resource_type.name: dict(i)
+                for resource_type, i in self._stats.items()
+            }
+
+        logger.info("Lock wait stats", extra={"lock_wait_stats": stats})
+
+
+lock_wait_stats = LockWaitStats()
+
+
 class LockManager:
 
     @classmethod
@@ -91,6 +294,7 @@ class LockManager:
                       db_conn: connection,
                       resource_type: ResourceType,
                       resource_id: int,
-                      await_sec: float = 1) -> DatabaseLockContext:
+                      await_sec: float = 1,
+                      xact: bool = False) -> DatabaseLockContext:
         return DatabaseLockContext(db_conn, resource_type, resource_id,
-                                   await_sec)
+                                   await_sec, xact)
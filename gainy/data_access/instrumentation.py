@@ -0,0 +1,256 @@
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Iterator, Type
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import connection, cursor
+
+from gainy.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Number of query fingerprints included in the report logged at the end of a job
+QUERY_STATS_TOP_N = int(os.getenv("QUERY_STATS_TOP_N", 20))
+# Only the beginning of a statement is fingerprinted, so that large multi-row INSERTs stay cheap to record
+FINGERPRINT_LENGTH = 1000
+# Upper bounds of the duration histogram buckets, in seconds
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_UNTERMINATED_LITERAL_RE = re.compile(r"'[^']*$")
+_WHITESPACE_RE = re.compile(r"\s+")
+_VALUES_RE = re.compile(r"\bVALUES\b", re.IGNORECASE)
+_TUPLES_RE = re.compile(
+    r"\(\?(?:\s*,\s*\?)*\)(?:\s*,\s*\(\?(?:\s*,\s*\?)*\))*")
+
+_ignored_caller_paths = (
+    os.path.dirname(os.path.abspath(__file__)),
+    os.path.dirname(os.path.abspath(psycopg2.__file__)),
+)
+
+
+def fingerprint(query) -> str:
+    """
+    Normalizes a statement for grouping: literals and lists of literals are replaced with placeholders
+    and whitespace is collapsed.
+    """
+    truncated = len(query) > FINGERPRINT_LENGTH
+    query = query[:FINGERPRINT_LENGTH]
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", errors="replace")
+
+    if truncated:
+        # the rows of a multi-row INSERT are cut at a random place, drop them altogether
+        match = _VALUES_RE.search(query)
+        if match:
+            query = query[:match.end()] + " (...)"
+
+    query = _LITERAL_RE.sub("?", query)
+    if truncated:
+        query = _UNTERMINATED_LITERAL_RE.sub("?", query)
+    query = _TUPLES_RE.sub("(...)", query)
+    return _WHITESPACE_RE.sub(" ", query).strip()
+
+
+def _get_caller() -> Optional[str]:
+    frame = sys._getframe(2)
+    while frame:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(_ignored_caller_paths):
+            return f"{frame.f_globals.get('__name__')}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+
+    return None
+
+
+class QueryStatsEntry:
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total_duration = 0.
+        self.max_duration = 0.
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.callers = Counter()
+
+    def add(self, duration: float, rows: int, caller: Optional[str]):
+        self.count += 1
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.rows += max(rows, 0)
+        self.histogram[bisect_left(HISTOGRAM_BUCKETS, duration)] += 1
+        if caller:
+            self.callers[caller] += 1
+
+    def to_dict(self) -> dict:
+        histogram = {
+            f"le_{bound}": count
+            for bound, count in zip(HISTOGRAM_BUCKETS, self.histogram) if count
+        }
+        if self.histogram[-1]:
+            histogram["inf"] = self.histogram[-1]
+
+        return {
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "total_duration": self.total_duration,
+            "mean_duration": self.total_duration / self.count,
+            "max_duration": self.max_duration,
+            "rows": self.rows,
+            "histogram": histogram,
+            "callers": dict(self.callers.most_common(5)),
+        }
+
+
+class QueryStats:
+    """
+    Aggregates durations, row counts and callers of executed statements by fingerprint.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.entries: Dict[str, QueryStatsEntry] = {}
+        self._lock = threading.Lock()
+
+    def record(self, query_fingerprint: str, duration: float, rows: int,
+               caller: Optional[str]):
+        with self._lock:
+            entry = self.entries.get(query_fingerprint)
+            if entry is None:
+                entry = self.entries[query_fingerprint] = QueryStatsEntry(
+                    query_fingerprint)
+            entry.add(duration, rows, caller)
+
+    def get_top(self, top_n: int = QUERY_STATS_TOP_N) -> List[QueryStatsEntry]:
+        with self._lock:
+            entries = list(self.entries.values())
+
+        return sorted(entries, key=lambda i: i.total_duration,
+                      reverse=True)[:top_n]
+
+    def log_report(self, top_n: int = QUERY_STATS_TOP_N):
+        with self._lock:
+            count = sum(i.count for i in self.entries.values())
+            total_duration = sum(i.total_duration
+                                 for i in self.entries.values())
+
+        logger.info("Query stats for %s: %d statements in %fs",
+                    self.name,
+                    count,
+                    total_duration,
+                    extra={
+                        "job": self.name,
+                        "statements": count,
+                        "duration": total_duration,
+                        "top": [i.to_dict() for i in self.get_top(top_n)],
+                    })
+
+
+_active_stats: List[QueryStats] = []
+_active_stats_lock = threading.Lock()
+
+
+@contextmanager
+def collect_query_stats(name: str,
+                        top_n: int = QUERY_STATS_TOP_N
+                        ) -> Iterator[QueryStats]:
+    """
+    Records every statement executed on instrumented connections while active and logs the top `top_n`
+    fingerprints by total duration on exit.
+    """
+    global _active_stats
+
+    stats = QueryStats(name)
+    with _active_stats_lock:
+        _active_stats = _active_stats + [stats]
+    try:
+        yield stats
+    finally:
+        with _active_stats_lock:
+            _active_stats = [i for i in _active_stats if i is not stats]
+        stats.log_report(top_n)
+
+
+def _record(_cursor: cursor, query, duration: float):
+    try:
+        if isinstance(query, sql.Composable):
+            query = query.as_string(_cursor)
+
+        query_fingerprint = fingerprint(query)
+        caller = _get_caller()
+        for stats in _active_stats:
+            stats.record(query_fingerprint, duration, _cursor.rowcount, caller)
+    except Exception as e:
+        # instrumentation must never break the statement itself
+        logger.warning("Failed to record query stats: %s", e)
+
+
+class InstrumentedCursorMixin:
+
+    def execute(self, query, vars=None):
+        if not _active_stats:
+            return super().execute(query, vars)
+
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record(self, query, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        if not _active_stats:
+            return super().executemany(query, vars_list)
+
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record(self, query, time.perf_counter() - start)
+
+    def copy_expert(self, query, file, size=8192):
+        if not _active_stats:
+            return super().copy_expert(query, file, size)
+
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(query, file, size)
+        finally:
+            _record(self, query, time.perf_counter() - start)
+
+
+_instrumented_cursor_classes: Dict[Type[cursor], Type[cursor]] = {}
+
+
+def _get_instrumented_cursor_class(cursor_factory: Type[cursor]):
+    if issubclass(cursor_factory, InstrumentedCursorMixin):
+        return cursor_factory
+
+    instrumented_cls = _instrumented_cursor_classes.get(cursor_factory)
+    if instrumented_cls is None:
+        instrumented_cls = type(f"Instrumented{cursor_factory.__name__}",
+                                (InstrumentedCursorMixin, cursor_factory), {})
+        _instrumented_cursor_classes[cursor_factory] = instrumented_cls
+
+    return instrumented_cls
+
+
+class InstrumentedConnection(connection):
+    """
+    Connection which wraps every cursor, including the ones created with an explicit `cursor_factory`,
+    so that executed statements are reported to the active `collect_query_stats` collectors.
+    """
+
+    def cursor(self, *args, **kwargs):
+        cursor_factory = kwargs.get(
+            "cursor_factory") or self.cursor_factory or cursor
+        kwargs["cursor_factory"] = _get_instrumented_cursor_class(
+            cursor_factory)
+        return super().cursor(*args, **kwargs)
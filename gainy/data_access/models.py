@@ -1,7 +1,9 @@
 from abc import ABC, abstractmethod
 from decimal import Decimal
+from functools import cache
 import json
-from typing import List, Any, Dict
+from operator import itemgetter
+from typing import List, Any, Dict, Tuple, Callable, Sequence
 from gainy.data_access.db_lock import ResourceType
 
 
@@ -19,18 +21,119 @@ class classproperty(property):
         return classmethod(self.fget).__get__(None, owner)()
 
 
+def _is_data_descriptor(cls, field: str) -> bool:
+    for klass in cls.__mro__:
+        if field in klass.__dict__:
+            return hasattr(klass.__dict__[field], "__set__")
+    return False
+
+
+def _tuple_getter(keys: Sequence) -> Callable[[Any], tuple]:
+    if not keys:
+        return lambda values: ()
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda values: (values[key], )
+    return itemgetter(*keys)
+
+
+class _FieldSetter:
+    """
+    Assigns a precomputed list of fields from a row, indexed by `keys` (column names for dicts,
+    positions for tuples). Plain attributes are written to the instance `__dict__` in one call,
+    descriptors (properties, slots) go through `setattr`.
+    """
+
+    def __init__(self, cls, fields: Sequence[str], keys: Sequence = None):
+        if keys is None:
+            keys = fields
+
+        use_dict = cls.__setattr__ is object.__setattr__ and cls.__dictoffset__ != 0
+        is_dict_field = [
+            use_dict and not _is_data_descriptor(cls, field)
+            for field in fields
+        ]
+
+        self.dict_fields = tuple(
+            field for field, is_dict in zip(fields, is_dict_field) if is_dict)
+        self.attr_fields = tuple(
+            field for field, is_dict in zip(fields, is_dict_field)
+            if not is_dict)
+        self._dict_getter = _tuple_getter(
+            [key for key, is_dict in zip(keys, is_dict_field) if is_dict])
+        self._attr_getter = _tuple_getter(
+            [key for key, is_dict in zip(keys, is_dict_field) if not is_dict])
+
+    def set(self, entity, row):
+        if self.dict_fields:
+            entity.__dict__.update(
+                zip(self.dict_fields, self._dict_getter(row)))
+        if self.attr_fields:
+            for field, value in zip(self.attr_fields, self._attr_getter(row)):
+                setattr(entity, field, value)
+
+
 class BaseModel(ABC):
+    __slots__ = ()
+
+    # Field setters by (class, row columns)
+    _field_setters: Dict[Tuple[type, Tuple[str, ...]], _FieldSetter] = {}
+    # Tuple row hydrators by (class, cursor columns)
+    _hydrators: Dict[Tuple[type, Tuple[str, ...]], Callable] = {}
 
     def set_from_dict(self, row: dict = None):
         if not row:
             return self
 
-        for field, value in row.items():
-            if hasattr(self, field):
-                setattr(self, field, value)
+        columns = tuple(row)
+        key = (self.__class__, columns)
+        field_setter = BaseModel._field_setters.get(key)
+        if field_setter is None:
+            field_setter = _FieldSetter(
+                self.__class__,
+                [field for field in columns if hasattr(self, field)])
+            BaseModel._field_setters[key] = field_setter
+
+        field_setter.set(self, row)
 
         return self
 
+    @classmethod
+    def hydrator(cls, columns: Sequence[str]) -> Callable[[tuple], Any]:
+        """
+        Returns a function which creates an entity from a tuple row with the given column order.
+        The column-to-field mapping is computed once per class and column order.
+        """
+        columns = tuple(columns)
+        key = (cls, columns)
+        hydrator = BaseModel._hydrators.get(key)
+        if hydrator is None:
+            hydrator = cls._compile_hydrator(columns)
+            BaseModel._hydrators[key] = hydrator
+
+        return hydrator
+
+    @classmethod
+    def _compile_hydrator(cls, columns: Tuple[str, ...]) -> Callable:
+        if cls.set_from_dict is not BaseModel.set_from_dict:
+            # subclasses post-process rows in set_from_dict, so they need a dict
+            return lambda row: cls().set_from_dict(dict(zip(columns, row)))
+
+        instance = cls()
+        indices = [
+            index for index, field in enumerate(columns)
+            if hasattr(instance, field)
+        ]
+        field_setter = _FieldSetter(cls, [columns[index] for index in indices],
+                                    indices)
+
+        def hydrate(row):
+            entity = cls()
+            field_setter.set(entity, row)
+            return entity
+
+        return hydrate
+
     def to_dict(self) -> Dict[str, Any]:
         return self.__dict__
 
@@ -66,7 +169,50 @@ class BaseModel(ABC):
         pass
 
 
+@cache
+def _slot_names(cls) -> Tuple[str, ...]:
+    names = []
+    for klass in reversed(cls.__mro__):
+        slots = klass.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots, )
+        names += [name for name in slots if name not in names]
+    return tuple(names)
+
+
+class SlotsModel(BaseModel):
+    """
+    BaseModel variant backed by `__slots__` instead of an instance `__dict__`, for entities loaded in large numbers.
+    Subclasses list their fields in `__slots__` instead of class-level defaults; unset fields read as None.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name in _slot_names(self.__class__):
+            return None
+        raise AttributeError(
+            f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {}
+        for name in _slot_names(self.__class__):
+            try:
+                result[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return result
+
+    def refresh_entity(self, new_entity):
+        if not new_entity:
+            return
+
+        for field_name, value in new_entity.to_dict().items():
+            setattr(self, field_name, value)
+
+
 class ResourceVersion(ABC):
+    # Column storing resource_version, compared and swapped by optimistic locking functions
+    version_field = "version"
 
     @property
     @abstractmethod
@@ -1,15 +1,62 @@
 from abc import abstractmethod
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, List, Hashable
 
 from psycopg2 import sql
 
 
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ParamNames:
+    """
+    Allocates unique placeholder names within one statement: the first placeholder for a field is named after
+    the field, the following ones get a numeric suffix.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._used = set()
+
+    def allocate(self, field_name: str) -> str:
+        name = field_name
+        suffix = 0
+        while name in self._used:
+            suffix += 1
+            name = f"{field_name}_{suffix}"
+
+        self._used.add(name)
+        self.names.append(name)
+        return name
+
+
 class OperatorInterface:
 
+    @property
+    def signature(self) -> Hashable:
+        """
+        Structure of the condition without its values. Conditions with equal signatures compile to the same template.
+        """
+        return self.__class__
+
     @abstractmethod
-    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
+    def compile(self, field_name: str, param_names: ParamNames) -> str:
+        """
+        Renders the condition as a statement template, allocating its placeholders from `param_names`
+        in the order `get_params` returns their values.
+        """
         pass
 
+    def get_params(self) -> List[Any]:
+        return []
+
+    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
+        param_names = ParamNames()
+        _sql = sql.SQL(self.compile(field_name, param_names))
+        _params = dict(zip(param_names.names, self.get_params()))
+
+        return _sql, _params
+
 
 class ComparisonOperator(OperatorInterface):
 
@@ -17,12 +64,16 @@ class ComparisonOperator(OperatorInterface):
         self.op = op
         self.param = param
 
-    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
-        _sql = sql.SQL(f"{{field_name}} {self.op} %({field_name})s").format(
-            field_name=sql.Identifier(field_name))
-        _params = {field_name: self.param}
+    @property
+    def signature(self) -> Hashable:
+        return self.__class__, self.op
 
-        return _sql, _params
+    def compile(self, field_name: str, param_names: ParamNames) -> str:
+        param_name = param_names.allocate(field_name)
+        return f"{quote_identifier(field_name)} {self.op} %({param_name})s"
+
+    def get_params(self) -> List[Any]:
+        return [self.param]
 
 
 class OperatorEq(ComparisonOperator):
@@ -54,12 +105,12 @@ class OperatorIn(OperatorInterface):
     def __init__(self, param: list):
         self.param = param
 
-    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
-        _sql = sql.SQL(f"{{field_name}} = ANY (%({field_name})s)").format(
-            field_name=sql.Identifier(field_name))
-        _params = {field_name: self.param}
+    def compile(self, field_name: str, param_names: ParamNames) -> str:
+        param_name = param_names.allocate(field_name)
+        return f"{quote_identifier(field_name)} = ANY (%({param_name})s)"
 
-        return _sql, _params
+    def get_params(self) -> List[Any]:
+        return [self.param]
 
     def __eq__(self, other):
         if isinstance(other, OperatorIn):
@@ -72,11 +123,15 @@ class OperatorNot(OperatorInterface):
     def __init__(self, operator: OperatorInterface):
         self.operator = operator
 
-    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
-        _sql, _params = self.operator.to_sql(field_name)
-        _sql = sql.SQL(f"(NOT ({{_sql}}))").format(_sql=_sql)
+    @property
+    def signature(self) -> Hashable:
+        return self.__class__, self.operator.signature
 
-        return _sql, _params
+    def compile(self, field_name: str, param_names: ParamNames) -> str:
+        return f"(NOT ({self.operator.compile(field_name, param_names)}))"
+
+    def get_params(self) -> List[Any]:
+        return self.operator.get_params()
 
 
 class OperatorOr(OperatorInterface):
@@ -84,31 +139,31 @@ class OperatorOr(OperatorInterface):
     def __init__(self, operators: list[OperatorInterface]):
         self.operators = operators
 
-    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
-        sql_parts = []
-        params = {}
-        for operator in self.operators:
-            _sql, _params = operator.to_sql(field_name)
-            _sql = sql.SQL(f"({{_sql}})").format(_sql=_sql)
-            sql_parts.append(_sql)
-            params.update(_params)
+    @property
+    def signature(self) -> Hashable:
+        return self.__class__, tuple(operator.signature
+                                     for operator in self.operators)
 
-        _sql = sql.SQL(" OR ").join(sql_parts)
+    def compile(self, field_name: str, param_names: ParamNames) -> str:
+        conditions = " OR ".join(
+            f"({operator.compile(field_name, param_names)})"
+            for operator in self.operators)
+        return f"({conditions})"
 
-        return _sql, params
+    def get_params(self) -> List[Any]:
+        return [
+            param for operator in self.operators
+            for param in operator.get_params()
+        ]
 
 
 class OperatorNotNull(OperatorInterface):
 
-    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
-        _sql = sql.SQL(f"{{field_name}} IS NOT NULL").format(
-            field_name=sql.Identifier(field_name))
-        return _sql, {}
+    def compile(self, field_name: str, param_names: ParamNames) -> str:
+        return f"{quote_identifier(field_name)} IS NOT NULL"
 
 
 class OperatorIsNull(OperatorInterface):
 
-    def to_sql(self, field_name: str) -> Tuple[sql.Composable, Dict[str, Any]]:
-        _sql = sql.SQL(f"{{field_name}} IS NULL").format(
-            field_name=sql.Identifier(field_name))
-        return _sql, {}
+    def compile(self, field_name: str, param_names: ParamNames) -> str:
+        return f"{quote_identifier(field_name)} IS NULL"
@@ -1,10 +1,10 @@
 import logging
+import threading
 from abc import ABC, abstractmethod
 
 from backoff import full_jitter
 import backoff
 
-from gainy.data_access.db_lock import LockManager, LockAcquisitionTimeout
 from gainy.data_access.models import ResourceVersion
 from gainy.utils import get_logger
 
@@ -13,14 +13,17 @@ logger = get_logger(__name__)
 
 class ConcurrentVersionUpdate(Exception):
 
-    def __init__(self, cur_version: ResourceVersion,
-                 next_version: ResourceVersion):
+    def __init__(self, version: ResourceVersion, expected_version):
         super().__init__(
-            f"Concurrent update of resource {cur_version.resource_type.name}:{cur_version.resource_id}, expected version: {cur_version.resource_version}, actual version: {next_version.resource_version}"
+            f"Concurrent update of resource {version.resource_type.name}:{version.resource_id}, expected version: {expected_version}"
         )
 
 
 class AbstractOptimisticLockingFunction(ABC):
+    """
+    Loads the version and the entities without locking, then writes the next version with a compare-and-swap
+    and retries from scratch if another transaction has changed the version in between.
+    """
 
     def __init__(self, repo):
         self.repo = repo
@@ -34,40 +37,106 @@ class AbstractOptimisticLockingFunction(ABC):
         pass
 
     def execute(self, max_tries: int = 3):
+        attempts = 0
+
+        def try_execute():
+            nonlocal attempts
+            attempts += 1
+            return self._try_execute()
+
         backoff_on_exception = backoff.on_exception(
             lambda: backoff.expo(base=2, factor=0.1),
-            exception=(LockAcquisitionTimeout, ConcurrentVersionUpdate),
+            exception=ConcurrentVersionUpdate,
             max_tries=max_tries,
             giveup_log_level=logging.WARNING,
             jitter=lambda w: w / 2 + full_jitter(w / 2))
         try:
-            backoff_on_exception(self._try_execute)()
+            result = backoff_on_exception(try_execute)()
+            optimistic_lock_stats.record(self.__class__.__name__, attempts,
+                                         True)
+            return result
         except Exception as e:
+            optimistic_lock_stats.record(self.__class__.__name__, attempts,
+                                         False)
             logging.warning(e, exc_info=True)
             raise e
 
     def _try_execute(self):
-        cur_version = self.load_version()
+        version = self.load_version()
         entities = self.get_entities()
 
-        # TODO doesn't look too optimistic to me
-        with LockManager.database_lock(self.repo.db_conn,
-                                       cur_version.resource_type,
-                                       cur_version.resource_id):
-            new_version = self.load_version()
-
-            is_creation = cur_version.resource_version is None and not new_version
-            is_same_version = new_version and new_version.resource_version == cur_version.resource_version
-            if is_creation or is_same_version:
-                new_version.update_version()
-            else:
-                raise ConcurrentVersionUpdate(cur_version, new_version)
+        expected_version = version.resource_version
+        version.update_version()
+        # the row stays locked until commit, concurrent writers wait for it and then see the new version
+        if not self.repo.compare_and_swap_version(version, expected_version):
+            optimistic_lock_stats.record_conflict(self.__class__.__name__)
+            raise ConcurrentVersionUpdate(version, expected_version)
 
-            self.repo.persist(new_version)
-            result = self._do(new_version, entities)
-            self.repo.commit()
+        result = self._do(version, entities)
+        self.repo.commit()
 
         return result
 
     def _do(self, version, entities):
         self.repo.persist(entities)
+
+
+class OptimisticLockStats:
+    """
+    Attempts and version conflicts of optimistic locking functions per function class.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _get_stats(self, name: str) -> dict:
+        return self._stats.setdefault(
+            name, {
+                "executions": 0,
+                "failures": 0,
+                "attempts": 0,
+                "max_attempts": 0,
+                "conflicts": 0,
+            })
+
+    def record(self, name: str, attempts: int, succeeded: bool):
+        with self._lock:
+            stats = self._get_stats(name)
+            stats["executions"] += 1
+            stats["failures"] += 0 if succeeded else 1
+            stats["attempts"] += attempts
+            stats["max_attempts"] = max(stats["max_attempts"], attempts)
+
+        if attempts > 1:
+            logger.info("%s %s after %d attempts",
+                        name,
+                        "succeeded" if succeeded else "failed",
+                        attempts,
+                        extra={
+                            "function": name,
+                            "attempts": attempts,
+                            "succeeded": succeeded,
+                        })
+
+    def record_conflict(self, name: str):
+        with self._lock:
+            self._get_stats(name)["conflicts"] += 1
+
+    def get(self, name: str) -> dict:
+        with self._lock:
+            return dict(self._stats.get(name, {}))
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def log_report(self):
+        with self._lock:
+            stats = {name: dict(i) for name, i in self._stats.items()}
+
+        logger.info("Optimistic lock stats",
+                    extra={"optimistic_lock_stats": stats})
+
+
+optimistic_lock_stats = OptimisticLockStats()
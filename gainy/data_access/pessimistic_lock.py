@@ -11,6 +11,9 @@ logger = get_logger(__name__)
 
 
 class AbstractPessimisticLockingFunction(ABC):
+    # Hold the lock with pg_advisory_xact_lock, so that it is released on commit or rollback.
+    # Only safe if _do does not commit before it is done.
+    transaction_scoped_lock = False
 
     def __init__(self, repo):
         self.repo = repo
@@ -38,7 +41,8 @@ class AbstractPessimisticLockingFunction(ABC):
         # TODO dependency on repo for database_lock looks bad
         with LockManager.database_lock(self.repo.db_conn,
                                        cur_version.resource_type,
-                                       cur_version.resource_id):
+                                       cur_version.resource_id,
+                                       xact=self.transaction_scoped_lock):
             new_version = self.load_version()
             new_version.update_version()
             self.repo.persist(new_version)
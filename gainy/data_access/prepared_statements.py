@@ -0,0 +1,71 @@
+import re
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+from psycopg2.extensions import connection, cursor
+
+_NAMED_PARAM_RE = re.compile(r"%\((\w+)\)s")
+
+# Names of the statements prepared in each session. PREPARE is not undone by ROLLBACK, only by DEALLOCATE,
+# DISCARD ALL or the end of the session.
+_prepared: "weakref.WeakKeyDictionary[connection, set]" = weakref.WeakKeyDictionary(
+)
+_prepared_lock = threading.Lock()
+
+
+class PreparedStatement:
+    """
+    Server-side prepared statement, created in a session on its first execution there.
+
+    `query` uses psycopg2 named placeholders (`%(name)s`), which are converted to positional parameters.
+    Parameter types are inferred by the server at PREPARE time, so lists must be compared with `= ANY(...)`
+    instead of `IN`.
+    """
+
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.param_names: List[str] = []
+
+        def replace_param(match) -> str:
+            param_name = match.group(1)
+            if param_name not in self.param_names:
+                self.param_names.append(param_name)
+            return f"${self.param_names.index(param_name) + 1}"
+
+        statement = _NAMED_PARAM_RE.sub(replace_param, query.strip())
+        self.prepare_statement = f"PREPARE {name} AS {statement.rstrip(';')}"
+
+        self.execute_statement = f"EXECUTE {name}"
+        if self.param_names:
+            self.execute_statement += "(" + ", ".join(
+                ["%s"] * len(self.param_names)) + ")"
+
+    def execute(self,
+                _cursor: cursor,
+                params: Optional[Dict[str, Any]] = None):
+        conn = _cursor.connection
+        with _prepared_lock:
+            is_prepared = self.name in _prepared.get(conn, ())
+
+        if not is_prepared:
+            _cursor.execute(self.prepare_statement)
+            with _prepared_lock:
+                _prepared.setdefault(conn, set()).add(self.name)
+
+        if not self.param_names:
+            _cursor.execute(self.execute_statement)
+            return
+
+        params = params or {}
+        _cursor.execute(
+            self.execute_statement,
+            [params.get(param_name) for param_name in self.param_names])
+
+
+def forget_prepared_statements(conn: connection):
+    """
+    Must be called after the session's prepared statements are dropped, e.g. by DISCARD ALL.
+    """
+    with _prepared_lock:
+        _prepared.pop(conn, None)
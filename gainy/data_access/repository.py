@@ -1,50 +1,99 @@
-from typing import Dict, Any, List, Iterable, Tuple, Type
+import datetime
+import enum
+import io
+import uuid
+from typing import Dict, Any, List, Iterable, Tuple, Type, Iterator, Optional
 
 from psycopg2 import sql
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
 from psycopg2._psycopg import connection
-from psycopg2.extras import execute_values, RealDictCursor
+from psycopg2.extras import execute_values
 
 from gainy.data_access.models import BaseModel
-from gainy.data_access.operators import OperatorEq, OperatorInterface
-
-MAX_TRANSACTION_SIZE = 100
+from gainy.data_access.operators import OperatorEq, OperatorInterface, OperatorIn, ParamNames, quote_identifier
+
+MAX_TRANSACTION_SIZE = 5000
+# Chunks are sized so that a single INSERT stays under the bind parameters limit and the statement size budget
+MAX_STATEMENT_PARAMETERS = 65535
+MAX_STATEMENT_SIZE = 2**20
+ROW_WIDTH_SAMPLE_SIZE = 10
+# Groups of at least this many entities are persisted through COPY into a staging table
+BULK_PERSIST_THRESHOLD = 5000
+# Rows fetched per round trip by server-side cursors in streaming mode
+DEFAULT_ITERSIZE = 2000
+# Rows fetched per query by keyset pagination
+DEFAULT_PAGE_SIZE = 1000
+# Keys looked up per query by find_many_by_keys
+FIND_MANY_CHUNK_SIZE = 5000
+
+# Rendered INSERT statements by (model class, schema, table, field names)
+_insert_statements_cache: Dict[Tuple, str] = {}
+
+# Compiled WHERE clauses by filter signature: (WHERE clause template, placeholder names)
+_where_clauses_cache: Dict[Tuple, Tuple[str, Tuple[str, ...]]] = {}
+# SELECT statements by (schema, table, filter signature, order)
+_select_statements_cache: Dict[Tuple, sql.SQL] = {}
 
 
 class TableFilter:
 
     @staticmethod
-    def _where_clause_statement(
-            filter_by: Dict[str, Any]) -> Tuple[sql.SQL, Dict[str, Any]]:
-        params = {}
+    def _compile_where_clause(
+        filter_by: Dict[str,
+                        Any]) -> Tuple[Optional[Tuple], str, Dict[str, Any]]:
+        """
+        Compiles the filter structure (fields and operator types) into a cached statement template
+        and binds the filter values to its placeholders.
+
+        :return: filter signature, WHERE clause template, params
+        """
         if not filter_by:
-            return sql.SQL(""), params
-
-        conditions = []
-        for field, value in filter_by.items():
-            if not isinstance(value, OperatorInterface):
-                value = OperatorEq(value)
-
-            op_sql, op_params = value.to_sql(field)
-            conditions.append(op_sql)
-            params.update(op_params)
+            return None, "", {}
+
+        operators = [(field, value if isinstance(value, OperatorInterface) else
+                      OperatorEq(value)) for field, value in filter_by.items()]
+        signature = tuple(
+            (field, operator.signature) for field, operator in operators)
+
+        compiled = _where_clauses_cache.get(signature)
+        if compiled is None:
+            param_names = ParamNames()
+            conditions = [
+                operator.compile(field, param_names)
+                for field, operator in operators
+            ]
+            compiled = " WHERE " + " AND ".join(conditions), tuple(
+                param_names.names)
+            _where_clauses_cache[signature] = compiled
+
+        template, names = compiled
+        values = [
+            param for _, operator in operators
+            for param in operator.get_params()
+        ]
+        return signature, template, dict(zip(names, values))
 
-        condition = sql.SQL(" AND ").join(conditions)
-        return sql.SQL(" WHERE ") + condition, params
+    @staticmethod
+    def _where_clause_statement(
+            filter_by: Dict[str, Any]) -> Tuple[sql.SQL, Dict[str, Any]]:
+        _, template, params = TableFilter._compile_where_clause(filter_by)
+        return sql.SQL(template), params
 
 
 class TableOrder:
 
     @staticmethod
-    def _order_clause_statement(order_by: List[Tuple[str, str]]):
+    def _compile_order_clause(order_by: List[Tuple[str, str]]) -> str:
         if not order_by:
-            return sql.SQL("")
+            return ""
+
+        return " ORDER BY " + ", ".join(
+            f"{quote_identifier(field)} {direction}"
+            for field, direction in order_by)
 
-        condition = sql.SQL(", ").join([
-            sql.SQL(f"{{field}} {{direction}}").format(
-                field=sql.Identifier(field), direction=sql.SQL(direction))
-            for field, direction in order_by
-        ])
-        return sql.SQL(" ORDER BY ") + condition
+    @staticmethod
+    def _order_clause_statement(order_by: List[Tuple[str, str]]):
+        return sql.SQL(TableOrder._compile_order_clause(order_by))
 
 
 class TableLoad(TableFilter, TableOrder):
@@ -55,23 +104,114 @@ class TableLoad(TableFilter, TableOrder):
                  filter_by: Dict[str, Any] = None,
                  order_by: List[Tuple[str, str]] = None):
         query, params = self._get_query(cls, filter_by, order_by)
-        with self.db_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        with self.db_conn.cursor() as cursor:
             cursor.execute(query, params)
 
             row = cursor.fetchone()
+            if not row:
+                return None
 
-        return cls().set_from_dict(row) if row else None
+            return cls.hydrator(_get_column_names(cursor))(row)
 
     def iterate_all(self,
                     cls: Type[BaseModel],
                     filter_by: Dict[str, Any] = None,
-                    order_by: List[Tuple[str, str]] = None) -> Iterable[Any]:
+                    order_by: List[Tuple[str, str]] = None,
+                    stream: bool = False,
+                    itersize: int = DEFAULT_ITERSIZE) -> Iterable[Any]:
+        """
+        :param stream: fetch rows with a named server-side cursor, `itersize` rows per round trip,
+            instead of loading the whole result set into memory.
+            The cursor is declared WITH HOLD, so it survives commits made while iterating.
+        """
         query, params = self._get_query(cls, filter_by, order_by)
-        with self.db_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+
+        if stream:
+            cursor = self.db_conn.cursor(
+                name=f"iterate_{cls.table_name}_{uuid.uuid4().hex}",
+                withhold=True)
+            cursor.itersize = itersize
+        else:
+            cursor = self.db_conn.cursor()
+
+        with cursor:
             cursor.execute(query, params)
 
+            hydrate = None
             for row in cursor:
-                yield cls().set_from_dict(row)
+                # named cursors only have a description after the first fetch
+                if hydrate is None:
+                    hydrate = cls.hydrator(_get_column_names(cursor))
+                yield hydrate(row)
+
+    def iterate_all_paginated(
+            self,
+            cls: Type[BaseModel],
+            filter_by: Dict[str, Any] = None,
+            page_size: int = DEFAULT_PAGE_SIZE) -> Iterable[Any]:
+        """
+        Iterates over entities ordered by their key fields, loading `page_size` rows per query with keyset pagination.
+        No cursor is kept open between pages, so the caller may commit or roll back while iterating.
+        The key fields must not be nullable: rows after a page ending with a NULL key can not be reached.
+        """
+        key_fields = cls.key_fields
+        if not key_fields:
+            raise ValueError(
+                f"{cls.__name__} has no key fields to paginate by")
+        order_by = [(field, "asc") for field in key_fields]
+
+        last_key = None
+        while True:
+            query, params = self._get_page_query(cls, filter_by, order_by,
+                                                 last_key, page_size)
+            with self.db_conn.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                hydrate = cls.hydrator(_get_column_names(cursor))
+
+            entities = [hydrate(row) for row in rows]
+            yield from entities
+
+            if len(rows) < page_size:
+                return
+
+            last_key = [getattr(entities[-1], field) for field in key_fields]
+            if None in last_key:
+                raise ValueError(
+                    f"Can not paginate {cls.__name__} past a NULL key {last_key}"
+                )
+
+    def find_many_by_keys(
+            self,
+            cls: Type[BaseModel],
+            keys: Iterable[Any],
+            chunk_size: int = FIND_MANY_CHUNK_SIZE) -> Dict[Tuple, Any]:
+        """
+        Loads entities by their key fields with one `= ANY (...)` query per `chunk_size` keys.
+
+        :param keys: tuples of values in the order of `cls.key_fields`, scalars for single-field keys.
+        :return: entities by key tuple. Keys that were not found are absent.
+        """
+        key_fields = cls.key_fields
+        keys = list(
+            dict.fromkeys(key if isinstance(key, tuple) else (key, )
+                          for key in keys))
+        requested_keys = set(keys)
+
+        entities = {}
+        for l_bound in range(0, len(keys), chunk_size):
+            chunk = keys[l_bound:l_bound + chunk_size]
+            # for composite keys this matches a superset of the chunk, the rest is dropped below
+            filter_by = {
+                field: OperatorIn(list(dict.fromkeys(key[i] for key in chunk)))
+                for i, field in enumerate(key_fields)
+            }
+            for entity in self.iterate_all(cls, filter_by):
+                key = tuple(getattr(entity, field) for field in key_fields)
+                if key in requested_keys:
+                    entities[key] = entity
+
+        return entities
 
     def find_all(self,
                  cls,
@@ -81,15 +221,46 @@ class TableLoad(TableFilter, TableOrder):
 
     def _get_query(self, cls, filter_by: Dict[str, Any],
                    order_by: List[Tuple[str, str]]):
+        signature, where_clause, params = self._compile_where_clause(filter_by)
+
+        key = (cls.schema_name, cls.table_name, signature,
+               tuple(map(tuple, order_by)) if order_by else None)
+        query = _select_statements_cache.get(key)
+        if query is None:
+            query = sql.SQL("SELECT * FROM {table}{where}{order}".format(
+                table=_quote_table_name(cls.schema_name, cls.table_name),
+                where=where_clause,
+                order=self._compile_order_clause(order_by)))
+            _select_statements_cache[key] = query
+
+        return query, params
+
+    def _get_page_query(self, cls, filter_by: Dict[str, Any],
+                        order_by: List[Tuple[str, str]], last_key: List[Any],
+                        page_size: int):
         query = sql.SQL("SELECT * FROM {}").format(
             sql.Identifier(cls.schema_name, cls.table_name))
 
-        params = []
-        if filter_by:
-            where_clause, params = self._where_clause_statement(filter_by)
-            query += where_clause
-        if order_by:
-            query += self._order_clause_statement(order_by)
+        where_clause, params = self._where_clause_statement(filter_by)
+        query += where_clause
+
+        if last_key is not None:
+            key_fields = [field for field, _ in order_by]
+            keyset_condition = sql.SQL("({fields}) > ({values})").format(
+                fields=sql.SQL(", ").join(map(sql.Identifier, key_fields)),
+                values=sql.SQL(", ").join(
+                    sql.Placeholder(f"_keyset_{i}")
+                    for i in range(len(key_fields))))
+            query += (sql.SQL(" AND ")
+                      if filter_by else sql.SQL(" WHERE ")) + keyset_condition
+            params.update({
+                f"_keyset_{i}": value
+                for i, value in enumerate(last_key)
+            })
+
+        query += self._order_clause_statement(order_by)
+        query += sql.SQL(" LIMIT %(_limit)s")
+        params["_limit"] = page_size
 
         return query, params
 
@@ -128,7 +299,7 @@ class TableDelete(TableFilter):
             cursor.execute(query, params)
 
 
-class TablePersist:
+class TablePersist(TableFilter):
     db_conn: connection
 
     def commit(self):
@@ -137,6 +308,96 @@ class TablePersist:
     def rollback(self):
         self.db_conn.rollback()
 
+    def compare_and_swap_version(self, entity: BaseModel,
+                                 expected_version) -> bool:
+        """
+        Writes `entity` only if the stored version is still `expected_version`. An entity with
+        `expected_version` None is inserted unless a concurrent transaction has inserted it first.
+        Like `persist`, writes all persisted fields and refreshes the non-persistent ones.
+        The written row stays locked until the end of the transaction.
+
+        :return: whether the entity has been written
+        """
+        if expected_version is None:
+            return self._insert_if_absent(entity)
+
+        filter_by = {
+            field: getattr(entity, field)
+            for field in entity.key_fields
+        }
+        filter_by[entity.version_field] = expected_version
+        where_clause, params = self._where_clause_statement(filter_by)
+
+        entity_dict = entity.to_dict()
+        field_names = [
+            field_name for field_name in entity_dict.keys()
+            if field_name not in entity.db_excluded_fields
+            and field_name not in entity.key_fields
+        ]
+        non_persistent_fields = entity.non_persistent_fields
+
+        query = sql.SQL("UPDATE {table} SET {set_clause}").format(
+            table=sql.Identifier(entity.schema_name, entity.table_name),
+            set_clause=sql.SQL(",").join([
+                sql.SQL("{field_name} = {placeholder}").format(
+                    field_name=sql.Identifier(field_name),
+                    placeholder=sql.Placeholder(f"_set_{i}"))
+                for i, field_name in enumerate(field_names)
+            ]))
+        for i, field_name in enumerate(field_names):
+            params[f"_set_{i}"] = entity_dict.get(field_name)
+
+        query += where_clause
+        if non_persistent_fields:
+            query += sql.SQL(" RETURNING {non_persistent_fields}").format(
+                non_persistent_fields=self._escape_fields(
+                    non_persistent_fields))
+
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(query, params)
+            if cursor.rowcount != 1:
+                return False
+
+            if non_persistent_fields:
+                for field_name, value in zip(non_persistent_fields,
+                                             cursor.fetchone()):
+                    setattr(entity, field_name, value)
+
+        return True
+
+    def _insert_if_absent(self, entity: BaseModel) -> bool:
+        entity_dict = entity.to_dict()
+        field_names = [
+            field_name for field_name in entity_dict.keys()
+            if field_name not in entity.db_excluded_fields
+        ]
+        non_persistent_fields = entity.non_persistent_fields
+
+        query = sql.SQL(
+            "INSERT INTO {table} ({field_names}) VALUES ({values}) ON CONFLICT DO NOTHING"
+        ).format(table=sql.Identifier(entity.schema_name, entity.table_name),
+                 field_names=self._escape_fields(field_names),
+                 values=sql.SQL(",").join(sql.Placeholder() *
+                                          len(field_names)))
+        if non_persistent_fields:
+            query += sql.SQL(" RETURNING {non_persistent_fields}").format(
+                non_persistent_fields=self._escape_fields(
+                    non_persistent_fields))
+
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                query,
+                [entity_dict.get(field_name) for field_name in field_names])
+            if cursor.rowcount != 1:
+                return False
+
+            if non_persistent_fields:
+                for field_name, value in zip(non_persistent_fields,
+                                             cursor.fetchone()):
+                    setattr(entity, field_name, value)
+
+        return True
+
     def persist(self, entities):
         if isinstance(entities, BaseModel):
             entities = [entities]
@@ -146,15 +407,13 @@ class TablePersist:
         for (schema_name,
              table_name), group_entities in entities_grouped.items():
 
-            chunks_count = (len(group_entities) + MAX_TRANSACTION_SIZE -
-                            1) // MAX_TRANSACTION_SIZE
-            for chunk_id in range(chunks_count):
-
-                l_bound = chunk_id * MAX_TRANSACTION_SIZE
-                r_bound = min(len(group_entities),
-                              (chunk_id + 1) * MAX_TRANSACTION_SIZE)
-                chunk = group_entities[l_bound:r_bound]
+            if self._can_persist_bulk(group_entities):
+                self._persist_bulk(schema_name, table_name, group_entities)
+                continue
 
+            chunk_size = self._get_chunk_size(group_entities)
+            for l_bound in range(0, len(group_entities), chunk_size):
+                chunk = group_entities[l_bound:l_bound + chunk_size]
                 self._persist_chunk(schema_name, table_name, chunk)
 
     def _persist_chunk(self, schema_name, table_name, entities):
@@ -164,34 +423,224 @@ class TablePersist:
         ]
         non_persistent_fields = entities[0].non_persistent_fields
 
-        sql_string = self._get_insert_statement(schema_name, table_name,
-                                                field_names, entities)
+        sql_string = self._get_cached_insert_statement(schema_name, table_name,
+                                                       field_names, entities)
 
         entity_dicts = [entity.to_dict() for entity in entities]
         values = [[entity_dict.get(field_name) for field_name in field_names]
                   for entity_dict in entity_dicts]
 
         with self.db_conn.cursor() as cursor:
-            execute_values(cursor, sql_string, values)
-
-            if not non_persistent_fields:
-                return
+            returned = execute_values(cursor,
+                                      sql_string,
+                                      values,
+                                      page_size=len(values),
+                                      fetch=bool(non_persistent_fields))
 
-            returned = cursor.fetchall()
+        if not non_persistent_fields:
+            return
 
         for entity, returned_row in zip(entities, returned):
             for non_persistent_field, value in zip(non_persistent_fields,
                                                    returned_row):
                 entity.__setattr__(non_persistent_field, value)
 
-    def _get_insert_statement(self, schema_name, table_name, field_names,
-                              entities):
+    @staticmethod
+    def _get_chunk_size(entities) -> int:
+        """
+        Number of entities per INSERT statement, based on the number of fields and the width of sampled rows.
+        """
+        sample = [
+            entity.to_dict() for entity in entities[:ROW_WIDTH_SAMPLE_SIZE]
+        ]
+        field_names = [
+            field_name for field_name in sample[0].keys()
+            if field_name not in entities[0].db_excluded_fields
+        ]
+        if not field_names:
+            return MAX_TRANSACTION_SIZE
+
+        row_width = max(
+            sum(
+                len(str(entity_dict.get(field_name))) + 4
+                for field_name in field_names) for entity_dict in sample)
+
+        return max(
+            1,
+            min(MAX_TRANSACTION_SIZE,
+                MAX_STATEMENT_PARAMETERS // len(field_names),
+                MAX_STATEMENT_SIZE // row_width))
+
+    def _get_cached_insert_statement(self, schema_name, table_name,
+                                     field_names, entities) -> str:
+        cache_key = (entities[0].__class__, schema_name, table_name,
+                     tuple(field_names))
+        if cache_key not in _insert_statements_cache:
+            sql_string = self._get_insert_statement(schema_name, table_name,
+                                                    field_names, entities)
+            _insert_statements_cache[cache_key] = sql_string.as_string(
+                self.db_conn)
+
+        return _insert_statements_cache[cache_key]
+
+    def _can_persist_bulk(self, entities) -> bool:
+        if len(entities) < BULK_PERSIST_THRESHOLD:
+            return False
+
+        # A single INSERT ... ON CONFLICT DO UPDATE can not affect the same row twice
+        key_fields = entities[0].key_fields
+        # returned non persistent fields are matched to the entities by their keys
+        needs_keys = bool(entities[0].non_persistent_fields)
+        if not key_fields:
+            return not needs_keys
+
+        keys = set()
+        for entity in entities:
+            key = tuple(getattr(entity, field, None) for field in key_fields)
+            if None in key:
+                if needs_keys:
+                    return False
+                continue
+            if key in keys:
+                return False
+            keys.add(key)
+
+        return True
+
+    def _persist_bulk(self, schema_name, table_name, entities):
+        """
+        Streams entities into a temporary staging table with COPY and merges it into the target table
+        with a single INSERT ... SELECT ... ON CONFLICT statement.
+        """
+        field_names = [
+            field_name for field_name in entities[0].to_dict().keys()
+            if field_name not in entities[0].db_excluded_fields
+        ]
+        non_persistent_fields = entities[0].non_persistent_fields
+
+        staging_table_name = sql.Identifier(f"{table_name}_staging")
+        field_names_escaped = self._escape_fields(field_names)
+        drop_statement = sql.SQL(
+            "DROP TABLE IF EXISTS {staging_table_name}").format(
+                staging_table_name=staging_table_name)
+
+        with self.db_conn.cursor() as cursor:
+            # left over by a failed persist outside of a transaction
+            cursor.execute(drop_statement)
+            cursor.execute(
+                sql.SQL(
+                    "CREATE TEMP TABLE {staging_table_name} AS SELECT {field_names} FROM {full_table_name} WITH NO DATA"
+                ).format(staging_table_name=staging_table_name,
+                         field_names=field_names_escaped,
+                         full_table_name=sql.Identifier(
+                             schema_name, table_name)))
+            try:
+                returned = self._merge_staging_table(cursor, schema_name,
+                                                     table_name,
+                                                     staging_table_name,
+                                                     field_names, entities)
+            finally:
+                # an aborted transaction drops the table on rollback
+                if self.db_conn.get_transaction_status(
+                ) != TRANSACTION_STATUS_INERROR:
+                    cursor.execute(drop_statement)
+
+        for position, *values in returned:
+            for non_persistent_field, value in zip(non_persistent_fields,
+                                                   values):
+                entities[position - 1].__setattr__(non_persistent_field, value)
+
+    def _merge_staging_table(self, cursor, schema_name, table_name,
+                             staging_table_name, field_names,
+                             entities) -> List[tuple]:
+        """
+        :return: _ord (1-based index of the entity) and non persistent fields of the inserted / updated rows
+        """
         field_names_escaped = self._escape_fields(field_names)
+        cursor.execute(
+            sql.SQL("ALTER TABLE {staging_table_name} ADD COLUMN _ord serial").
+            format(staging_table_name=staging_table_name))
+
+        copy_statement = sql.SQL(
+            "COPY {staging_table_name} ({field_names}) FROM STDIN").format(
+                staging_table_name=staging_table_name,
+                field_names=field_names_escaped)
+        rows = (self._copy_row(entity.to_dict(), field_names)
+                for entity in entities)
+        cursor.copy_expert(copy_statement.as_string(self.db_conn),
+                           _IteratorFile(rows))
+
+        select_statement = sql.SQL(
+            "SELECT {field_names} FROM {staging_table_name} ORDER BY _ord"
+        ).format(staging_table_name=staging_table_name,
+                 field_names=field_names_escaped)
+        non_persistent_fields = entities[0].non_persistent_fields
+        if not non_persistent_fields:
+            cursor.execute(
+                self._get_insert_statement(schema_name, table_name,
+                                           field_names, entities,
+                                           select_statement))
+            return []
+
+        # RETURNING order is not guaranteed, rows are matched back to the staging rows by their keys
+        key_fields = list(entities[0].key_fields)
+        sql_string = self._get_insert_statement(
+            schema_name, table_name, field_names, entities, select_statement,
+            key_fields + [
+                field_name for field_name in non_persistent_fields
+                if field_name not in key_fields
+            ])
+        cursor.execute(
+            sql.SQL(
+                "WITH inserted AS ({insert_statement}) SELECT {staging_table_name}._ord, {returned_fields} FROM inserted JOIN {staging_table_name} USING ({key_fields})"
+            ).format(insert_statement=sql_string,
+                     staging_table_name=staging_table_name,
+                     returned_fields=sql.SQL(',').join(
+                         sql.Identifier("inserted", field_name)
+                         for field_name in non_persistent_fields),
+                     key_fields=self._escape_fields(key_fields)))
+        return cursor.fetchall()
+
+    def copy_rows(self, table: sql.Composable, field_names: List[str],
+                  rows: Iterable[Iterable[Any]]):
+        """
+        Streams `rows`, tuples of values in `field_names` order, into `table` with COPY.
+        """
+        copy_statement = sql.SQL(
+            "COPY {table} ({field_names}) FROM STDIN").format(
+                table=table, field_names=self._escape_fields(field_names))
+        lines = ("\t".join(_copy_text(value) for value in row) + "\n"
+                 for row in rows)
+        with self.db_conn.cursor() as cursor:
+            cursor.copy_expert(copy_statement.as_string(self.db_conn),
+                               _IteratorFile(lines))
+
+    @staticmethod
+    def _copy_row(entity_dict: Dict[str, Any], field_names) -> str:
+        return "\t".join(
+            _copy_text(entity_dict.get(field_name))
+            for field_name in field_names) + "\n"
+
+    def _get_insert_statement(self,
+                              schema_name,
+                              table_name,
+                              field_names,
+                              entities,
+                              source: sql.Composable = None,
+                              returning: List[str] = None):
+        """
+        :param returning: fields returned by the statement, the entities' non persistent fields by default
+        """
+        field_names_escaped = self._escape_fields(field_names)
+
+        if source is None:
+            source = sql.SQL("VALUES %s")
 
         sql_string = sql.SQL(
-            "INSERT INTO {full_table_name} ({field_names}) VALUES %s").format(
+            "INSERT INTO {full_table_name} ({field_names}) {source}").format(
                 full_table_name=sql.Identifier(schema_name, table_name),
-                field_names=field_names_escaped)
+                field_names=field_names_escaped,
+                source=source)
 
         key_fields = entities[0].key_fields
         if key_fields:
@@ -213,13 +662,11 @@ class TablePersist:
             else:
                 sql_string = sql_string + sql.SQL(" NOTHING")
 
-        non_persistent_fields = entities[0].non_persistent_fields
-        if non_persistent_fields:
-            non_persistent_fields_escaped = self._escape_fields(
-                non_persistent_fields)
-            sql_string = sql_string + sql.SQL(
-                " RETURNING {non_persistent_fields}").format(
-                    non_persistent_fields=non_persistent_fields_escaped)
+        if returning is None:
+            returning = entities[0].non_persistent_fields
+        if returning:
+            sql_string = sql_string + sql.SQL(" RETURNING {fields}").format(
+                fields=self._escape_fields(returning))
         return sql_string
 
     @staticmethod
@@ -241,6 +688,73 @@ class TablePersist:
         return entities_grouped
 
 
+def _quote_table_name(schema_name: str, table_name: str) -> str:
+    return f"{quote_identifier(schema_name)}.{quote_identifier(table_name)}"
+
+
+def _get_column_names(cursor) -> Tuple[str, ...]:
+    return tuple(column.name for column in cursor.description)
+
+
+def _copy_text(value) -> str:
+    """Formats a value in the COPY text format"""
+    if value is None:
+        return "\\N"
+
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if isinstance(value, (list, tuple)):
+        value = _array_literal(value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace(
+        "\r", "\\r").replace("\t", "\\t")
+
+
+def _array_literal(values) -> str:
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append("NULL")
+        elif isinstance(value, (list, tuple)):
+            elements.append(_array_literal(value))
+        else:
+            if isinstance(value, enum.Enum):
+                value = value.value
+            elif isinstance(value, (datetime.date, datetime.time)):
+                value = value.isoformat()
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            elements.append(f'"{value}"')
+
+    return "{" + ",".join(elements) + "}"
+
+
+class _IteratorFile(io.TextIOBase):
+    """Read-only file-like object over an iterator of strings, used to stream rows into COPY"""
+
+    def __init__(self, iterator: Iterator[str]):
+        self._iterator = iterator
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._iterator)
+            except StopIteration:
+                break
+
+        if size < 0:
+            size = len(self._buffer)
+        result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return result
+
+
 class Repository(TableLoad, TablePersist, TableDelete):
 
     def __init__(self, db_conn):
@@ -0,0 +1,122 @@
+from typing import Dict, Any, Tuple, Type, Optional, Iterable, Union
+
+from gainy.data_access.models import BaseModel
+from gainy.data_access.operators import OperatorInterface
+from gainy.data_access.repository import Repository
+
+
+class UnitOfWork:
+    """
+    Session-scoped identity map over a repository.
+
+    Point lookups by equality filters are served from memory after the first query, so the same
+    (class, key) resolves to the same instance within the unit of work. Entities passed to `persist`
+    are tracked as dirty and written in one grouped `Repository.persist` call on `flush` / `commit`.
+    The identity map is cleared on commit and rollback.
+    """
+
+    def __init__(self, repository: Repository):
+        self.repository = repository
+        self._identity_map: Dict[Tuple, Optional[BaseModel]] = {}
+        self._dirty: Dict[int, BaseModel] = {}
+
+    def find_one(self, cls: Type[BaseModel],
+                 filter_by: Dict[str, Any]) -> Optional[BaseModel]:
+        key = _identity_key(cls, filter_by)
+        if key is None:
+            return self.repository.find_one(cls, filter_by)
+
+        if key in self._identity_map:
+            return self._identity_map[key]
+
+        entity = self.repository.find_one(cls, filter_by)
+        self._identity_map[key] = entity
+        if entity is not None:
+            self.register(entity)
+
+        return entity
+
+    def find_many_by_keys(self, cls: Type[BaseModel],
+                          keys: Iterable[Any]) -> Dict[Tuple, BaseModel]:
+        keys = [key if isinstance(key, tuple) else (key, ) for key in keys]
+
+        entities = {}
+        missing_keys = []
+        for key in keys:
+            identity_key = _identity_key(cls, dict(zip(cls.key_fields, key)))
+            if identity_key in self._identity_map:
+                if self._identity_map[identity_key] is not None:
+                    entities[key] = self._identity_map[identity_key]
+            else:
+                missing_keys.append(key)
+
+        if missing_keys:
+            loaded = self.repository.find_many_by_keys(cls, missing_keys)
+            for key in missing_keys:
+                entity = loaded.get(key)
+                self._identity_map[_identity_key(
+                    cls, dict(zip(cls.key_fields, key)))] = entity
+                if entity is not None:
+                    entities[key] = entity
+
+        return entities
+
+    def register(self, entity: BaseModel):
+        key_values = {
+            field: getattr(entity, field, None)
+            for field in entity.key_fields
+        }
+        if any(value is None for value in key_values.values()):
+            return
+
+        key = _identity_key(entity.__class__, key_values)
+        if key is not None:
+            self._identity_map[key] = entity
+
+    def persist(self, entities: Union[BaseModel, Iterable[BaseModel]]):
+        if isinstance(entities, BaseModel):
+            entities = [entities]
+
+        for entity in entities:
+            # the same instance must not end up twice in one INSERT ... ON CONFLICT statement
+            self._dirty[id(entity)] = entity
+            self.register(entity)
+
+    def flush(self):
+        if not self._dirty:
+            return
+
+        entities = list(self._dirty.values())
+        self._dirty = {}
+        self.repository.persist(entities)
+
+    def commit(self):
+        self.flush()
+        self.repository.commit()
+        self.clear()
+
+    def rollback(self):
+        self.clear()
+        self.repository.rollback()
+
+    def clear(self):
+        self._identity_map = {}
+        self._dirty = {}
+
+
+def _identity_key(cls: Type[BaseModel],
+                  filter_by: Dict[str, Any]) -> Optional[Tuple]:
+    if not filter_by:
+        return None
+
+    items = []
+    for field, value in filter_by.items():
+        if isinstance(value, OperatorInterface):
+            return None
+        try:
+            hash(value)
+        except TypeError:
+            return None
+        items.append((field, value))
+
+    return cls, tuple(sorted(items))
@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache, entries expire `ttl` seconds after they were loaded.
+
+    Values are loaded outside of the lock, so concurrent misses of the same key may load it more than once.
+    Once `max_size` is reached, expired entries are dropped first, then the oldest ones.
+    """
+
+    def __init__(self,
+                 ttl: float,
+                 max_size: int = 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key: (expires_at, value), in the order of loading
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        value = load()
+
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_size:
+                self._evict(now)
+            self._entries[key] = (now + self.ttl, value)
+
+        return value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = None):
+        """
+        Drops the entries whose keys match `predicate`, all entries if it is None.
+        """
+        with self._lock:
+            if predicate is None:
+                self._entries = {}
+                return
+
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _evict(self, now: float):
+        self._entries = {
+            key: entry
+            for key, entry in self._entries.items() if entry[0] > now
+        }
+        while len(self._entries) >= self.max_size:
+            del self._entries[next(iter(self._entries))]
@@ -1,5 +1,8 @@
+from typing import Dict, Hashable, Iterable, List
+
 import numpy as np
 from numpy.linalg import norm
+from scipy import sparse
 
 
 class DimVector:
@@ -37,9 +40,8 @@ class DimVector:
     @staticmethod
     def dot_product(first, second):
         result = 0.0
-        for dim in set(first.dims).intersection(second.dims):
-            result += first._coordinates.get(dim, 0) * second._coordinates.get(
-                dim, 0)
+        for dim in first._coordinates.keys() & second._coordinates.keys():
+            result += first._coordinates[dim] * second._coordinates[dim]
 
         return result
 
@@ -51,3 +53,104 @@ class DimVector:
             return 0.0
 
         return DimVector.dot_product(self, other) / self_norm / other_norm
+
+
+class DimVectorSpace:
+    """
+    DimVectorSpace interns dimension names to column indices, so that many `DimVector`s can be stacked into
+    a `scipy.sparse` CSR matrix, one vector per row, and compared all at once: `dot_product` and
+    `cosine_similarity` of a (profiles x dims) and a (tickers x dims) matrix are (profiles x tickers) arrays
+    computed with a single sparse matrix product.
+
+    Dimensions are added as vectors are converted, matrices built before a dimension was added are widened
+    on use, see `widen`.
+    """
+
+    def __init__(self, dims: Iterable[Hashable] = ()):
+        self.dims: List[Hashable] = []
+        self.dim_index: Dict[Hashable, int] = {}
+        for dim in dims:
+            self.index(dim)
+
+    def __len__(self):
+        return len(self.dims)
+
+    def index(self, dim: Hashable) -> int:
+        if dim not in self.dim_index:
+            self.dim_index[dim] = len(self.dims)
+            self.dims.append(dim)
+        return self.dim_index[dim]
+
+    def matrix(self, vectors: Iterable[DimVector]) -> sparse.csr_matrix:
+        """
+        :return: (vectors x dims) matrix, explicitly stored zero coordinates are kept as dimensions of the vector
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for vector in vectors:
+            for dim, value in vector._coordinates.items():
+                indices.append(self.index(dim))
+                data.append(value)
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.array(data, dtype=float), np.array(
+                indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, len(self.dims)))
+
+    def to_vectors(self, matrix: sparse.csr_matrix,
+                   names: Iterable) -> List[DimVector]:
+        matrix = self.widen(matrix)
+        return [
+            DimVector(
+                name,
+                zip((self.dims[i] for i in matrix.indices[start:end]),
+                    matrix.data[start:end])) for name, start, end in zip(
+                        names, matrix.indptr[:-1], matrix.indptr[1:])
+        ]
+
+    def dot_product(self, first: sparse.csr_matrix,
+                    second: sparse.csr_matrix) -> np.ndarray:
+        """
+        :return: (first rows x second rows) array of pairwise dot products
+        """
+        first = self.widen(first)
+        second = self.widen(second)
+        return (first @ second.T).toarray()
+
+    def norm(self, matrix: sparse.csr_matrix, order=2) -> np.ndarray:
+        """
+        :return: norm of every row
+        """
+        matrix = abs(self.widen(matrix))
+        if order == np.inf:
+            return matrix.max(axis=1).toarray().ravel()
+        if order == 1:
+            return np.asarray(matrix.sum(axis=1)).ravel()
+        return np.asarray(matrix.power(order).sum(axis=1)).ravel()**(1 / order)
+
+    def cosine_similarity(self,
+                          first: sparse.csr_matrix,
+                          second: sparse.csr_matrix,
+                          norm_order=2) -> np.ndarray:
+        """
+        :return: (first rows x second rows) array of pairwise cosine similarities, 0 for zero vectors
+        """
+        first_norm = self.norm(first, order=norm_order)
+        second_norm = self.norm(second, order=norm_order)
+        denominator = np.outer(first_norm, second_norm)
+
+        dot_product = self.dot_product(first, second)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(denominator == 0., 0., dot_product / denominator)
+
+    def widen(self, matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        :return: the matrix with a column for every dimension of the space
+        """
+        if matrix.shape[1] == len(self.dims):
+            return matrix
+
+        return sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr),
+                                 shape=(matrix.shape[0], len(self.dims)))
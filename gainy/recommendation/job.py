@@ -1,12 +1,31 @@
 import argparse
+import multiprocessing
+import os
 import traceback
 import time
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from gainy.data_access.connection_pool import get_connection_pool
+from gainy.data_access.instrumentation import collect_query_stats
+from gainy.recommendation.match_score_engine import MatchScoreEngine, MATCH_SCORE_ENGINE_BATCH_SIZE
 from gainy.recommendation.repository import RecommendationRepository
+from gainy.recommendation.serivce import invalidate_recommended_collections_cache
 from gainy.utils import db_connect, get_logger
 
 logger = get_logger(__name__)
 
+ENGINE_SQL = "sql"
+ENGINE_NUMPY = "numpy"
+# generate_ticker_match_scores_from_features.sql against the ticker feature snapshot
+ENGINE_SQL_FEATURES = "sql_features"
+
+# Kinds of batches, processed in this order
+BATCH_TICKERS = "tickers"
+BATCH_PROFILES = "profiles"
+BATCH_COLLECTIONS = "collections"
+
 
 def split_in_chunks(lst, batch_size):
     """Yield successive n-sized chunks from lst."""
@@ -14,60 +33,289 @@ def split_in_chunks(lst, batch_size):
         yield lst[i:i + batch_size]
 
 
+class MatchScoreBatch(NamedTuple):
+    """
+    A batch of profiles to compute match scores for, picklable so that it can be sent to worker processes.
+    """
+    kind: str
+    profile_ids: List[int]
+    # BATCH_TICKERS: the changed tickers
+    tickers: Optional[List[str]] = None
+    # BATCH_COLLECTIONS: only recompute these collections, all of them if None
+    collection_uniq_ids: Optional[List[str]] = None
+
+
+class MatchScoreBatchRunner:
+
+    def __init__(self, repo: RecommendationRepository, engine: str):
+        self.repo = repo
+        self.engine = engine
+        self._match_score_engines: Dict[tuple, MatchScoreEngine] = {}
+
+    def run(self, batch: MatchScoreBatch):
+        start_time = time.time()
+
+        if batch.kind == BATCH_TICKERS:
+            self._generate_ticker_match_scores(batch.profile_ids,
+                                               batch.tickers)
+            logger.info(
+                "Calculated ticker match scores for tickers %s and profiles %s in %f",
+                json.dumps(batch.tickers), json.dumps(batch.profile_ids),
+                time.time() - start_time)
+        elif batch.kind == BATCH_PROFILES:
+            self._generate_ticker_match_scores(batch.profile_ids)
+            logger.info("Calculated ticker match scores for profiles %s in %f",
+                        json.dumps(batch.profile_ids),
+                        time.time() - start_time)
+        elif batch.kind == BATCH_COLLECTIONS:
+            if batch.collection_uniq_ids is None:
+                self.repo.generate_collection_match_scores(batch.profile_ids)
+                logger.info(
+                    "Calculated collection match scores for profiles %s in %f",
+                    json.dumps(batch.profile_ids),
+                    time.time() - start_time)
+            else:
+                self.repo.generate_collection_match_scores(
+                    batch.profile_ids, batch.collection_uniq_ids)
+                logger.info(
+                    "Calculated match scores of collections %s for profiles %s in %f",
+                    json.dumps(batch.collection_uniq_ids),
+                    json.dumps(batch.profile_ids),
+                    time.time() - start_time)
+        else:
+            raise Exception(f"Unsupported batch kind {batch.kind}")
+
+        return time.time() - start_time
+
+    def _generate_ticker_match_scores(self,
+                                      profile_ids: List[int],
+                                      tickers: List[str] = None):
+        if self.engine == ENGINE_SQL_FEATURES:
+            self.repo.generate_ticker_match_scores(profile_ids,
+                                                   tickers=tickers,
+                                                   from_features=True)
+            return
+
+        if self.engine != ENGINE_NUMPY:
+            if tickers:
+                self.repo.generate_ticker_match_scores(profile_ids,
+                                                       tickers=tickers)
+            else:
+                self.repo.generate_ticker_match_scores(profile_ids)
+            return
+
+        # ticker features are loaded once per set of tickers
+        key = tuple(tickers or ())
+        if key not in self._match_score_engines:
+            self._match_score_engines[key] = MatchScoreEngine(
+                self.repo, tickers)
+        self._match_score_engines[key].generate_ticker_match_scores(
+            profile_ids)
+
+
+class MatchScoreProgress:
+    """
+    Batches, profiles and time spent per worker process.
+    """
+
+    def __init__(self):
+        self._stats = {}
+
+    def record(self, worker: int, profiles_count: int, duration: float):
+        stats = self._stats.setdefault(worker, {
+            "batches": 0,
+            "profiles": 0,
+            "duration": 0.,
+        })
+        stats["batches"] += 1
+        stats["profiles"] += profiles_count
+        stats["duration"] += duration
+
+        logger.info("Worker %d processed %d batches, %d profiles in %f",
+                    worker,
+                    stats["batches"],
+                    stats["profiles"],
+                    stats["duration"],
+                    extra={
+                        "worker": worker,
+                        **stats
+                    })
+
+    def get(self) -> Dict[int, dict]:
+        return {worker: dict(i) for worker, i in self._stats.items()}
+
+
+# Set up in each worker process by _init_worker
+_worker_runner: Optional[MatchScoreBatchRunner] = None
+
+
+def _init_worker(engine: str):
+    global _worker_runner
+    # each worker has its own connection, closed when the worker process exits
+    repo = RecommendationRepository(db_connect())
+    _worker_runner = MatchScoreBatchRunner(repo, engine)
+
+
+def _run_worker_batch(batch: MatchScoreBatch) -> Tuple[int, int, float]:
+    # every batch is committed by the worker, the job saves the states once all of them are done
+    with _worker_runner.repo.db_conn:
+        duration = _worker_runner.run(batch)
+    return os.getpid(), len(batch.profile_ids), duration
+
+
 class MatchScoreJob:
 
-    def __init__(self, repo: RecommendationRepository, batch_size: int):
+    def __init__(self,
+                 repo: RecommendationRepository,
+                 batch_size: int,
+                 engine: str = ENGINE_SQL,
+                 incremental: bool = False,
+                 workers: int = 1):
+        """
+        :param workers: number of worker processes with their own connections batches are distributed across,
+          batches are processed in the current process and transaction if 1
+        """
         self.repo = repo
         self.batch_size = batch_size
+        self.engine = engine
+        self.incremental = incremental
+        self.workers = workers
+        self.progress = MatchScoreProgress()
+        self._runner = MatchScoreBatchRunner(repo, engine)
 
     def run(self):
         tickers_to_update = self.repo.get_tickers_to_update_ms()
         profiles_to_update = self.repo.get_profiles_to_update_ms()
 
-        self._calculate_for_tickers(tickers_to_update)
-        self._calculate_for_profiles(profiles_to_update)
-        self._calculate_for_collections()
+        if self.engine == ENGINE_SQL_FEATURES:
+            # the snapshot has its own state hashes: it may be behind even if no ticker changed since the last run
+            self.repo.refresh_ticker_match_score_features()
+            # visible to the workers' connections
+            self.repo.commit()
+
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.engine, ))
+
+        try:
+            # changed profiles are fully recomputed below
+            self._execute(
+                executor,
+                self._ticker_batches(tickers_to_update,
+                                     set(profiles_to_update)))
+            self._execute(executor, self._profile_batches(profiles_to_update))
+
+            if self.incremental:
+                collections_to_update = set(
+                    self.repo.get_collections_to_update_ms())
+                collections_to_update.update(
+                    self.repo.get_ticker_collections(tickers_to_update))
+                self._execute(
+                    executor,
+                    self._changed_collection_batches(profiles_to_update,
+                                                     collections_to_update))
+            else:
+                self._execute(executor, self._collection_batches())
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
 
         self.repo.save_tickers_state()
         self.repo.save_profiles_state()
+        self.repo.save_collections_state()
+
+    def _execute(self, executor: Optional[ProcessPoolExecutor],
+                 batches: Iterable[MatchScoreBatch]):
+        """
+        Processes all batches of a phase, returns once all of them are done.
+        """
+        if executor is None:
+            for batch in batches:
+                duration = self._runner.run(batch)
+                self.progress.record(os.getpid(), len(batch.profile_ids),
+                                     duration)
+                self._batch_done(batch)
+            return
+
+        futures = {
+            executor.submit(_run_worker_batch, batch): batch
+            for batch in batches
+        }
+        try:
+            for future in as_completed(futures):
+                self.progress.record(*future.result())
+                self._batch_done(futures[future])
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    @staticmethod
+    def _batch_done(batch: MatchScoreBatch):
+        if batch.kind == BATCH_COLLECTIONS:
+            # recommendations cached by this process
+            invalidate_recommended_collections_cache(*batch.profile_ids)
+
+    def _ticker_batch_size(self) -> int:
+        if self.engine == ENGINE_NUMPY:
+            return MATCH_SCORE_ENGINE_BATCH_SIZE
+        return self.batch_size
 
-    def _calculate_for_tickers(self, tickers):
+    def _ticker_batches(self, tickers,
+                        skip_profile_ids: set) -> Iterator[MatchScoreBatch]:
         if not tickers:
             return
 
         for profile_ids_batch in self.repo.read_ms_batch_profile_ids(
-                self.batch_size):
-            start_time = time.time()
-            self.repo.generate_ticker_match_scores(profile_ids_batch,
-                                                   tickers=tickers)
+                self._ticker_batch_size()):
+            profile_ids_batch = [
+                profile_id for profile_id in profile_ids_batch
+                if profile_id not in skip_profile_ids
+            ]
+            if profile_ids_batch:
+                yield MatchScoreBatch(BATCH_TICKERS,
+                                      profile_ids_batch,
+                                      tickers=tickers)
 
-            logger.info(
-                "Calculated ticker match scores for tickers %s and profiles %s in %f",
-                json.dumps(tickers), json.dumps(profile_ids_batch),
-                time.time() - start_time)
+    def _profile_batches(self, profile_ids) -> Iterator[MatchScoreBatch]:
+        for profile_ids_batch in split_in_chunks(profile_ids,
+                                                 self._ticker_batch_size()):
+            yield MatchScoreBatch(BATCH_PROFILES, profile_ids_batch)
 
-    def _calculate_for_collections(self):
+    def _collection_batches(self) -> Iterator[MatchScoreBatch]:
         for profile_ids_batch in self.repo.read_ms_batch_profile_ids(
                 self.batch_size):
-            start_time = time.time()
-            self.repo.generate_collection_match_scores(profile_ids_batch)
+            yield MatchScoreBatch(BATCH_COLLECTIONS, profile_ids_batch)
 
-            logger.info(
-                "Calculated collection match scores for profiles %s in %f",
-                json.dumps(profile_ids_batch),
-                time.time() - start_time)
+    def _changed_collection_batches(
+            self, profile_ids,
+            collection_uniq_ids: set) -> Iterator[MatchScoreBatch]:
+        """
+        Recomputes all collections of the changed profiles, and for the rest of the profiles only the collections
+        with changed weights or changed tickers.
+        """
+        for profile_ids_batch in split_in_chunks(profile_ids, self.batch_size):
+            yield MatchScoreBatch(BATCH_COLLECTIONS, profile_ids_batch)
 
-    def _calculate_for_profiles(self, profile_ids):
-        if not profile_ids:
+        if not collection_uniq_ids:
             return
 
-        for profile_ids_batch in split_in_chunks(profile_ids, self.batch_size):
-            start_time = time.time()
-            self.repo.generate_ticker_match_scores(profile_ids_batch)
-
-            logger.info("Calculated ticker match scores for profiles %s in %f",
-                        json.dumps(profile_ids_batch),
-                        time.time() - start_time)
+        collection_uniq_ids = sorted(collection_uniq_ids)
+        skip_profile_ids = set(profile_ids)
+        for profile_ids_batch in self.repo.read_ms_batch_profile_ids(
+                self.batch_size):
+            profile_ids_batch = [
+                profile_id for profile_id in profile_ids_batch
+                if profile_id not in skip_profile_ids
+            ]
+            if profile_ids_batch:
+                yield MatchScoreBatch(BATCH_COLLECTIONS,
+                                      profile_ids_batch,
+                                      collection_uniq_ids=collection_uniq_ids)
 
 
 def cli(args=None):
@@ -77,13 +325,36 @@ def cli(args=None):
                         dest='batch_size',
                         type=int,
                         default=15)
+    parser.add_argument(
+        '--engine',
+        dest='engine',
+        choices=[ENGINE_SQL, ENGINE_SQL_FEATURES, ENGINE_NUMPY],
+        default=ENGINE_SQL,
+        help=
+        'Compute ticker match scores in SQL, in SQL against the ticker feature snapshot or in-process with NumPy, '
+        'batch_size does not apply to numpy')
+    parser.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        help=
+        'Only recompute collection match scores affected by changed profiles, tickers and collections'
+    )
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        type=int,
+        default=1,
+        help='Number of worker processes, each with its own db connection')
     args = parser.parse_args(args)
 
     try:
-        with db_connect() as db_conn:
-            repo = RecommendationRepository(db_conn)
-            job = MatchScoreJob(repo, args.batch_size)
-            job.run()
+        with collect_query_stats("recommendation"):
+            with get_connection_pool().connection() as db_conn:
+                repo = RecommendationRepository(db_conn)
+                job = MatchScoreJob(repo, args.batch_size, args.engine,
+                                    args.incremental, args.workers)
+                job.run()
 
     except Exception as e:
         traceback.print_exc()
@@ -1,9 +1,10 @@
 from enum import Enum
 from math import sqrt
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from collections import Counter
 import numpy as np
-from gainy.recommendation.core import DimVector
+from scipy import sparse
+from gainy.recommendation.core import DimVector, DimVectorSpace
 
 
 # INDUSTRY SIMILARITY SCORE
@@ -38,18 +39,104 @@ def get_interest_similarity(
     return interest_score, list(interest_matches)
 
 
+def get_interest_similarities(
+        profiles_interest_vs: List[List[DimVector]],
+        ticker_industry_vs: List[DimVector],
+        max_matches: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Batch version of `get_interest_similarity`: scores N profiles against M tickers at once.
+
+    :param profiles_interest_vs: interest vectors of each profile, named with the interest id
+    :param max_matches: number of interest matches returned per pair, the max number of a profile's interests
+      by default
+    :return: (N x M) interest similarities and (N x M x max_matches) ids of the matching interests ordered like
+      in `get_interest_similarity`, padded with -1
+    """
+    profiles_count = len(profiles_interest_vs)
+    tickers_count = len(ticker_industry_vs)
+    interest_counts = [len(vs) for vs in profiles_interest_vs]
+    if max_matches is None:
+        max_matches = max(interest_counts, default=0)
+
+    interests = [v for vs in profiles_interest_vs for v in vs]
+    interest_names = np.array([v.name for v in interests], dtype=np.int64)
+
+    space = DimVectorSpace()
+    interests_m = space.matrix(interests)
+    tickers_m = space.matrix(ticker_industry_vs)
+    interests_m = space.widen(interests_m)
+
+    # (profiles x dims) number of the profile's interests each industry belongs to
+    presence = sparse.csr_matrix((np.ones_like(
+        interests_m.data), interests_m.indices, interests_m.indptr),
+                                 shape=interests_m.shape)
+    ownership = sparse.csr_matrix(
+        (np.ones(len(interests)),
+         (np.repeat(np.arange(profiles_count),
+                    interest_counts), np.arange(len(interests)))),
+        shape=(profiles_count, len(interests)))
+    industry_counts = (ownership @ presence).tocsr()
+    industry_counts.sum_duplicates()
+
+    # normalized_profile_industries_vector, per row
+    row_lengths = np.diff(industry_counts.indptr)
+    rows = np.repeat(np.arange(profiles_count), row_lengths)
+    row_min = np.full(profiles_count, np.inf)
+    np.minimum.at(row_min, rows, industry_counts.data)
+    row_max = np.zeros(profiles_count)
+    np.maximum.at(row_max, rows, industry_counts.data)
+    sqrt_min = np.sqrt(row_min[rows])
+    normed_industry_counts = sparse.csr_matrix(
+        ((1.0 + np.sqrt(industry_counts.data) - sqrt_min) /
+         (1.0 + np.sqrt(row_max[rows]) - sqrt_min), industry_counts.indices,
+         industry_counts.indptr),
+        shape=industry_counts.shape)
+
+    ticker_norms = space.norm(tickers_m, order=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarities = space.dot_product(normed_industry_counts,
+                                         tickers_m) / ticker_norms
+    has_dims = np.outer(row_lengths > 0, np.diff(tickers_m.indptr) > 0)
+    similarities = np.where(has_dims, similarities, 0.)
+
+    matches = np.full((profiles_count, tickers_count, max_matches),
+                      -1,
+                      dtype=np.int64)
+    interest_dot_products = space.dot_product(interests_m, tickers_m)
+    offsets = np.cumsum([0] + interest_counts)
+    for i in range(profiles_count):
+        start, end = offsets[i], offsets[i + 1]
+        if start == end or not max_matches:
+            continue
+
+        dot_products = interest_dot_products[start:end]
+        names = np.broadcast_to(interest_names[start:end, np.newaxis],
+                                dot_products.shape)
+        # the highest dot product first, ties broken by the highest id
+        order = np.lexsort((-names, -dot_products), axis=0)[:max_matches]
+        top_names = np.take_along_axis(names, order, axis=0)
+        top_dot_products = np.take_along_axis(dot_products, order, axis=0)
+        matches[i, :, :order.shape[0]] = np.where(top_dot_products > 0,
+                                                  top_names, -1).T
+
+    return similarities, matches
+
+
 def normalized_profile_industries_vector(vector: DimVector) -> DimVector:
     if len(vector.dims) == 0:
         return vector
 
-    max_value = max(vector.values)
-    min_value = min(vector.values)
-    denominator = 1.0 + sqrt(max_value) - sqrt(min_value)
+    return DimVector(
+        vector.name, zip(vector.dims,
+                         _normalize_industry_counts(vector.values)))
+
 
-    new_values = (1.0 + np.sqrt(vector.values) -
-                  np.sqrt(min_value)) / denominator
+def _normalize_industry_counts(values: np.ndarray) -> np.ndarray:
+    max_value = max(values)
+    min_value = min(values)
+    denominator = 1.0 + sqrt(max_value) - sqrt(min_value)
 
-    return DimVector(vector.name, zip(vector.dims, new_values))
+    return (1.0 + np.sqrt(values) - np.sqrt(min_value)) / denominator
 
 
 # RISK SIMILARITY SCORE
@@ -91,6 +178,29 @@ def get_risk_similarity(profile_categories: DimVector,
     return 1.0 - abs(profile_risk_score - ticker_risk_score)
 
 
+def get_risk_similarities(profile_category_vs: List[DimVector],
+                          ticker_category_vs: List[DimVector],
+                          risk_mapping: Dict[str, int]) -> np.ndarray:
+    """
+    Batch version of `get_risk_similarity`.
+
+    :return: (N profiles x M tickers) risk similarities
+    """
+    profile_risk_scores = np.array([
+        get_categories_risk_score(v, risk_mapping) for v in profile_category_vs
+    ],
+                                   dtype=float)
+    ticker_risk_scores = np.array([
+        get_categories_risk_score(v, risk_mapping) for v in ticker_category_vs
+    ],
+                                  dtype=float)
+
+    similarities = 1.0 - np.abs(profile_risk_scores[:, np.newaxis] -
+                                ticker_risk_scores[np.newaxis, :])
+    # profiles or tickers without risk scores
+    return np.nan_to_num(similarities, nan=0.0)
+
+
 # CATEGORY SIMILARITY SCORE
 
 
@@ -110,6 +220,54 @@ def get_category_similarity(
     return category_similarity, category_matches
 
 
+def get_category_similarities(
+        profile_category_vs: List[DimVector],
+        ticker_category_vs: List[DimVector],
+        max_matches: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Batch version of `get_category_similarity`: scores N profiles against M tickers at once.
+
+    :param max_matches: number of category matches returned per pair, the max number of a profile's categories
+      by default
+    :return: (N x M) category similarities and (N x M x max_matches) ids of the common categories ordered like
+      in `get_category_similarity`, padded with -1
+    """
+    if max_matches is None:
+        max_matches = max((len(v.dims) for v in profile_category_vs),
+                          default=0)
+
+    space = DimVectorSpace()
+    profiles_m = space.matrix(profile_category_vs)
+    tickers_m = space.matrix(ticker_category_vs)
+    similarities = space.cosine_similarity(profiles_m, tickers_m)
+
+    ticker_presence = np.zeros((len(ticker_category_vs), len(space)),
+                               dtype=bool)
+    ticker_presence[np.repeat(np.arange(len(ticker_category_vs)
+                                        ), np.diff(tickers_m.indptr)),
+                    tickers_m.indices] = True
+
+    matches = np.full(
+        (len(profile_category_vs), len(ticker_category_vs), max_matches),
+        -1,
+        dtype=np.int64)
+    for i, profile_category_v in enumerate(profile_category_vs):
+        dims = sorted(profile_category_v.dims)
+        if not dims or not max_matches:
+            continue
+
+        common = ticker_presence[:, [space.dim_index[dim] for dim in dims]]
+        category_ids = np.where(
+            common, np.array([int(dim) for dim in dims], dtype=np.int64), -1)
+        # common categories first, in the order of the sorted dims
+        order = np.argsort(~common, axis=1, kind="stable")[:, :max_matches]
+        matches[i, :, :order.shape[1]] = np.take_along_axis(category_ids,
+                                                            order,
+                                                            axis=1)
+
+    return similarities, matches
+
+
 # GENERAL SIMILARITY SCORE
 
 
@@ -156,6 +314,27 @@ class MatchScoreExplainer:
     def __init__(self, config):
         self.config = config
 
+        # thresholds and levels of each component for np.digitize, intervals are expected to be contiguous
+        self._bins = {}
+        for component, intervals in config.items():
+            intervals = sorted(intervals,
+                               key=lambda i: -np.inf if i[0] is None else i[0])
+            self._bins[component] = (np.array([i[0] for i in intervals[1:]]),
+                                     np.array([i[2].value for i in intervals]))
+
+    def levels(self, similarities: np.ndarray,
+               component: MatchScoreComponent) -> np.ndarray:
+        """
+        Batch version of `_apply_explanation_config`.
+
+        :return: SimilarityLevel values of the similarities
+        """
+        similarities = np.asarray(similarities, dtype=float)
+        bins, levels = self._bins[component]
+        result = levels[np.digitize(similarities, bins)]
+        return np.where(np.isnan(similarities), SimilarityLevel.LOW.value,
+                        result).astype(np.int8)
+
     def _apply_explanation_config(self, similarity,
                                   component) -> SimilarityLevel:
 
@@ -184,9 +363,52 @@ class MatchScoreExplainer:
             interest_level,
             interest_matches if interest_level.value > 0 else [])
 
+    def explanations(self, risk_similarities: np.ndarray,
+                     category_similarities: np.ndarray,
+                     category_matches: np.ndarray,
+                     interest_similarities: np.ndarray,
+                     interest_matches: np.ndarray) -> np.ndarray:
+        """
+        Batch version of `explanation`, takes the results of the batch similarity functions.
+
+        :return: structured array of the fields of MatchScoreExplanation, levels are SimilarityLevel values
+          and matches of low level components are -1
+        """
+        risk_similarities = np.asarray(risk_similarities, dtype=float)
+        category_matches = np.asarray(category_matches, dtype=np.int64)
+        interest_matches = np.asarray(interest_matches, dtype=np.int64)
+
+        dtype = np.dtype([
+            ("risk_level", np.int8),
+            ("risk_similarity", float),
+            ("category_level", np.int8),
+            ("category_matches", np.int64, category_matches.shape[-1:]),
+            ("interest_level", np.int8),
+            ("interest_matches", np.int64, interest_matches.shape[-1:]),
+        ])
+        result = np.empty(risk_similarities.shape, dtype=dtype)
+
+        result["risk_level"] = self.levels(risk_similarities,
+                                           MatchScoreComponent.RISK)
+        result["risk_similarity"] = risk_similarities
+        result["category_level"] = self.levels(category_similarities,
+                                               MatchScoreComponent.CATEGORY)
+        result["category_matches"] = np.where(
+            result["category_level"][..., np.newaxis] > 0, category_matches,
+            -1)
+        result["interest_level"] = self.levels(interest_similarities,
+                                               MatchScoreComponent.INTEREST)
+        result["interest_matches"] = np.where(
+            result["interest_level"][..., np.newaxis] > 0, interest_matches,
+            -1)
+
+        return result
+
 
 class MatchScore:
 
+    similarity_explainer = MatchScoreExplainer(EXPLANATION_CONFIG)
+
     def __init__(self, similarity: float, risk_similarity: float,
                  category_similarity: float, category_matches: List[int],
                  interest_similarity: float, interest_matches: List[int],
@@ -203,8 +425,6 @@ class MatchScore:
 
         self.matches_portfolio = matches_portfolio
 
-        self.similarity_explainer = MatchScoreExplainer(EXPLANATION_CONFIG)
-
     def match_score(self):
         return round(self.similarity * 100)
 
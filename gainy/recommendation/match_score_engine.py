@@ -0,0 +1,306 @@
+import os
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from gainy.recommendation.repository import RecommendationRepository
+from gainy.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Number of profiles whose match scores are written at once
+MATCH_SCORE_ENGINE_BATCH_SIZE = int(
+    os.getenv("MATCH_SCORE_ENGINE_BATCH_SIZE", 1000))
+# Number of profiles scored at once, bounds the (profiles x tickers) arrays held in memory
+MATCH_SCORE_ENGINE_CHUNK_SIZE = int(
+    os.getenv("MATCH_SCORE_ENGINE_CHUNK_SIZE", 100))
+
+# The constants below mirror generate_ticker_match_scores.sql
+RISK_WEIGHT = 0.6
+INTEREST_WEIGHT = 0.3
+CATEGORY_WEIGHT = 0.1
+SIGMOID_BETA = 3
+# Profile risk score: (ideal ticker risk score, penalty per unit of distance)
+PROFILE_RISK_TARGETS = {1: (0.25, 1.), 2: (0.5, 1.5), 3: (0.75, 1.)}
+# Number of matching categories / interests reported per ticker
+TOP_MATCHES = 2
+
+
+def sigmoid(x: np.ndarray, beta: float) -> np.ndarray:
+    """
+    Same as public.sigmoid.
+    """
+    return 1 / (1 + ((x + 1e-10) / (1 - x + 1e-10))**(-beta))
+
+
+def _fits(similarity: np.ndarray) -> np.ndarray:
+    return (similarity > 1 / 3.).astype(int) + (similarity
+                                                > 2 / 3.).astype(int)
+
+
+class SimDifMatrix:
+    """
+    `sim_dif` of (feature, ticker) pairs as a dense (features x tickers) array, NaN where a pair has no value.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, str, Optional[float]]],
+                 symbol_index: Dict[str, int]):
+        rows = [row for row in rows if row[1] in symbol_index]
+        self.feature_ids = sorted({feature_id for feature_id, _, _ in rows})
+        self.feature_index = {
+            feature_id: i
+            for i, feature_id in enumerate(self.feature_ids)
+        }
+
+        self.values = np.full((len(self.feature_ids), len(symbol_index)),
+                              np.nan)
+        for feature_id, symbol, sim_dif in rows:
+            if sim_dif is None:
+                continue
+            i = self.feature_index[feature_id]
+            j = symbol_index[symbol]
+            # several rows of the same pair are aggregated with max, like in the SQL
+            if np.isnan(self.values[i, j]) or self.values[i, j] < sim_dif:
+                self.values[i, j] = sim_dif
+
+    def similarities(
+        self, profiles_feature_ids: List[Iterable[int]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (profiles x tickers) arrays of the max sim_dif over the profile's features (-1 if none) and of
+          the up to TOP_MATCHES features with the highest positive sim_dif, formatted as JSON arrays
+        """
+        membership = self._membership(profiles_feature_ids)
+        shape = (TOP_MATCHES, membership.shape[0], self.values.shape[1])
+        top_values = np.full(shape, -np.inf)
+        top_indices = np.full(shape, -1)
+
+        # features are inserted in ascending id order, so ties keep the lowest id first like a stable sort
+        for i in np.flatnonzero(membership.any(axis=0)):
+            rows = np.flatnonzero(membership[:, i])
+            values = np.broadcast_to(self.values[i],
+                                     (len(rows), self.values.shape[1]))
+            values = np.where(np.isnan(values), -np.inf, values)
+            indices = np.full(values.shape, i)
+
+            rows_top_values = top_values[:, rows]
+            rows_top_indices = top_indices[:, rows]
+            for k in range(TOP_MATCHES):
+                # the greater value takes the k-th place, the other one competes for the next place
+                is_greater = values > rows_top_values[k]
+                displaced_values = np.where(is_greater, rows_top_values[k],
+                                            values)
+                displaced_indices = np.where(is_greater, rows_top_indices[k],
+                                             indices)
+                rows_top_values[k] = np.where(is_greater, values,
+                                              rows_top_values[k])
+                rows_top_indices[k] = np.where(is_greater, indices,
+                                               rows_top_indices[k])
+                values, indices = displaced_values, displaced_indices
+            top_values[:, rows] = rows_top_values
+            top_indices[:, rows] = rows_top_indices
+
+        similarity = top_values[0]
+        similarity[np.isneginf(similarity)] = -1.
+
+        return similarity, self._format_matches(top_values, top_indices)
+
+    def has_values(self,
+                   profiles_feature_ids: List[Iterable[int]]) -> np.ndarray:
+        """
+        :return: (profiles x tickers) array of whether any of the profile's features has a sim_dif for the ticker
+        """
+        membership = self._membership(profiles_feature_ids)
+        result = np.zeros((membership.shape[0], self.values.shape[1]),
+                          dtype=bool)
+        has_value = ~np.isnan(self.values)
+        for i in np.flatnonzero(membership.any(axis=0)):
+            rows = np.flatnonzero(membership[:, i])
+            result[rows] |= has_value[i]
+        return result
+
+    def _membership(self,
+                    profiles_feature_ids: List[Iterable[int]]) -> np.ndarray:
+        membership = np.zeros(
+            (len(profiles_feature_ids), len(self.feature_ids)), dtype=bool)
+        for row, feature_ids in enumerate(profiles_feature_ids):
+            for feature_id in feature_ids:
+                i = self.feature_index.get(feature_id)
+                if i is not None:
+                    membership[row, i] = True
+        return membership
+
+    def _format_matches(self, top_values: np.ndarray,
+                        top_indices: np.ndarray) -> np.ndarray:
+        # positive matches are a prefix of the top, encode it as a single number per (profile, ticker)
+        base = len(self.feature_ids) + 1
+        codes = np.zeros(top_values.shape[1:], dtype=np.int64)
+        for k in range(TOP_MATCHES):
+            codes += np.where(top_values[k] > 0, top_indices[k] + 1,
+                              0) * base**k
+
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        formatted = np.empty(len(unique_codes), dtype=object)
+        for n, code in enumerate(unique_codes.tolist()):
+            ids = []
+            while code:
+                code, index = divmod(code, base)
+                ids.append(str(self.feature_ids[index - 1]))
+            formatted[n] = "[" + ", ".join(ids) + "]"
+
+        return formatted[inverse.reshape(codes.shape)]
+
+
+class TickerFeatures:
+    """
+    Risk scores and category / interest sim_dif of the tickers match scores are calculated for,
+    loaded once per engine.
+    """
+
+    def __init__(self, repo: RecommendationRepository,
+                 tickers: Optional[List[str]]):
+        rows = repo.read_match_score_tickers(tickers)
+        self.symbols = [symbol for symbol, _ in rows]
+        self.symbol_index = {
+            symbol: i
+            for i, symbol in enumerate(self.symbols)
+        }
+        # None becomes NaN
+        self.risk_scores = np.array([risk_score for _, risk_score in rows],
+                                    dtype=float)
+
+        self.categories = SimDifMatrix(
+            repo.read_ticker_categories_sim_dif(tickers), self.symbol_index)
+        self.interests = SimDifMatrix(
+            repo.read_ticker_interests_sim_dif(tickers), self.symbol_index)
+
+
+class ProfileMatchScores(NamedTuple):
+    """
+    Match score components of a chunk of profiles, (profiles x tickers) arrays.
+    """
+    match_score: np.ndarray
+    risk_similarity: np.ndarray
+    category_similarity: np.ndarray
+    interest_similarity: np.ndarray
+    category_matches: np.ndarray
+    interest_matches: np.ndarray
+    matches_portfolio: np.ndarray
+
+
+class MatchScoreEngine:
+    """
+    Computes ticker match scores in-process with NumPy, as an alternative to generate_ticker_match_scores.sql.
+    Ticker features are loaded once, then profiles are scored as (profiles x tickers) arrays
+    of MATCH_SCORE_ENGINE_CHUNK_SIZE profiles and bulk-written with COPY per batch.
+    """
+
+    def __init__(self,
+                 repo: RecommendationRepository,
+                 tickers: List[str] = None,
+                 batch_size: int = MATCH_SCORE_ENGINE_BATCH_SIZE,
+                 ticker_features: TickerFeatures = None):
+        """
+        :param ticker_features: already loaded features of `tickers`, loaded on first use otherwise
+        """
+        self.repo = repo
+        self.tickers = tickers
+        self.batch_size = batch_size
+        self._ticker_features = ticker_features
+
+    @property
+    def ticker_features(self) -> TickerFeatures:
+        if self._ticker_features is None:
+            self._ticker_features = TickerFeatures(self.repo, self.tickers)
+        return self._ticker_features
+
+    def generate_ticker_match_scores(self, profile_ids: List[int]):
+        """
+        Same effect as RecommendationRepository.generate_ticker_match_scores with the engine's tickers.
+        """
+        for l_bound in range(0, len(profile_ids), self.batch_size):
+            batch = profile_ids[l_bound:l_bound + self.batch_size]
+            self.repo.upsert_ticker_match_scores(self.compute(batch))
+            if not self.tickers:
+                self.repo.cleanup_ticker_match_scores(batch)
+            self.repo.update_top_20_collections(batch)
+
+    def compute(self, profile_ids: List[int]) -> Iterator[tuple]:
+        """
+        Loads the profiles eagerly, so that the returned rows can be streamed into COPY on the same connection.
+
+        :return: rows in TICKER_MATCH_SCORE_FIELDS order for every profile with scoring settings and every ticker
+        """
+        features = self.ticker_features
+        if not features.symbols:
+            return iter(())
+
+        profiles = self.repo.read_match_score_profiles(profile_ids)
+        return self._iterate_rows(features, profiles)
+
+    def score_profiles(self, profiles: List[tuple]) -> ProfileMatchScores:
+        """
+        :param profiles: rows of RecommendationRepository.read_match_score_profiles
+        :return: match scores of the profiles against every ticker, in `ticker_features.symbols` order
+        """
+        features = self.ticker_features
+
+        risk_similarity = self._risk_similarity(
+            [risk_score for _, risk_score, _, _, _ in profiles])
+
+        category_similarity, category_matches = features.categories.similarities(
+            [category_ids for _, _, category_ids, _, _ in profiles])
+        category_similarity = category_similarity / 2 + 0.5
+
+        interest_similarity, interest_matches = features.interests.similarities(
+            [interest_ids for _, _, _, interest_ids, _ in profiles])
+        interest_similarity = interest_similarity / 2 + 0.5
+
+        matches_portfolio = features.interests.has_values([
+            portfolio_interest_ids
+            for _, _, _, _, portfolio_interest_ids in profiles
+        ])
+
+        match_score = np.rint(
+            (sigmoid(risk_similarity, SIGMOID_BETA) * RISK_WEIGHT +
+             sigmoid(interest_similarity, SIGMOID_BETA) * INTEREST_WEIGHT +
+             sigmoid(category_similarity, SIGMOID_BETA) * CATEGORY_WEIGHT) *
+            100).astype(int)
+
+        return ProfileMatchScores(match_score, risk_similarity,
+                                  category_similarity, interest_similarity,
+                                  category_matches, interest_matches,
+                                  matches_portfolio)
+
+    def _iterate_rows(self, features: TickerFeatures,
+                      profiles: list) -> Iterator[tuple]:
+        for l_bound in range(0, len(profiles), MATCH_SCORE_ENGINE_CHUNK_SIZE):
+            chunk = profiles[l_bound:l_bound + MATCH_SCORE_ENGINE_CHUNK_SIZE]
+            scores = self.score_profiles(chunk)
+            risk_levels = _fits(scores.risk_similarity)
+            category_levels = _fits(scores.category_similarity)
+            interest_levels = _fits(scores.interest_similarity)
+
+            for i, profile in enumerate(chunk):
+                yield from zip(
+                    [profile[0]] * len(features.symbols), features.symbols,
+                    scores.match_score[i].tolist(), risk_levels[i].tolist(),
+                    scores.risk_similarity[i].tolist(),
+                    category_levels[i].tolist(), interest_levels[i].tolist(),
+                    scores.category_matches[i].tolist(),
+                    scores.interest_matches[i].tolist(),
+                    scores.category_similarity[i].tolist(),
+                    scores.interest_similarity[i].tolist(),
+                    scores.matches_portfolio[i].tolist())
+
+    def _risk_similarity(self, risk_scores: List[Optional[int]]) -> np.ndarray:
+        """
+        :return: (profiles x tickers) risk similarity, 0 for profiles without a known risk score
+        """
+        targets = np.array([
+            PROFILE_RISK_TARGETS.get(risk_score, (np.nan, np.nan))
+            for risk_score in risk_scores
+        ]).reshape(len(risk_scores), 2)
+        similarity = 1 - np.abs(self.ticker_features.risk_scores[None, :] -
+                                targets[:, :1]) * targets[:, 1:]
+        return np.nan_to_num(similarity, nan=0.)
@@ -11,6 +11,7 @@ class ProfileRecommendationsMetadata(BaseModel, ResourceVersion):
     updated_at = None
 
     key_fields = ["profile_id"]
+    version_field = "recommendations_version"
 
     db_excluded_fields = ["updated_at"]
     non_persistent_fields = ["updated_at"]
@@ -0,0 +1,129 @@
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from gainy.recommendation.cache import TTLCache
+from gainy.recommendation.match_score_engine import MatchScoreEngine, TickerFeatures
+from gainy.recommendation.repository import RecommendationRepository
+from gainy.utils import get_logger
+
+logger = get_logger(__name__)
+
+# How long ticker features and collection weights are kept in the process, in seconds
+PROFILE_SCORER_DATA_TTL = float(os.getenv("PROFILE_SCORER_DATA_TTL", 3600))
+
+
+class CollectionWeights:
+    """
+    Weights of the tickers of the recommendable collections as a sparse (collections x tickers) matrix.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, str, float]],
+                 symbol_index: Dict[str, int]):
+        rows = [row for row in rows if row[1] in symbol_index and row[2]]
+        self.collection_ids = np.array(sorted(
+            {collection_id
+             for collection_id, _, _ in rows}),
+                                       dtype=int)
+        collection_index = {
+            collection_id: i
+            for i, collection_id in enumerate(self.collection_ids.tolist())
+        }
+
+        # duplicate (collection, ticker) pairs are summed, like in the SQL aggregation
+        self.weights = sparse.csr_matrix(
+            ([weight for _, _, weight in rows], ([
+                collection_index[collection_id] for collection_id, _, _ in rows
+            ], [symbol_index[symbol] for _, symbol, _ in rows])),
+            shape=(len(self.collection_ids), len(symbol_index)),
+            dtype=float)
+        self.weight_sums = np.asarray(self.weights.sum(axis=1)).ravel()
+
+    def rank(self, match_scores: np.ndarray, interest_similarities: np.ndarray,
+             limit: int) -> List[int]:
+        """
+        Same ranking as collection_ranking_scores.sql over the weighted averages of generate_collection_match_scores.sql.
+
+        :return: ids of the `limit` best collections
+        """
+        has_weight = self.weight_sums > 0
+        weight_sums = np.where(has_weight, self.weight_sums, 1.)
+        match_score = self.weights @ match_scores / weight_sums
+        interest_similarity = self.weights @ interest_similarities / weight_sums
+        interest_level = (interest_similarity > 0.3).astype(int) + (
+            interest_similarity > 0.7).astype(int)
+
+        # ties are broken by collection id to keep the order stable
+        order = np.lexsort(
+            (self.collection_ids, -match_score, -interest_level))
+        order = order[has_weight[order]]
+        return self.collection_ids[order[:limit]].tolist()
+
+
+class ScoringData:
+    """
+    Everything profile independent a profile is scored against, shared by all requests of the process.
+    Read-only once loaded: nothing is cached per profile, so request threads share it without a lock.
+    """
+
+    def __init__(self, repo: RecommendationRepository):
+        self.ticker_features = TickerFeatures(repo, None)
+        self.collection_weights = CollectionWeights(
+            repo.read_collection_ticker_weights(),
+            self.ticker_features.symbol_index)
+
+        for array in [
+                self.ticker_features.risk_scores,
+                self.ticker_features.categories.values,
+                self.ticker_features.interests.values,
+                self.collection_weights.collection_ids,
+                self.collection_weights.weight_sums
+        ]:
+            array.setflags(write=False)
+
+
+_scoring_data_cache = TTLCache(PROFILE_SCORER_DATA_TTL, 1)
+
+
+def invalidate_scoring_data():
+    _scoring_data_cache.invalidate()
+
+
+class ProfileScorer:
+    """
+    Ranks collections for a single profile in-process, without reading or writing persisted match scores.
+    Meant for profiles whose match scores are not calculated yet: the ticker features and collection weights are
+    cached in the process, so only the profile's settings are read from the db.
+    """
+
+    def __init__(self, repo: RecommendationRepository):
+        self.repo = repo
+
+    def get_recommended_collections(self, profile_id: int,
+                                    limit: int) -> List[Tuple[int, str]]:
+        """
+        :return: the same (id, uniq_id) pairs as RecommendationRepository.get_recommended_collections
+          with the MATCH_SCORE algorithm, empty if the profile has no scoring settings
+        """
+        profiles = self.repo.read_match_score_profiles([profile_id])
+        if not profiles:
+            return []
+
+        data = self._get_scoring_data()
+        if not data.ticker_features.symbols:
+            return []
+
+        engine = MatchScoreEngine(self.repo,
+                                  ticker_features=data.ticker_features)
+        scores = engine.score_profiles(profiles)
+        collection_ids = data.collection_weights.rank(
+            scores.match_score[0].astype(float), scores.interest_similarity[0],
+            limit)
+
+        return [(i, f"0_{i}") for i in collection_ids]
+
+    def _get_scoring_data(self) -> ScoringData:
+        return _scoring_data_cache.get_or_load(ScoringData,
+                                               lambda: ScoringData(self.repo))
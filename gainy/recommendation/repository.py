@@ -2,12 +2,14 @@ import time
 
 import enum
 import os
+import re
 from operator import itemgetter
-from typing import List, Tuple, Iterable, Any
+from typing import List, Tuple, Iterable, Dict, Optional
 
 from psycopg2.extras import execute_values, RealDictCursor
 from psycopg2 import sql
 
+from gainy.data_access.prepared_statements import PreparedStatement
 from gainy.data_access.repository import Repository
 from gainy.recommendation import TOP_20_FOR_YOU_COLLECTION_ID, TOP_20_COLLECTION_ENABLED
 from gainy.utils import get_logger
@@ -18,6 +20,126 @@ script_dir = os.path.dirname(__file__)
 RECOMMENDATION_MANUALLY_SELECTED_COLLECTION_IDS = os.getenv(
     "RECOMMENDATION_MANUALLY_SELECTED_COLLECTION_IDS", "").split(",")
 
+# Rank match score recommendations straight from the ticker match scores, aggregating only the collections
+# that can enter the requested top, instead of reading profile_collection_match_score
+COLLECTION_RANKING_TOP_K_PRUNING = os.getenv(
+    "COLLECTION_RANKING_TOP_K_PRUNING", "false") == "true"
+
+# Substitutions of the script templates: {script: {variant: {placeholder: SQL}}}.
+# Scripts without placeholders have a single variant None.
+PROFILES_WHERE_CLAUSE = "where id = ANY(%(profile_ids)s)"
+ALL_TICKERS = "all_tickers"
+FILTERED_TICKERS = "filtered_tickers"
+ALL_COLLECTIONS = "all_collections"
+FILTERED_COLLECTIONS = "filtered_collections"
+_SCRIPT_SUBSTITUTIONS = {
+    "generate_ticker_match_scores.sql": {
+        ALL_TICKERS: {
+            "where_clause": PROFILES_WHERE_CLAUSE,
+            "tickers_where_clause": "",
+        },
+        FILTERED_TICKERS: {
+            "where_clause": PROFILES_WHERE_CLAUSE,
+            "tickers_where_clause": "and symbol = ANY(%(tickers)s)",
+        },
+    },
+    "generate_ticker_match_scores_from_features.sql": {
+        ALL_TICKERS: {
+            "where_clause": PROFILES_WHERE_CLAUSE,
+            "tickers_where_clause": "",
+        },
+        FILTERED_TICKERS: {
+            "where_clause": PROFILES_WHERE_CLAUSE,
+            "tickers_where_clause": "and symbol = ANY(%(tickers)s)",
+        },
+    },
+    "cleanup_ticker_match_scores.sql": {
+        None: {
+            "where_clause": PROFILES_WHERE_CLAUSE
+        }
+    },
+    "generate_collection_match_scores.sql": {
+        ALL_COLLECTIONS: {
+            "where_clause": PROFILES_WHERE_CLAUSE,
+            "collections_where_clause": "",
+        },
+        FILTERED_COLLECTIONS: {
+            "where_clause":
+            PROFILES_WHERE_CLAUSE,
+            "collections_where_clause":
+            "where collection_uniq_id = ANY(%(collection_uniq_ids)s)",
+        },
+    },
+    "cleanup_changed_collection_match_scores.sql": {
+        None: {
+            "where_clause": PROFILES_WHERE_CLAUSE
+        }
+    },
+    "cleanup_collection_match_scores.sql": {
+        None: {
+            "where_clause": PROFILES_WHERE_CLAUSE
+        }
+    },
+    "update_top_collection_tickers.sql": {
+        None: {
+            "where_clause": PROFILES_WHERE_CLAUSE
+        }
+    },
+}
+
+
+def _load_statements(
+) -> Dict[Tuple[str, Optional[str]], List[PreparedStatement]]:
+    """
+    Reads the scripts in sql/ once per process and composes every variant into prepared statements,
+    one per SQL statement of the script.
+    """
+    statements = {}
+    sql_dir = os.path.join(script_dir, "sql")
+    for filename in sorted(os.listdir(sql_dir)):
+        if not filename.endswith(".sql"):
+            continue
+
+        with open(os.path.join(sql_dir, filename)) as f:
+            template = f.read()
+
+        variants = _SCRIPT_SUBSTITUTIONS.get(filename, {None: None})
+        for variant, substitutions in variants.items():
+            query = template
+            if substitutions:
+                query = sql.SQL(template).format(
+                    **{
+                        placeholder: sql.SQL(value)
+                        for placeholder, value in substitutions.items()
+                    }).as_string(None)
+
+            name = "recommendation_" + os.path.splitext(filename)[0]
+            if variant:
+                name += "_" + variant
+            statements[(filename, variant)] = [
+                PreparedStatement(f"{name}_{i}", statement)
+                for i, statement in enumerate(_split_statements(query))
+            ]
+
+    return statements
+
+
+def _split_statements(query: str) -> List[str]:
+    return [
+        statement for statement in re.split(r";\s*(?:\n|$)", query)
+        if statement.strip()
+    ]
+
+
+_statements = _load_statements()
+
+TICKER_MATCH_SCORE_FIELDS = [
+    "profile_id", "symbol", "match_score", "fits_risk", "risk_similarity",
+    "fits_categories", "fits_interests", "category_matches",
+    "interest_matches", "category_similarity", "interest_similarity",
+    "matches_portfolio"
+]
+
 
 class RecommendedCollectionAlgorithm(enum.Enum):
     MATCH_SCORE = 0
@@ -109,6 +231,43 @@ class RecommendationRepository(Repository):
             row = cursor.fetchone()
             return row and int(row[0]) == 1
 
+    def get_collection_match_scores_version(self, profile_id: int) -> tuple:
+        """
+        :return: last update time and number of the profile's collection match scores,
+          changes every time they are regenerated or cleaned up
+        """
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                """select max(updated_at), count(*)
+                   from app.profile_collection_match_score
+                   where profile_id = %(profile_id)s""",
+                {"profile_id": profile_id})
+            return tuple(cursor.fetchone())
+
+    def read_profile_scoring_settings(self,
+                                      profile_ids: List[int]) -> List[dict]:
+        with self.db_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                "select * from app.profile_scoring_settings where profile_id = ANY (%(profile_ids)s)",
+                {"profile_ids": list(profile_ids)})
+            return [dict(row) for row in cursor.fetchall()]
+
+    def update_risk_scores(self, risk_scores: Dict[int, int]):
+        """
+        :param risk_scores: risk score by profile id, written with a single statement
+        """
+        if not risk_scores:
+            return
+
+        with self.db_conn.cursor() as cursor:
+            execute_values(cursor,
+                           """update app.profile_scoring_settings
+                   set risk_score = data.risk_score
+                   from (values %s) as data (profile_id, risk_score)
+                   where profile_scoring_settings.profile_id = data.profile_id""",
+                           list(risk_scores.items()),
+                           page_size=len(risk_scores))
+
     def is_personalization_enabled(self, profile_id: int) -> bool:
         with self.db_conn.cursor() as cursor:
             cursor.execute(
@@ -200,74 +359,229 @@ class RecommendationRepository(Repository):
 
     def generate_ticker_match_scores(self,
                                      profile_ids: List[int],
-                                     tickers: list[str] = None):
-        query_filenames = [
-            'generate_ticker_match_scores.sql',
-        ]
-
-        substitutions = {"tickers_where_clause": sql.SQL("")}
+                                     tickers: list[str] = None,
+                                     from_features: bool = False):
+        """
+        :param from_features: score against the ticker feature snapshot, see `refresh_ticker_match_score_features`
+        """
+        script = 'generate_ticker_match_scores.sql'
+        if from_features:
+            script = 'generate_ticker_match_scores_from_features.sql'
+
+        scripts = []
         params = {}
         if tickers:
-            substitutions["tickers_where_clause"] = sql.SQL(
-                "and symbol IN %(tickers)s")
-            params["tickers"] = tuple(tickers)
+            scripts.append((script, FILTERED_TICKERS))
+            params["tickers"] = list(tickers)
         else:
-            query_filenames.append('cleanup_ticker_match_scores.sql')
+            scripts.append((script, ALL_TICKERS))
+            scripts.append(('cleanup_ticker_match_scores.sql', None))
+
+        self._generate_match_scores(scripts, profile_ids, params)
+        self.update_top_20_collections(profile_ids)
+
+    def refresh_ticker_match_score_features(self):
+        """
+        Rebuilds the rows of app.ticker_match_score_features whose ticker state hash changed: risk score and
+        category / interest ids with their sim_dif, ordered by sim_dif desc. All of them are kept, the best
+        match of a profile may be any of its categories / interests.
+        """
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                "select to_regclass('app.ticker_match_score_features') is not null"
+            )
+            if not cursor.fetchone()[0]:
+                raise Exception(
+                    "app.ticker_match_score_features does not exist, create it before using the sql_features engine"
+                )
+
+        self._execute_script("sql/refresh_ticker_match_score_features.sql",
+                             None, False)
+
+    def cleanup_ticker_match_scores(self, profile_ids: List[int]):
+        self._generate_match_scores(
+            [('cleanup_ticker_match_scores.sql', None)], profile_ids)
+
+    def update_top_20_collections(self, profile_ids: List[int]):
+        if not TOP_20_COLLECTION_ENABLED:
+            return
+
+        self.update_top_collection_tickers(profile_ids,
+                                           TOP_20_FOR_YOU_COLLECTION_ID, 20)
+
+    def update_top_collection_tickers(self, profile_ids: List[int],
+                                      collection_id: int, limit: int):
+        """
+        Set-based version of `read_top_match_score_tickers` + `update_personalized_collection`:
+        rebuilds the personalized collection of every profile in a single statement.
+        """
+        self._generate_match_scores(
+            [('update_top_collection_tickers.sql', None)], profile_ids, {
+                "collection_id": collection_id,
+                "limit": limit
+            })
 
-        self._generate_match_scores(query_filenames, profile_ids,
-                                    substitutions, params)
+    def read_match_score_tickers(
+            self,
+            tickers: list[str] = None) -> List[Tuple[str, Optional[float]]]:
+        """
+        :return: symbols and risk scores of the tickers match scores are calculated for, ordered by symbol
+        """
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                """select symbol, ticker_risk_scores.risk_score
+                   from tickers
+                            left join ticker_risk_scores using (symbol)
+                   where tickers.ms_enabled
+                     and (%(tickers)s::varchar[] is null or symbol = ANY (%(tickers)s::varchar[]))
+                   order by symbol""", {"tickers": tickers})
+            return cursor.fetchall()
 
-        if TOP_20_COLLECTION_ENABLED:
-            for profile_id in profile_ids:
-                top_20_tickers = self.read_top_match_score_tickers(
-                    profile_id, 20)
-                self.update_personalized_collection(
-                    profile_id, TOP_20_FOR_YOU_COLLECTION_ID, top_20_tickers)
+    def read_ticker_categories_sim_dif(self,
+                                       tickers: list[str] = None
+                                       ) -> List[Tuple[int, str, float]]:
+        return self._read_ticker_sim_dif("ticker_categories_continuous",
+                                         "category_id", tickers)
+
+    def read_ticker_interests_sim_dif(self,
+                                      tickers: list[str] = None
+                                      ) -> List[Tuple[int, str, float]]:
+        return self._read_ticker_sim_dif("ticker_interests", "interest_id",
+                                         tickers)
+
+    def _read_ticker_sim_dif(self, table_name: str, id_field: str,
+                             tickers: list[str]):
+        query = sql.SQL("""select {id_field}, symbol, sim_dif
+                   from {table_name}
+                            join tickers using (symbol)
+                   where tickers.ms_enabled
+                     and {id_field} is not null
+                     and (%(tickers)s::varchar[] is null or symbol = ANY (%(tickers)s::varchar[]))"""
+                        ).format(table_name=sql.Identifier(table_name),
+                                 id_field=sql.Identifier(id_field))
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(query, {"tickers": tickers})
+            return cursor.fetchall()
 
-    def generate_collection_match_scores(self, profile_ids: List[int]):
-        self._generate_match_scores([
-            'generate_collection_match_scores.sql',
-            'cleanup_collection_match_scores.sql'
-        ], profile_ids)
+    def read_collection_ticker_weights(self) -> List[Tuple[int, str, float]]:
+        """
+        :return: collection id, symbol and weight of the tickers of the enabled non-personalized collections,
+          the collections match score recommendations are picked from
+        """
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                """select collection_ticker_actual_weights.collection_id, symbol, weight
+                   from collection_ticker_actual_weights
+                            join profile_collections on profile_collections.uniq_id = collection_uniq_id
+                   where collection_ticker_actual_weights.profile_id is null
+                     and profile_collections.enabled = '1'
+                     and profile_collections.personalized = '0'""")
+            return cursor.fetchall()
 
-    def _generate_match_scores(self,
-                               query_filenames,
-                               profile_ids: List[int],
-                               substitutions: dict = None,
-                               params: dict = None):
-        queries: list[tuple[str, Any]] = []
+    def read_match_score_profiles(self, profile_ids: List[int]) -> list:
+        """
+        :return: profile id, risk score, category ids, interest ids and interests of the held tickers
+          of the profiles with scoring settings
+        """
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                """select profiles.id,
+                          profile_scoring_settings.risk_score,
+                          array(select category_id
+                                from app.profile_categories
+                                where profile_categories.profile_id = profiles.id),
+                          array(select interest_id
+                                from app.profile_interests
+                                where profile_interests.profile_id = profiles.id),
+                          array(select distinct ticker_interests.interest_id
+                                from app.profile_holdings
+                                         join app.portfolio_securities
+                                              on portfolio_securities.id = profile_holdings.security_id
+                                         join ticker_interests
+                                              on ticker_interests.symbol = portfolio_securities.ticker_symbol
+                                where profile_holdings.profile_id = profiles.id
+                                  and ticker_interests.interest_id is not null)
+                   from app.profiles
+                            join app.profile_scoring_settings
+                                 on profiles.id = profile_scoring_settings.profile_id
+                   where profiles.id = ANY (%(profile_ids)s)
+                   order by profiles.id""", {"profile_ids": list(profile_ids)})
+            return cursor.fetchall()
 
-        for query_filename in query_filenames:
-            query_path = os.path.join(script_dir, "sql", query_filename)
-            with open(query_path) as f:
-                queries.append((query_filename, f.read()))
+    def upsert_ticker_match_scores(self, rows: Iterable[tuple]):
+        """
+        :param rows: tuples of values in TICKER_MATCH_SCORE_FIELDS order, streamed with COPY
+        """
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE profile_ticker_match_score_staging (LIKE app.profile_ticker_match_score)"
+            )
 
-        if not substitutions:
-            substitutions = {}
-        substitutions = {
-            **substitutions,
-            "where_clause":
-            sql.SQL("where id IN %(profile_ids)s"),
-        }
+        self.copy_rows(sql.Identifier("profile_ticker_match_score_staging"),
+                       TICKER_MATCH_SCORE_FIELDS, rows)
+
+        field_names = sql.SQL(",").join(
+            map(sql.Identifier, TICKER_MATCH_SCORE_FIELDS))
+        update_set_clause = sql.SQL(",").join(
+            sql.SQL("{field} = excluded.{field}").format(
+                field=sql.Identifier(field))
+            for field in TICKER_MATCH_SCORE_FIELDS + ["updated_at"]
+            if field not in ("profile_id", "symbol"))
+
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                sql.SQL(
+                    """insert into app.profile_ticker_match_score ({field_names}, updated_at)
+                   select {field_names}, now()
+                   from profile_ticker_match_score_staging
+                   on conflict (profile_id, symbol) do update set {update_set_clause}"""
+                ).format(field_names=field_names,
+                         update_set_clause=update_set_clause))
+            cursor.execute("DROP TABLE profile_ticker_match_score_staging")
+
+    def generate_collection_match_scores(
+            self,
+            profile_ids: List[int],
+            collection_uniq_ids: List[str] = None):
+        """
+        :param collection_uniq_ids: only recompute these collections, all collections of the profiles otherwise
+        """
+        if collection_uniq_ids is None:
+            self._generate_match_scores([
+                ('generate_collection_match_scores.sql', ALL_COLLECTIONS),
+                ('cleanup_collection_match_scores.sql', None),
+            ], profile_ids)
+            return
+
+        if not collection_uniq_ids:
+            return
+
+        self._generate_match_scores(
+            [
+                ('generate_collection_match_scores.sql', FILTERED_COLLECTIONS),
+                ('cleanup_changed_collection_match_scores.sql', None),
+            ], profile_ids, {"collection_uniq_ids": list(collection_uniq_ids)})
 
+    def _generate_match_scores(self,
+                               scripts: List[Tuple[str, Optional[str]]],
+                               profile_ids: List[int],
+                               params: dict = None):
         if not params:
             params = {}
         params = {
             **params,
-            "profile_ids": tuple(profile_ids),
+            "profile_ids": list(profile_ids),
         }
 
-        queries = [(query_name, sql.SQL(query).format(**substitutions))
-                   for query_name, query in queries]
-
         with self.db_conn.cursor() as cursor:
-            for query_name, query in queries:
+            for query_name, variant in scripts:
                 start = time.time()
-                cursor.execute(query, params)
+                for statement in _statements[(query_name, variant)]:
+                    statement.execute(cursor, params)
                 logger.info('generate_match_scores',
                             extra={
                                 "query_name": query_name,
-                                "query": query,
+                                "variant": variant,
                                 "profile_ids": profile_ids,
                                 "duration": time.time() - start,
                             })
@@ -286,14 +600,49 @@ class RecommendationRepository(Repository):
     def save_profiles_state(self):
         self._execute_script("sql/save_profiles_state.sql", None, False)
 
+    def get_collections_to_update_ms(self) -> list[str]:
+        """
+        :return: collections whose tickers or weights changed since the last save_collections_state
+        """
+        data = self._execute_script("sql/get_collections_to_update_ms.sql",
+                                    None)
+        return list(map(itemgetter(0), data))
+
+    def get_ticker_collections(self, tickers: list[str]) -> list[str]:
+        if not tickers:
+            return []
+
+        data = self._execute_script("sql/get_ticker_collections.sql",
+                                    {"tickers": list(tickers)})
+        return list(map(itemgetter(0), data))
+
+    def save_collections_state(self):
+        self._execute_script("sql/save_collections_state.sql", None, False)
+
     def _read_sorted_collection_match_scores(self, profile_id: int,
                                              limit: int) -> List[int]:
+        if COLLECTION_RANKING_TOP_K_PRUNING:
+            return self.read_top_k_collection_match_scores(profile_id, limit)
+
         data = self._execute_script("sql/collection_ranking_scores.sql", {
             "profile_id": profile_id,
             "limit": limit
         })
         return list(map(itemgetter(0), data))
 
+    def read_top_k_collection_match_scores(self, profile_id: int,
+                                           limit: int) -> List[int]:
+        """
+        Same ranking as collection_ranking_scores.sql, computed from the profile's ticker match scores. Collections
+        whose upper bound, the max score of their tickers, is below the `limit`-th best score are not aggregated.
+        """
+        data = self._execute_script("sql/collection_ranking_scores_top_k.sql",
+                                    {
+                                        "profile_id": profile_id,
+                                        "limit": limit
+                                    })
+        return list(map(itemgetter(0), data))
+
     def _read_sorted_collection_top_favorited(self, limit: int) -> List[int]:
         data = self._execute_script("sql/collection_top_favorited.sql",
                                     {"limit": limit})
@@ -319,12 +668,11 @@ class RecommendationRepository(Repository):
                         script_rel_path,
                         params,
                         return_results: bool = True):
-        query_filename = os.path.join(script_dir, script_rel_path)
-        with open(query_filename) as f:
-            query = f.read()
+        statements = _statements[(os.path.basename(script_rel_path), None)]
 
         with self.db_conn.cursor() as cursor:
-            cursor.execute(query, params)
+            for statement in statements:
+                statement.execute(cursor, params)
 
             if not return_results:
                 return None
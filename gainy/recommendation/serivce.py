@@ -1,17 +1,22 @@
 import csv
 import os
-import sys
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
 from math import trunc
 
-from typing import Tuple, List, Iterable, Dict, Any
+from typing import Tuple, List, Iterable, Dict, Any, Optional
 
 from psycopg2.extras import RealDictCursor
 
+from gainy.data_access.connection_pool import get_connection_pool
 from gainy.data_access.db_lock import LockAcquisitionTimeout
 from gainy.data_access.optimistic_lock import ConcurrentVersionUpdate
+from gainy.recommendation.cache import TTLCache
 from gainy.recommendation.compute import ComputeRecommendationsAndPersist
 from gainy.recommendation.exceptions import PersonalizationDisabledException
+from gainy.recommendation.profile_scorer import ProfileScorer
 from gainy.recommendation.repository import RecommendationRepository, RecommendedCollectionAlgorithm
 from gainy.utils import get_logger
 
@@ -19,6 +24,55 @@ logger = get_logger(__name__)
 
 TOP_PERFORMANCE_COUNT = 5
 
+# How long recommended collections are cached in the process, in seconds
+RECOMMENDED_COLLECTIONS_CACHE_TTL = float(
+    os.getenv("RECOMMENDED_COLLECTIONS_CACHE_TTL", 300))
+RECOMMENDED_COLLECTIONS_CACHE_MAX_SIZE = int(
+    os.getenv("RECOMMENDED_COLLECTIONS_CACHE_MAX_SIZE", 4096))
+
+# Algorithms whose results do not depend on the profile, cached by (algorithm, limit)
+PROFILE_INDEPENDENT_ALGORITHMS = {
+    RecommendedCollectionAlgorithm.TOP_FAVORITED,
+    RecommendedCollectionAlgorithm.TOP_CLICKED,
+    RecommendedCollectionAlgorithm.TOP_PERFORMANCE,
+    RecommendedCollectionAlgorithm.TOP_MERGED_ALGORITHM,
+}
+
+_recommended_collections_cache = TTLCache(
+    RECOMMENDED_COLLECTIONS_CACHE_TTL, RECOMMENDED_COLLECTIONS_CACHE_MAX_SIZE)
+
+# Rank collections of profiles without match scores in-process and persist their match scores in the background,
+# instead of computing them in the db before responding
+RECOMMENDATION_FAST_SCORING_ENABLED = os.getenv(
+    "RECOMMENDATION_FAST_SCORING_ENABLED", "false") == "true"
+RECOMMENDATION_PERSIST_WORKERS = int(
+    os.getenv("RECOMMENDATION_PERSIST_WORKERS", 2))
+
+_persist_executor = None
+_persist_lock = threading.Lock()
+# Profiles whose match scores are being persisted in the background
+_persisting_profile_ids = set()
+
+DECISION_MATRIX_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    '../data/user_categories_decision_matrix.csv')
+
+
+@cache
+def _load_decision_matrix() -> Dict[Tuple[int, int, int], int]:
+    """
+    :return: risk score by (risk needed, risk taking ability, loss tolerance), the first row of a combination wins
+    """
+    decision_matrix = {}
+    with open(DECISION_MATRIX_PATH) as csv_file:
+        reader = csv.DictReader(csv_file, delimiter='\t')
+        for i in reader:
+            key = (int(i['Risk Need']), int(i['Risk Taking Ability']),
+                   int(i['Loss Tolerance']))
+            decision_matrix.setdefault(key, int(i['Hard code matrix']))
+
+    return decision_matrix
+
 
 def format_collections(
         collections: Iterable[Tuple[int, str]]) -> List[Dict[str, Any]]:
@@ -36,6 +90,63 @@ def _unique_collections(
         yield collection
 
 
+def invalidate_recommended_collections_cache(*profile_ids: int):
+    """
+    Drops the cached match score recommendations of the profiles, or all cached recommendations if none is passed.
+    """
+    if not profile_ids:
+        _recommended_collections_cache.invalidate()
+        return
+
+    profile_ids = set(profile_ids)
+    _recommended_collections_cache.invalidate(
+        lambda key: key[0] == RecommendedCollectionAlgorithm.MATCH_SCORE and
+        key[2] in profile_ids)
+
+
+def _get_persist_executor() -> ThreadPoolExecutor:
+    global _persist_executor
+
+    with _persist_lock:
+        if _persist_executor is None:
+            _persist_executor = ThreadPoolExecutor(
+                RECOMMENDATION_PERSIST_WORKERS,
+                thread_name_prefix="match_score_persist")
+
+        return _persist_executor
+
+
+def _persist_match_score(profile_id: int):
+    try:
+        with get_connection_pool().connection() as db_conn:
+            service = RecommendationService(RecommendationRepository(db_conn))
+            service.compute_match_score(profile_id)
+    except Exception as e:
+        logger.exception(e, extra={'profile_id': profile_id})
+    finally:
+        with _persist_lock:
+            _persisting_profile_ids.discard(profile_id)
+
+
+def persist_match_score_async(profile_id: int) -> Optional[Future]:
+    """
+    Computes and persists the profile's match scores on a pooled connection in a background thread.
+
+    :return: None if the profile's match scores are already being persisted
+    """
+    with _persist_lock:
+        if profile_id in _persisting_profile_ids:
+            return None
+        _persisting_profile_ids.add(profile_id)
+
+    try:
+        return _get_persist_executor().submit(_persist_match_score, profile_id)
+    except Exception:
+        with _persist_lock:
+            _persisting_profile_ids.discard(profile_id)
+        raise
+
+
 class RecommendationService:
 
     def __init__(self, repository: RecommendationRepository):
@@ -71,6 +182,7 @@ class RecommendationService:
         try:
             start = time.time()
             recommendations_func.execute(max_tries=max_tries)
+            invalidate_recommended_collections_cache(profile_id)
 
             new_version = recommendations_func.load_version()
             logger.info('Calculated Match Scores',
@@ -114,16 +226,23 @@ class RecommendationService:
 
         return risk_score
 
-    def calculate_risk_score(self, payload):
-        script_directory = os.path.dirname(os.path.realpath(__file__))
-        sys.path.append(script_directory)
-        with open(
-                os.path.join(script_directory,
-                             '../data/user_categories_decision_matrix.csv')
-        ) as csv_file:
-            reader = csv.DictReader(csv_file, delimiter='\t')
-            decision_matrix = list(reader)
+    def compute_risk_scores(self, profile_ids: List[int]) -> Dict[int, int]:
+        """
+        Bulk version of `compute_risk_score`, profiles without scoring settings are skipped.
 
+        :return: risk score by profile id
+        """
+        risk_scores = {
+            scoring_settings['profile_id']:
+            self.calculate_risk_score(scoring_settings)
+            for scoring_settings in
+            self.repository.read_profile_scoring_settings(profile_ids)
+        }
+        self.repository.update_risk_scores(risk_scores)
+
+        return risk_scores
+
+    def calculate_risk_score(self, payload):
         risk_needed = [1, 2, 2, 3][self._list_index(payload['risk_level'], 4)]
         if payload['average_market_return'] == 6 and risk_needed > 1:
             risk_needed = 3
@@ -177,15 +296,10 @@ class RecommendationService:
                 if buy_rate > 2 and loss_tolerance != 3:  # buy
                     loss_tolerance += 1
 
-        for i in decision_matrix:
-            if int(i['Risk Need']) != risk_needed:
-                continue
-            if int(i['Risk Taking Ability']) != risk_taking_ability:
-                continue
-            if int(i['Loss Tolerance']) != loss_tolerance:
-                continue
-
-            return int(i['Hard code matrix'])
+        risk_score = _load_decision_matrix().get(
+            (risk_needed, risk_taking_ability, loss_tolerance))
+        if risk_score is not None:
+            return risk_score
 
         return max(risk_needed, risk_taking_ability, loss_tolerance)
 
@@ -194,19 +308,19 @@ class RecommendationService:
         logging_extra = {'profile_id': profile_id}
 
         try:
-            manually_selected_collections = self.repository.get_recommended_collections(
+            manually_selected_collections = self._get_recommended_collections(
                 profile_id, limit,
                 RecommendedCollectionAlgorithm.MANUAL_SELECTION)
             logging_extra[
                 'manually_selected_collections'] = manually_selected_collections
 
-            top_performance_collections = self.repository.get_recommended_collections(
+            top_performance_collections = self._get_recommended_collections(
                 profile_id, min(TOP_PERFORMANCE_COUNT, limit),
                 RecommendedCollectionAlgorithm.TOP_PERFORMANCE)
             logging_extra[
                 'top_performance_collections'] = top_performance_collections
 
-            top_merged_algorithm_collections = self.repository.get_recommended_collections(
+            top_merged_algorithm_collections = self._get_recommended_collections(
                 profile_id, limit,
                 RecommendedCollectionAlgorithm.TOP_MERGED_ALGORITHM)
             logging_extra[
@@ -224,7 +338,7 @@ class RecommendationService:
                 '_get_recommended_collections_global: no collections to recommend',
                 extra=logging_extra)
 
-            top_favorited_collections = self.repository.get_recommended_collections(
+            top_favorited_collections = self._get_recommended_collections(
                 profile_id, limit,
                 RecommendedCollectionAlgorithm.TOP_FAVORITED)
             logging_extra[
@@ -244,7 +358,7 @@ class RecommendationService:
 
         try:
             # Step 1: get recommended by MS
-            collections = self.repository.get_recommended_collections(
+            collections = self._get_recommended_collections(
                 profile_id, limit, RecommendedCollectionAlgorithm.MATCH_SCORE)
             if collections:
                 logging_extra["collections"] = collections
@@ -252,12 +366,25 @@ class RecommendationService:
                             extra=logging_extra)
                 return collections
 
-            # Step 2: update MS and try again
+            # Step 2: score the profile in-process, persist MS in the background
+            if RECOMMENDATION_FAST_SCORING_ENABLED:
+                collections = ProfileScorer(
+                    self.repository).get_recommended_collections(
+                        profile_id, limit)
+                if collections:
+                    persist_match_score_async(profile_id)
+                    logging_extra["collections"] = collections
+                    logger.info(
+                        '_get_recommended_collections_personalized: fast scoring',
+                        extra=logging_extra)
+                    return collections
+
+            # Step 3: update MS and try again
             logger.info(
                 '_get_recommended_collections_personalized: update_match_scores',
                 extra=logging_extra)
             self.compute_match_score(profile_id, log_error=False)
-            collections = self.repository.get_recommended_collections(
+            collections = self._get_recommended_collections(
                 profile_id, limit, RecommendedCollectionAlgorithm.MATCH_SCORE)
             if collections:
                 logging_extra["collections"] = collections
@@ -274,6 +401,30 @@ class RecommendationService:
             logger.exception(e, extra=logging_extra)
             raise e
 
+    def _get_recommended_collections(
+            self, profile_id: int, limit: int,
+            algorithm: RecommendedCollectionAlgorithm
+    ) -> List[Tuple[int, str]]:
+        """
+        Read-through cache of RecommendationRepository.get_recommended_collections. Match score recommendations
+        are cached by the last update time and number of the profile's collection match scores, so that updates
+        made by other processes are picked up. Recalculations made by this process also invalidate them.
+        """
+        if algorithm in PROFILE_INDEPENDENT_ALGORITHMS:
+            key = (algorithm, limit)
+        elif algorithm == RecommendedCollectionAlgorithm.MATCH_SCORE:
+            version = self.repository.get_collection_match_scores_version(
+                profile_id)
+            key = (algorithm, limit, profile_id, version)
+        else:
+            return self.repository.get_recommended_collections(
+                profile_id, limit, algorithm)
+
+        collections = _recommended_collections_cache.get_or_load(
+            key, lambda: self.repository.get_recommended_collections(
+                profile_id, limit, algorithm))
+        return list(collections)
+
     @staticmethod
     def _list_index(value, list_size):
         """
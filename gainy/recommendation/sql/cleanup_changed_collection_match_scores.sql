@@ -0,0 +1,12 @@
+with profiles as
+         (
+             select id as profile_id, email
+             from app.profiles
+             {where_clause}
+         )
+delete
+from app.profile_collection_match_score
+    using profiles
+where profile_collection_match_score.profile_id = profiles.profile_id
+  and profile_collection_match_score.collection_uniq_id = ANY (%(collection_uniq_ids)s)
+  and profile_collection_match_score.updated_at < now();
@@ -0,0 +1,76 @@
+-- Same ranking as collection_ranking_scores.sql, computed from the profile's ticker match scores.
+-- A weighted average is not greater than the max of its terms, so the max ticker scores of a collection bound its
+-- (interest_level, match_score) key from above. The exact keys of the `limit` collections with the highest bounds
+-- give a threshold, only the collections whose bounds reach it are aggregated.
+with ticker_scores as materialized
+         (
+             select collection_ticker_actual_weights.collection_id,
+                    collection_ticker_actual_weights.collection_uniq_id,
+                    collection_ticker_actual_weights.weight,
+                    profile_ticker_match_score.match_score,
+                    profile_ticker_match_score.interest_similarity
+             from app.profile_ticker_match_score
+                      join collection_ticker_actual_weights using (symbol)
+                      join profile_collections c on c.uniq_id = collection_ticker_actual_weights.collection_uniq_id
+             where profile_ticker_match_score.profile_id = %(profile_id)s
+               and (collection_ticker_actual_weights.profile_id is null
+                 or collection_ticker_actual_weights.profile_id = %(profile_id)s)
+               and c.enabled = '1'
+               and c.personalized = '0'
+         ),
+     bounds as materialized
+         (
+             select collection_id,
+                    collection_uniq_id,
+                    (max(interest_similarity) > 0.3)::int + (max(interest_similarity) > 0.7)::int as interest_level,
+                    max(match_score)::double precision                                            as match_score
+             from ticker_scores
+             where weight > 0
+             group by collection_id, collection_uniq_id
+         ),
+     top_bounds as
+         (
+             select collection_uniq_id
+             from bounds
+             order by interest_level desc, match_score desc
+             limit %(limit)s
+         ),
+     threshold as
+         (
+             select interest_level, match_score
+             from (
+                      select (sum(match_score * weight) / sum(weight))::double precision as match_score,
+                             ((sum(interest_similarity * weight) / sum(weight)) > 0.3)::int +
+                             ((sum(interest_similarity * weight) / sum(weight)) > 0.7)::int as interest_level,
+                             count(*) over ()                                               as keys_count
+                      from ticker_scores
+                               join top_bounds using (collection_uniq_id)
+                      group by collection_uniq_id
+                      having sum(weight) > 0
+                  ) t
+             -- with fewer than `limit` collections nothing can be pruned
+             where keys_count >= %(limit)s
+             order by interest_level, match_score
+             limit 1
+         ),
+     candidates as
+         (
+             select bounds.collection_uniq_id
+             from bounds
+                      left join threshold on true
+             where threshold.interest_level is null
+                or (bounds.interest_level, bounds.match_score) >= (threshold.interest_level, threshold.match_score)
+         )
+select collection_id, match_score as ranking_score
+from (
+         select collection_id,
+                (sum(match_score * weight) / sum(weight))::double precision as match_score,
+                ((sum(interest_similarity * weight) / sum(weight)) > 0.3)::int +
+                ((sum(interest_similarity * weight) / sum(weight)) > 0.7)::int as interest_level
+         from ticker_scores
+                  join candidates using (collection_uniq_id)
+         group by collection_id, collection_uniq_id
+         having sum(weight) > 0
+     ) t
+order by interest_level desc, match_score desc nulls last
+limit %(limit)s;
@@ -32,6 +32,7 @@ from (
                        on (collection_ticker_actual_weights.profile_id is null or
                            collection_ticker_actual_weights.profile_id = profiles.profile_id)
                            and profile_ticker_match_score.symbol = collection_ticker_actual_weights.symbol
+         {collections_where_clause}
          group by profile_ticker_match_score.profile_id, collection_id, collection_uniq_id
          having sum(weight) > 0
      ) t
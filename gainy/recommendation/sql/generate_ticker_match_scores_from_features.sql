@@ -0,0 +1,107 @@
+insert into app.profile_ticker_match_score (profile_id, symbol, match_score, fits_risk, risk_similarity,
+                                            fits_categories, fits_interests, category_matches, interest_matches,
+                                            updated_at, category_similarity, interest_similarity, matches_portfolio)
+with profiles as materialized
+         (
+             select profiles.id as profile_id,
+                    profile_scoring_settings.risk_score,
+                    array(select category_id
+                          from app.profile_categories
+                          where profile_categories.profile_id = profiles.id) as category_ids,
+                    array(select interest_id
+                          from app.profile_interests
+                          where profile_interests.profile_id = profiles.id) as interest_ids,
+                    array(select distinct ticker_interests.interest_id
+                          from app.profile_holdings
+                                   join app.portfolio_securities
+                                        on portfolio_securities.id = profile_holdings.security_id
+                                   join ticker_interests
+                                        on ticker_interests.symbol = portfolio_securities.ticker_symbol
+                          where profile_holdings.profile_id = profiles.id
+                            and ticker_interests.interest_id is not null) as portfolio_interest_ids
+             from app.profiles
+                      join app.profile_scoring_settings on profiles.id = profile_scoring_settings.profile_id
+             {where_clause}
+         ),
+     features as materialized
+         (
+             select ticker_match_score_features.*
+             from app.ticker_match_score_features
+                      join tickers using (symbol)
+             where tickers.ms_enabled
+             {tickers_where_clause}
+         ),
+     combined0 as
+         (
+             select profile_id,
+                    symbol,
+                    coalesce(case
+                                 when profiles.risk_score = 3
+                                     then 1 - abs(features.risk_score - 0.75)
+                                 when profiles.risk_score = 2
+                                     then 1 - abs(features.risk_score - 0.5) * 1.5
+                                 when profiles.risk_score = 1
+                                     then 1 - abs(features.risk_score - 0.25)
+                                 end, 0)                                       as match_comp_risk_normalized,
+                    coalesce((select max(sim_dif)
+                              from unnest(features.category_ids, features.category_sim_difs) t (category_id, sim_dif)
+                              where category_id = any (profiles.category_ids)), -1) / 2 + 0.5
+                                                                               as match_comp_category_normalized,
+                    coalesce((select max(sim_dif)
+                              from unnest(features.interest_ids, features.interest_sim_difs) t (interest_id, sim_dif)
+                              where interest_id = any (profiles.interest_ids)), -1) / 2 + 0.5
+                                                                               as match_comp_interest_normalized,
+                    -- the arrays are ordered by sim_dif desc
+                    coalesce((select json_agg(category_id order by position)::text
+                              from (
+                                       select category_id, position
+                                       from unnest(features.category_ids, features.category_sim_difs)
+                                                with ordinality t (category_id, sim_dif, position)
+                                       where category_id = any (profiles.category_ids)
+                                         and sim_dif > 0
+                                       order by position
+                                       limit 2
+                                   ) t), '[]')                                 as category_matches,
+                    coalesce((select json_agg(interest_id order by position)::text
+                              from (
+                                       select interest_id, position
+                                       from unnest(features.interest_ids, features.interest_sim_difs)
+                                                with ordinality t (interest_id, sim_dif, position)
+                                       where interest_id = any (profiles.interest_ids)
+                                         and sim_dif > 0
+                                       order by position
+                                       limit 2
+                                   ) t), '[]')                                 as interest_matches,
+                    features.interest_ids && profiles.portfolio_interest_ids as matches_portfolio
+             from profiles
+                      join features on true
+         )
+select profile_id,
+       symbol,
+       ((public.sigmoid(match_comp_risk_normalized, 3) * 0.6 +
+       public.sigmoid(match_comp_interest_normalized, 3) * 0.3 +
+       public.sigmoid(match_comp_category_normalized, 3) * 0.1) * 100)::int                as match_score,
+       (match_comp_risk_normalized > 1/3.)::int + (match_comp_risk_normalized > 2/3.)::int         as fits_risk,
+       match_comp_risk_normalized                                                                  as risk_similarity,
+       (match_comp_category_normalized > 1/3.)::int + (match_comp_category_normalized > 2/3.)::int as fits_categories,
+       (match_comp_interest_normalized > 1/3.)::int + (match_comp_interest_normalized > 2/3.)::int as fits_interests,
+       category_matches,
+       interest_matches,
+       now()                                                                                       as updated_at,
+       match_comp_category_normalized                                                              as category_similarity,
+       match_comp_interest_normalized                                                              as interest_similarity,
+       matches_portfolio
+from combined0
+on conflict (
+    profile_id, symbol
+    ) do update set match_score         = excluded.match_score,
+                    fits_risk           = excluded.fits_risk,
+                    risk_similarity     = excluded.risk_similarity,
+                    fits_categories     = excluded.fits_categories,
+                    fits_interests      = excluded.fits_interests,
+                    category_matches    = excluded.category_matches,
+                    interest_matches    = excluded.interest_matches,
+                    updated_at          = excluded.updated_at,
+                    category_similarity = excluded.category_similarity,
+                    interest_similarity = excluded.interest_similarity,
+                    matches_portfolio   = excluded.matches_portfolio;
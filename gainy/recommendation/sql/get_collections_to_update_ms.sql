@@ -0,0 +1,18 @@
+with collection_state as
+         (
+             select collection_uniq_id,
+                    md5(string_agg(symbol || ':' || coalesce(profile_id::text, '') || ':' || weight::text, ','
+                                   order by symbol, profile_id)) as state_hash
+             from collection_ticker_actual_weights
+             group by collection_uniq_id
+         ),
+     saved_state as
+         (
+             select object_id as collection_uniq_id, state_hash
+             from app.object_recommendation_state
+             where object_type = 'collection'
+         )
+select collection_uniq_id
+from collection_state
+         full outer join saved_state using (collection_uniq_id)
+where collection_state.state_hash is distinct from saved_state.state_hash
@@ -0,0 +1,3 @@
+select distinct collection_uniq_id
+from collection_ticker_actual_weights
+where symbol = ANY (%(tickers)s)
@@ -0,0 +1,70 @@
+delete
+from app.ticker_match_score_features
+where symbol not in (select symbol from tickers where ms_enabled);
+
+insert into app.ticker_match_score_features (symbol, state_hash, risk_score, category_ids, category_sim_difs,
+                                             interest_ids, interest_sim_difs, updated_at)
+with tickers as materialized
+         (
+             select symbol, ticker_actual_recommendation_state.state_hash
+             from tickers
+                      left join ticker_actual_recommendation_state using (symbol)
+                      left join app.ticker_match_score_features using (symbol)
+             where tickers.ms_enabled
+               and (ticker_match_score_features.symbol is null
+                 or ticker_actual_recommendation_state.state_hash is null
+                 or ticker_actual_recommendation_state.state_hash != ticker_match_score_features.state_hash)
+         ),
+     t_cat_sim_dif as
+         (
+             select symbol, category_id, max(sim_dif) as sim_dif
+             from ticker_categories_continuous
+                      join tickers using (symbol)
+             where category_id is not null
+               and sim_dif is not null
+             group by symbol, category_id
+         ),
+     t_int_sim_dif as
+         (
+             select symbol, interest_id, max(sim_dif) as sim_dif
+             from ticker_interests
+                      join tickers using (symbol)
+             where interest_id is not null
+               and sim_dif is not null
+             group by symbol, interest_id
+         ),
+     t_cat as
+         (
+             select symbol,
+                    array_agg(category_id order by sim_dif desc, category_id) as category_ids,
+                    array_agg(sim_dif order by sim_dif desc, category_id)     as category_sim_difs
+             from t_cat_sim_dif
+             group by symbol
+         ),
+     t_int as
+         (
+             select symbol,
+                    array_agg(interest_id order by sim_dif desc, interest_id) as interest_ids,
+                    array_agg(sim_dif order by sim_dif desc, interest_id)     as interest_sim_difs
+             from t_int_sim_dif
+             group by symbol
+         )
+select symbol,
+       tickers.state_hash,
+       ticker_risk_scores.risk_score,
+       coalesce(t_cat.category_ids, '{}'),
+       coalesce(t_cat.category_sim_difs, '{}'),
+       coalesce(t_int.interest_ids, '{}'),
+       coalesce(t_int.interest_sim_difs, '{}'),
+       now()
+from tickers
+         left join ticker_risk_scores using (symbol)
+         left join t_cat using (symbol)
+         left join t_int using (symbol)
+on conflict (symbol) do update set state_hash        = excluded.state_hash,
+                                   risk_score        = excluded.risk_score,
+                                   category_ids      = excluded.category_ids,
+                                   category_sim_difs = excluded.category_sim_difs,
+                                   interest_ids      = excluded.interest_ids,
+                                   interest_sim_difs = excluded.interest_sim_difs,
+                                   updated_at        = excluded.updated_at;
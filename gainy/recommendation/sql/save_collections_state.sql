@@ -0,0 +1,14 @@
+insert into app.object_recommendation_state (object_id, object_type, state_hash)
+select collection_uniq_id,
+       'collection',
+       md5(string_agg(symbol || ':' || coalesce(profile_id::text, '') || ':' || weight::text, ','
+                      order by symbol, profile_id))
+from collection_ticker_actual_weights
+group by collection_uniq_id
+on conflict (object_id, object_type) do update set state_hash = excluded.state_hash,
+                                                   updated_at = now();
+
+delete
+from app.object_recommendation_state
+where object_type = 'collection'
+  and object_id not in (select collection_uniq_id from collection_ticker_actual_weights where collection_uniq_id is not null);
@@ -0,0 +1,45 @@
+with profiles as
+         (
+             select id as profile_id
+             from app.profiles
+             {where_clause}
+         ),
+     top_tickers as
+         (
+             select profile_id, symbol
+             from (
+                      select profile_id,
+                             symbol,
+                             row_number() over (partition by profile_id order by match_score desc, symbol) as position
+                      from profiles
+                               join app.profile_ticker_match_score using (profile_id)
+                               join tickers using (symbol)
+                  ) t
+             where position <= %(limit)s
+         ),
+     deleted_tickers as
+         (
+             delete
+                 from app.personalized_ticker_collections
+                     using profiles
+                 where personalized_ticker_collections.profile_id = profiles.profile_id
+                     and personalized_ticker_collections.collection_id = %(collection_id)s::int
+                     and not exists(select 1
+                                    from top_tickers
+                                    where top_tickers.profile_id = personalized_ticker_collections.profile_id
+                                      and top_tickers.symbol = personalized_ticker_collections.symbol)
+         ),
+     collection_sizes as
+         (
+             insert into app.personalized_collection_sizes (profile_id, collection_id, size)
+                 select profile_id, %(collection_id)s::int, count(top_tickers.symbol)
+                 from profiles
+                          left join top_tickers using (profile_id)
+                 group by profile_id
+                 on conflict (profile_id, collection_id) do update set size = excluded.size
+         )
+insert
+into app.personalized_ticker_collections (profile_id, collection_id, symbol)
+select profile_id, %(collection_id)s::int, symbol
+from top_tickers
+on conflict do nothing;
@@ -2,6 +2,7 @@ from gainy.context_container import ContextContainer
 
 
 class TestContextContainer(ContextContainer):
+    __test__ = False
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self._db_conn:
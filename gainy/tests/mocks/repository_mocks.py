@@ -13,6 +13,22 @@ def mock_find(options):
     return mock
 
 
+def mock_find_many_by_keys(options):
+
+    def mock(_cls, _keys):
+        _keys = [key if isinstance(key, tuple) else (key, ) for key in _keys]
+        for cls, entities in options:
+            if cls == _cls:
+                return {
+                    key: entity
+                    for key, entity in entities.items() if key in _keys
+                }
+
+        raise Exception(f"unknown find_many_by_keys call: {_cls}, {_keys}")
+
+    return mock
+
+
 def mock_persist(persisted_objects: dict = None):
 
     def mock(entities):
@@ -10,7 +10,9 @@ from typing import Iterable, Tuple
 import time
 
 from gainy.context_container import ContextContainer
+from gainy.data_access.instrumentation import collect_query_stats
 from gainy.data_access.operators import OperatorLt, OperatorIn
+from gainy.data_access.unit_of_work import UnitOfWork
 from gainy.trading.drivewealth.provider.provider import DriveWealthProvider
 from gainy.trading.drivewealth import DriveWealthRepository
 from gainy.trading.drivewealth.exceptions import DriveWealthApiException, TradingAccountNotOpenException, \
@@ -46,6 +48,7 @@ class RebalancePortfoliosJob:
         self.provider = provider
         self.transaction_handler = transaction_handler
         self.trading_service = trading_service
+        self.unit_of_work = UnitOfWork(trading_repository)
 
     def run(self, batch_id=0, batch_cnt=1):
         # todo thread safety
@@ -92,7 +95,7 @@ class RebalancePortfoliosJob:
                 continue
 
             try:
-                account: DriveWealthAccount = self.repo.find_one(
+                account: DriveWealthAccount = self.unit_of_work.find_one(
                     DriveWealthAccount,
                     {"ref_id": portfolio.drivewealth_account_id})
                 if not account or not account.is_open():
@@ -142,7 +145,7 @@ class RebalancePortfoliosJob:
             except (psycopg2.errors.OperationalError,
                     DriveWealthApiException) as e:
                 logger.exception(e)
-                self.repo.rollback()
+                self.unit_of_work.rollback()
             except InvalidDriveWealthPortfolioStatusException as e:
                 logger.info(
                     f"Skipping portfolio {portfolio.ref_id} due to invalid status",
@@ -156,7 +159,7 @@ class RebalancePortfoliosJob:
             except Exception as e:
                 logger.exception(e)
             finally:
-                self.repo.commit()
+                self.unit_of_work.commit()
 
         self._force_rebalance(force_rebalance_portfolios)
 
@@ -189,7 +192,7 @@ class RebalancePortfoliosJob:
                     portfolio, trading_order)
 
                 trading_orders.append(trading_order)
-                self.repo.persist(trading_order)
+                self.unit_of_work.persist(trading_order)
             except InsufficientFundsException as e:
                 logger.info("Skipping order %s for profile %d account %d: %s",
                             trading_order.id,
@@ -202,6 +205,7 @@ class RebalancePortfoliosJob:
             except DriveWealthApiException as e:
                 logger.exception(e)
 
+        self.unit_of_work.flush()
         return trading_orders
 
     def rebalance_existing_funds(self,
@@ -269,10 +273,12 @@ class RebalancePortfoliosJob:
             if weight_sum <= 0:
                 raise Exception('weight_sum can not be negative')
 
+            funds = self.unit_of_work.find_many_by_keys(
+                DriveWealthFund, fund_weights.keys())
+
             orders = []
             for fund_ref_id, weight in fund_weights.items():
-                fund: DriveWealthFund = self.repo.find_one(
-                    DriveWealthFund, {"ref_id": fund_ref_id})
+                fund: DriveWealthFund = funds.get((fund_ref_id, ))
                 if not fund:
                     raise Exception('Fund does not exist ' + fund_ref_id)
 
@@ -320,7 +326,7 @@ class RebalancePortfoliosJob:
                 yield row[0], row[1]
 
     def _get_trading_account_id(self, portfolio: DriveWealthPortfolio) -> int:
-        drivewealth_account: DriveWealthAccount = self.repo.find_one(
+        drivewealth_account: DriveWealthAccount = self.unit_of_work.find_one(
             DriveWealthAccount, {"ref_id": portfolio.drivewealth_account_id})
         if not drivewealth_account:
             raise Exception('drivewealth_account not found')
@@ -364,7 +370,7 @@ class RebalancePortfoliosJob:
         weights = self.drivewealth_repository.filter_inactive_symbols_from_weights(
             weights)
 
-        tcv: TradingCollectionVersion = self.repo.find_one(
+        tcv: TradingCollectionVersion = self.unit_of_work.find_one(
             TradingCollectionVersion,
             {"id": fund.trading_collection_version_id})
         logging_extra["last_optimization_at"] = tcv.last_optimization_at
@@ -532,14 +538,15 @@ def cli(args=None):
     args = parser.parse_args(args)
 
     try:
-        with ContextContainer() as context_container:
-            job = RebalancePortfoliosJob(
-                context_container.trading_repository,
-                context_container.drivewealth_repository,
-                context_container.drivewealth_provider,
-                context_container.drivewealth_transaction_handler,
-                context_container.trading_service)
-            job.run(args.batch_id, args.batch_cnt)
+        with collect_query_stats("rebalance_portfolios"):
+            with ContextContainer() as context_container:
+                job = RebalancePortfoliosJob(
+                    context_container.trading_repository,
+                    context_container.drivewealth_repository,
+                    context_container.drivewealth_provider,
+                    context_container.drivewealth_transaction_handler,
+                    context_container.trading_service)
+                job.run(args.batch_id, args.batch_cnt)
 
     except Exception as e:
         logger.exception(e)
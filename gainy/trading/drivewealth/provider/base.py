@@ -353,6 +353,12 @@ class DriveWealthProviderBase(DriveWealthProviderInterface):
             return
         profile_id = portfolio.profile_id
 
+        funds = self.repository.find_many_by_keys(DriveWealthFund, [
+            holding_data["id"]
+            for holding_data in portfolio_status.data["holdings"]
+            if holding_data["type"] != "CASH_RESERVE"
+        ])
+
         holdings = []
         for holding_data in portfolio_status.data["holdings"]:
             if holding_data["type"] == "CASH_RESERVE":
@@ -368,9 +374,7 @@ class DriveWealthProviderBase(DriveWealthProviderInterface):
                 holdings.append(holding)
                 continue
 
-            fund_id = holding_data["id"]
-            fund: DriveWealthFund = self.repository.find_one(
-                DriveWealthFund, {"ref_id": fund_id})
+            fund: DriveWealthFund = funds.get((holding_data["id"], ))
             if not fund:
                 continue
 
@@ -297,6 +297,9 @@ class DriveWealthTransactionHandler:
     def _get_portfolio_symbol_weights(
         self, symbol, portfolio_status: DriveWealthPortfolioStatus
     ) -> list[Tuple[Optional[int], Decimal]]:
+        """
+        :raises EntityNotFoundException: if a fund holding the symbol is missing
+        """
         selected_holdings = []
         value_sum = Decimal(0)
         for fund_id, holdings in portfolio_status.holdings.items():
@@ -304,13 +307,21 @@ class DriveWealthTransactionHandler:
                 if holding.symbol != symbol:
                     continue
 
-                fund = self.drivewealth_repository.find_one(
-                    DriveWealthFund, {"ref_id": fund_id})
-                selected_holdings.append((fund.collection_id, holding.value))
+                selected_holdings.append((fund_id, holding.value))
                 value_sum += holding.value
                 break
 
-        return [(i[0], i[1] / value_sum) for i in selected_holdings]
+        funds = self.drivewealth_repository.find_many_by_keys(
+            DriveWealthFund, [fund_id for fund_id, _ in selected_holdings])
+
+        weights = []
+        for fund_id, value in selected_holdings:
+            fund = funds.get((fund_id, ))
+            if not fund:
+                raise EntityNotFoundException(f"DriveWealthFund {fund_id}")
+            weights.append((fund.collection_id, value / value_sum))
+
+        return weights
 
     def _filter_linked_transactions(self, transactions: list[T]) -> list[T]:
         links: list[
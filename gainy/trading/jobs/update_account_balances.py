@@ -3,6 +3,7 @@ from typing import Iterable
 import time
 
 from gainy.context_container import ContextContainer
+from gainy.data_access.instrumentation import collect_query_stats
 from gainy.trading.drivewealth import DriveWealthRepository
 from gainy.trading.drivewealth.exceptions import InvalidDriveWealthPortfolioStatusException, \
     TradingAccountNotOpenException
@@ -26,8 +27,8 @@ class UpdateAccountBalancesJob:
         self._update_portfolios()
 
     def _update_trading_accounts(self):
-        trading_accounts: Iterable[TradingAccount] = self.repo.iterate_all(
-            TradingAccount)
+        trading_accounts: Iterable[
+            TradingAccount] = self.repo.iterate_all_paginated(TradingAccount)
         for account in trading_accounts:
             if account.is_artificial:
                 continue
@@ -39,10 +40,12 @@ class UpdateAccountBalancesJob:
                             time.time() - start_time)
             except Exception as e:
                 logger.exception(e)
+            finally:
+                self.repo.commit()
 
     def _update_funding_accounts(self):
-        funding_accounts: Iterable[FundingAccount] = self.repo.iterate_all(
-            FundingAccount)
+        funding_accounts: Iterable[
+            FundingAccount] = self.repo.iterate_all_paginated(FundingAccount)
         for account in funding_accounts:
             start_time = time.time()
 
@@ -52,10 +55,13 @@ class UpdateAccountBalancesJob:
                             time.time() - start_time)
             except Exception as e:
                 logger.exception(e)
+            finally:
+                self.repo.commit()
 
     def _update_portfolios(self):
-        portfolios: Iterable[DriveWealthPortfolio] = self.repo.iterate_all(
-            DriveWealthPortfolio)
+        portfolios: Iterable[
+            DriveWealthPortfolio] = self.repo.iterate_all_paginated(
+                DriveWealthPortfolio)
 
         for portfolio in portfolios:
             if portfolio.is_artificial:
@@ -85,15 +91,18 @@ class UpdateAccountBalancesJob:
                                })
             except Exception as e:
                 logger.exception(e)
+            finally:
+                self.repo.commit()
 
 
 def cli():
     try:
-        with ContextContainer() as context_container:
-            job = UpdateAccountBalancesJob(
-                context_container.drivewealth_repository,
-                context_container.trading_service)
-            job.run()
+        with collect_query_stats("update_account_balances"):
+            with ContextContainer() as context_container:
+                job = UpdateAccountBalancesJob(
+                    context_container.drivewealth_repository,
+                    context_container.trading_service)
+                job.run()
 
     except Exception as e:
         logger.exception(e)
@@ -122,6 +122,10 @@ def db_connect() -> connection:
         raise Exception('Missing db connection env variables')
 
     DB_CONN_STRING = f"postgresql://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DB_NAME}?options=-csearch_path%3D{PUBLIC_SCHEMA_NAME}"
+    # imported here as the instrumentation module depends on get_logger
+    from gainy.data_access.instrumentation import InstrumentedConnection
+
     return psycopg2.connect(DB_CONN_STRING,
                             connect_timeout=2,
-                            tcp_user_timeout=30)
+                            tcp_user_timeout=30,
+                            connection_factory=InstrumentedConnection)
@@ -1,6 +1,10 @@
+import psycopg2
+import pytest
+
 from gainy.analytics.service import AnalyticsService
 from gainy.billing.models import InvoiceStatus, Invoice, PaymentMethod, PaymentTransaction, PaymentTransactionStatus
 from gainy.billing.repository import BillingRepository
+from gainy.billing import service as billing_service_module
 from gainy.billing.service import BillingService
 from gainy.billing.stripe.provider import StripePaymentProvider
 from gainy.tests.common import TestContextContainer
@@ -50,6 +54,40 @@ def test_charge_invoices(monkeypatch):
         assert invoice in charge_called
 
 
+def test_charge_invoices_releases_claim_after_error(monkeypatch):
+    with TestContextContainer() as context_container:
+        db_conn = context_container.db_conn
+        repo = BillingRepository(db_conn)
+        service = BillingService(repo, None, None)
+
+        invoice = Invoice()
+        invoice.id = 2011
+        monkeypatch.setattr(repo, "iterate_unpaid_invoices_due",
+                            lambda: [invoice])
+
+        class MockChargeInvoice:
+
+            def __init__(self, *args):
+                pass
+
+            def execute(self):
+                with db_conn.cursor() as cursor:
+                    cursor.execute("select 1 / 0")
+
+        monkeypatch.setattr(billing_service_module, "ChargeInvoice",
+                            MockChargeInvoice)
+
+        # the original error is raised, not InFailedSqlTransaction from the unlock
+        with pytest.raises(psycopg2.errors.DivisionByZero):
+            service.charge_invoices()
+
+        with db_conn.cursor() as cursor:
+            cursor.execute(
+                "select count(*) from pg_locks where locktype = 'advisory' and pid = pg_backend_pid()"
+            )
+            assert cursor.fetchone()[0] == 0
+
+
 def test_charge(monkeypatch):
     profile_id = 1
     amount = 2
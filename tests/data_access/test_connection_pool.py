@@ -0,0 +1,166 @@
+import gc
+import threading
+
+import pytest
+from psycopg2.pool import PoolError
+
+from gainy.context_container import ContextContainer
+from gainy.data_access.connection_pool import ConnectionPool
+from gainy.utils import db_connect, PUBLIC_SCHEMA_NAME
+
+
+def _get_backend_pid(conn) -> int:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_backend_pid()")
+        return cursor.fetchone()[0]
+
+
+def test_reuse():
+    pool = ConnectionPool()
+    try:
+        conn = pool.getconn()
+        pid = _get_backend_pid(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE pool_test (id int)")
+            cursor.execute("SELECT pg_advisory_lock(1, 1)")
+        pool.putconn(conn)
+
+        conn = pool.getconn()
+        assert _get_backend_pid(conn) == pid
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.pool_test')")
+            assert cursor.fetchone()[0] is None
+
+            cursor.execute(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()"
+            )
+            assert cursor.fetchone()[0] == 0
+
+            cursor.execute("SHOW search_path")
+            assert cursor.fetchone()[0] == PUBLIC_SCHEMA_NAME
+        pool.putconn(conn)
+    finally:
+        pool.closeall()
+
+
+def test_max_lifetime():
+    pool = ConnectionPool(max_lifetime=0)
+    try:
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert conn.closed
+
+        assert pool.getconn() is not conn
+    finally:
+        pool.closeall()
+
+
+def test_health_check():
+    pool = ConnectionPool(health_check_interval=0)
+    try:
+        conn = pool.getconn()
+        pid = _get_backend_pid(conn)
+        pool.putconn(conn)
+
+        with db_connect() as db_conn:
+            with db_conn.cursor() as cursor:
+                cursor.execute("SELECT pg_terminate_backend(%(pid)s)",
+                               {"pid": pid})
+
+        conn = pool.getconn()
+        assert _get_backend_pid(conn) != pid
+        pool.putconn(conn)
+    finally:
+        pool.closeall()
+
+
+def test_exhausted():
+    pool = ConnectionPool(max_size=1, max_overflow=0, timeout=0.1)
+    try:
+        conn = pool.getconn()
+        with pytest.raises(PoolError):
+            pool.getconn()
+
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+    finally:
+        pool.closeall()
+
+
+def test_overflow():
+    pool = ConnectionPool(max_size=1, max_overflow=1, timeout=0.1)
+    try:
+        conn = pool.getconn()
+        overflow_conn = pool.getconn()
+        with pytest.raises(PoolError):
+            pool.getconn()
+
+        # overflow connections are not kept
+        pool.putconn(overflow_conn)
+        assert overflow_conn.closed
+        pool.putconn(conn)
+        assert not conn.closed
+
+        assert pool.getconn() is conn
+    finally:
+        pool.closeall()
+
+
+def test_unlimited_overflow():
+    pool = ConnectionPool(max_size=1, timeout=0.1)
+    conns = []
+    try:
+        for _ in range(3):
+            conns.append(pool.getconn())
+        assert len({_get_backend_pid(conn) for conn in conns}) == 3
+
+        for conn in conns:
+            pool.putconn(conn)
+        assert [conn.closed for conn in conns] == [0, 1, 1]
+    finally:
+        pool.closeall()
+
+
+def test_threads():
+    pool = ConnectionPool(max_size=2, max_overflow=0)
+    pids = set()
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(5):
+                with pool.connection() as conn:
+                    pids.add(_get_backend_pid(conn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        pool.closeall()
+
+    assert not errors
+    assert 1 <= len(pids) <= 2
+
+
+def test_abandoned_context_container():
+    pool = ConnectionPool(max_size=1, max_overflow=0, timeout=0.1)
+    try:
+        with ContextContainer(pool) as context_container:
+            context_container.get_repository()
+        pool.putconn(pool.getconn())
+
+        # the way jobs drop containers without exiting them
+        context_container = ContextContainer(pool)
+        conn = context_container.get_repository().db_conn
+        del context_container
+        gc.collect()
+
+        assert conn.closed
+        pool.putconn(pool.getconn())
+    finally:
+        pool.closeall()
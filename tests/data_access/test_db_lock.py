@@ -3,7 +3,9 @@ import threading
 import time
 import traceback
 import psycopg2
-from gainy.data_access.db_lock import LockManager, ResourceType, DatabaseLock, LockAcquisitionTimeout
+import pytest
+
+from gainy.data_access.db_lock import LockManager, ResourceType, DatabaseLock, LockAcquisitionTimeout, lock_wait_stats
 from gainy.utils import db_connect
 
 
@@ -124,3 +126,138 @@ def _assert_lock_timeout(db_conn, resource_type, resource_id, await_sec):
         assert execution_time_ms < await_sec + 0.05
 
     assert lock_acquisition_timeout
+
+
+def test_lock_wakes_up_on_release():
+    resource_id = 101
+    resource_type = ResourceType.GENERAL
+
+    with db_connect() as db_conn_1, db_connect() as db_conn_2:
+        lock_1 = DatabaseLock(db_conn_1, resource_type)
+        assert lock_1.try_lock(resource_id)
+
+        timer = threading.Timer(0.2, lambda: lock_1.unlock(resource_id))
+        timer.start()
+
+        lock_wait_stats.reset()
+        start_time = time.time()
+        lock_2 = DatabaseLock(db_conn_2, resource_type)
+        lock_2.lock(resource_id, await_sec=5)
+        wait_duration = time.time() - start_time
+        timer.join()
+
+        assert 0.2 <= wait_duration < 0.3
+
+        stats = lock_wait_stats.get(resource_type)
+        assert stats["count"] == 1
+        assert stats["timeouts"] == 0
+        assert stats["max_wait"] >= 0.2
+
+        # the transaction is still usable and lock_timeout is restored
+        with db_conn_2.cursor() as cursor:
+            cursor.execute("SHOW lock_timeout")
+            assert cursor.fetchone()[0] == "0"
+
+        lock_2.unlock(resource_id)
+
+    _assert_not_locked(resource_type, resource_id)
+
+
+def test_lock_timeout_keeps_transaction():
+    resource_id = 102
+    resource_type = ResourceType.GENERAL
+
+    with db_connect() as db_conn_1, db_connect() as db_conn_2:
+        lock_1 = DatabaseLock(db_conn_1, resource_type)
+        assert lock_1.try_lock(resource_id)
+
+        with db_conn_2.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+        lock_wait_stats.reset()
+        _assert_lock_timeout(db_conn_2, resource_type, resource_id, 0.1)
+        assert lock_wait_stats.get(resource_type)["timeouts"] == 1
+
+        with db_conn_2.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            assert cursor.fetchone()[0] == 1
+
+        lock_1.unlock(resource_id)
+
+    _assert_not_locked(resource_type, resource_id)
+
+
+def test_xact_lock_released_with_transaction():
+    resource_id = 103
+    resource_type = ResourceType.GENERAL
+
+    with db_connect() as db_conn_1, db_connect() as db_conn_2:
+        lock_1 = DatabaseLock(db_conn_1, resource_type)
+        lock_2 = DatabaseLock(db_conn_2, resource_type)
+
+        lock_1.lock(resource_id, await_sec=1, xact=True)
+        assert not lock_2.try_lock(resource_id)
+        db_conn_1.commit()
+        assert lock_2.try_lock(resource_id, xact=True)
+        db_conn_2.rollback()
+
+        with LockManager.database_lock(db_conn_1,
+                                       resource_type,
+                                       resource_id,
+                                       xact=True):
+            assert not lock_2.try_lock(resource_id)
+        # the lock is held until the end of the transaction
+        assert not lock_2.try_lock(resource_id)
+        db_conn_1.rollback()
+
+    _assert_not_locked(resource_type, resource_id)
+
+
+def test_try_lock_many():
+    resource_type = ResourceType.GENERAL
+
+    with db_connect() as db_conn_1, db_connect() as db_conn_2:
+        lock_1 = DatabaseLock(db_conn_1, resource_type)
+        lock_2 = DatabaseLock(db_conn_2, resource_type)
+
+        assert lock_1.try_lock(105)
+        assert lock_2.try_lock_many([104, 105, 106, 104]) == {104, 106}
+        lock_1.unlock(105)
+
+        assert lock_1.try_lock_many([104, 105, 106]) == {105}
+        lock_2.unlock_many([104, 106])
+        lock_1.unlock_many([105])
+
+        assert lock_1.try_lock_many([104, 105], xact=True) == {104, 105}
+        assert lock_2.try_lock_many([104, 105, 106]) == {106}
+        lock_2.unlock_many([106])
+        db_conn_1.commit()
+
+    for resource_id in [104, 105, 106]:
+        _assert_not_locked(resource_type, resource_id)
+
+
+def test_lock_many():
+    resource_type = ResourceType.GENERAL
+
+    with db_connect() as db_conn_1, db_connect() as db_conn_2:
+        lock_1 = DatabaseLock(db_conn_1, resource_type)
+        lock_2 = DatabaseLock(db_conn_2, resource_type)
+
+        assert lock_1.try_lock(108)
+        with pytest.raises(LockAcquisitionTimeout):
+            lock_2.lock_many([109, 108, 107], await_sec=0.1)
+        # none of the resources stay locked after a timeout
+        assert lock_1.try_lock_many([107, 109], xact=True) == {107, 109}
+        db_conn_1.rollback()
+
+        timer = threading.Timer(0.2, lambda: lock_1.unlock(108))
+        timer.start()
+        lock_2.lock_many([109, 108, 107], await_sec=5)
+        timer.join()
+        assert lock_1.try_lock_many([107, 108, 109]) == set()
+
+        db_conn_2.commit()
+
+    for resource_id in [107, 108, 109]:
+        _assert_not_locked(resource_type, resource_id)
@@ -0,0 +1,50 @@
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+
+from gainy.data_access.instrumentation import fingerprint, collect_query_stats, InstrumentedCursorMixin
+from gainy.utils import db_connect
+
+
+def test_fingerprint():
+    assert fingerprint(
+        "select * from t where id = 5 and s = 'a''b'\n  and x in (1, 2)"
+    ) == "select * from t where id = ? and s = ? and x in (...)"
+
+    query = "INSERT INTO t (a, b) VALUES " + ",".join(
+        f"({i}, 's{i}')" for i in range(1000)) + " ON CONFLICT DO NOTHING"
+    assert fingerprint(query) == "INSERT INTO t (a, b) VALUES (...)"
+    assert fingerprint(query.encode()) == fingerprint(query)
+    assert fingerprint(
+        "INSERT INTO t (a, b) VALUES (1, 'a'), (2, 'b') RETURNING id"
+    ) == "INSERT INTO t (a, b) VALUES (...) RETURNING id"
+
+
+def test_collect_query_stats():
+    with db_connect() as db_conn:
+        with collect_query_stats("test") as stats:
+            with db_conn.cursor() as cursor:
+                for i in range(3):
+                    cursor.execute("select generate_series(1, %(i)s)",
+                                   {"i": i + 1})
+            with db_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                assert isinstance(cursor, InstrumentedCursorMixin)
+                cursor.execute(
+                    sql.SQL("select 1 as {field}").format(
+                        field=sql.Identifier("value")))
+
+        with db_conn.cursor() as cursor:
+            cursor.execute("select 2")
+
+    entries = {i.fingerprint: i for i in stats.get_top()}
+    assert set(entries.keys()) == {
+        "select generate_series(...)", 'select ? as "value"'
+    }
+
+    entry = entries["select generate_series(...)"]
+    assert entry.count == 3
+    assert entry.rows == 6
+    assert sum(entry.histogram) == 3
+    assert entry.total_duration >= entry.max_duration > 0
+    [caller] = entry.callers.keys()
+    assert caller.startswith(f"{__name__}:")
+    assert caller.endswith(" test_collect_query_stats")
@@ -0,0 +1,86 @@
+from typing import List
+
+from gainy.data_access.models import BaseModel, SlotsModel, classproperty
+
+
+class DictModel(BaseModel):
+    profile_id = None
+    symbol = None
+    value = None
+
+    key_fields = ["profile_id", "symbol"]
+
+    @classproperty
+    def schema_name(self) -> str:
+        return "app"
+
+    @classproperty
+    def table_name(self) -> str:
+        return "test_data"
+
+    @property
+    def computed(self):
+        return self.value
+
+
+class PostProcessedModel(DictModel):
+
+    def set_from_dict(self, row: dict = None):
+        super().set_from_dict(row)
+        if row:
+            self.value = self.value * 2
+        return self
+
+
+class SlottedModel(SlotsModel):
+    __slots__ = ("profile_id", "symbol", "value")
+
+    key_fields = ["profile_id", "symbol"]
+
+    @classproperty
+    def schema_name(self) -> str:
+        return "app"
+
+    @classproperty
+    def table_name(self) -> str:
+        return "test_data"
+
+
+def test_set_from_dict():
+    row = {"profile_id": 1, "symbol": "AAPL", "value": 2, "unknown": 3}
+
+    entity = DictModel().set_from_dict(row)
+
+    assert entity.to_dict() == {"profile_id": 1, "symbol": "AAPL", "value": 2}
+    assert not hasattr(entity, "unknown")
+    assert entity.computed == 2
+
+
+def test_hydrator():
+    columns = ("unknown", "profile_id", "symbol", "value")
+    row = (0, 1, "AAPL", 2)
+
+    entity = DictModel.hydrator(columns)(row)
+    assert isinstance(entity, DictModel)
+    assert entity.to_dict() == {"profile_id": 1, "symbol": "AAPL", "value": 2}
+    assert DictModel.hydrator(columns) is DictModel.hydrator(list(columns))
+
+    entity = PostProcessedModel.hydrator(columns)(row)
+    assert isinstance(entity, PostProcessedModel)
+    assert entity.value == 4
+
+    entity = DictModel.hydrator(("symbol", ))(("AAPL", ))
+    assert entity.to_dict() == {"symbol": "AAPL"}
+
+
+def test_slots_model():
+    columns = ("profile_id", "symbol", "unknown")
+    entity = SlottedModel.hydrator(columns)((1, "AAPL", 0))
+
+    assert not hasattr(entity, "__dict__")
+    assert entity.to_dict() == {"profile_id": 1, "symbol": "AAPL"}
+    assert entity.value is None
+
+    other = SlottedModel().set_from_dict({"profile_id": 1, "value": 5})
+    entity.refresh_entity(other)
+    assert entity.to_dict() == {"profile_id": 1, "symbol": "AAPL", "value": 5}
@@ -7,7 +7,7 @@ from typing import List
 import pytest
 from gainy.data_access.models import BaseModel, ResourceVersion, classproperty
 from gainy.data_access.db_lock import ResourceType
-from gainy.data_access.optimistic_lock import AbstractOptimisticLockingFunction
+from gainy.data_access.optimistic_lock import AbstractOptimisticLockingFunction, optimistic_lock_stats
 from gainy.data_access.repository import Repository
 from gainy.utils import db_connect
 
@@ -184,8 +184,89 @@ def test_optimistic_locks_two_threads(metadata_table, data_table):
 
 
 def test_optimistic_locks_multiple_threads(metadata_table, data_table):
+    optimistic_lock_stats.reset()
     _test_optimistic_locks(3, 5)
 
+    stats = optimistic_lock_stats.get(_TestGetAndPersist.__name__)
+    assert stats["executions"] == 3 * 5 * 5
+    assert stats["failures"] == 0
+    assert stats["attempts"] == stats["executions"] + stats["conflicts"]
+
+
+def test_compare_and_swap_version(metadata_table):
+    with db_connect() as db_conn_1, db_connect() as db_conn_2:
+        repo_1 = Repository(db_conn_1)
+        repo_2 = Repository(db_conn_2)
+
+        metadata = MetadataClass()
+        metadata.profile_id = 1
+        metadata.update_version()
+        assert repo_1.compare_and_swap_version(metadata, None)
+        repo_1.commit()
+        assert not repo_2.compare_and_swap_version(metadata, None)
+
+        metadata.update_version()
+        assert repo_1.compare_and_swap_version(metadata, 1)
+        repo_1.commit()
+        assert not repo_2.compare_and_swap_version(metadata, 1)
+        repo_2.rollback()
+
+        assert repo_1.find_one(MetadataClass, {"profile_id": 1}).version == 2
+
+
+class MetadataWithFieldsClass(MetadataClass):
+    note = None
+    updated_at = None
+
+    db_excluded_fields = ["updated_at"]
+    non_persistent_fields = ["updated_at"]
+
+    @classproperty
+    def table_name(self) -> str:
+        return "profile_metadata_with_fields"
+
+
+def test_compare_and_swap_version_writes_entity():
+    with db_connect() as db_conn:
+        try:
+            with db_conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE app.profile_metadata_with_fields (
+                        profile_id int4 PRIMARY KEY,
+                        version int4 NOT NULL,
+                        note text,
+                        updated_at timestamptz default now()
+                    );
+                    CREATE TRIGGER set_profile_metadata_with_fields_updated_at
+                        BEFORE UPDATE ON app.profile_metadata_with_fields
+                        FOR EACH ROW EXECUTE PROCEDURE app.set_current_timestamp_updated_at();
+                """)
+            repo = Repository(db_conn)
+
+            metadata = MetadataWithFieldsClass()
+            metadata.profile_id = 1
+            metadata.note = "inserted"
+            metadata.update_version()
+            assert repo.compare_and_swap_version(metadata, None)
+            assert metadata.updated_at is not None
+
+            metadata.note = "updated"
+            metadata.updated_at = None
+            metadata.update_version()
+            assert repo.compare_and_swap_version(metadata, 1)
+            assert metadata.updated_at is not None
+
+            stored = repo.find_one(MetadataWithFieldsClass, {"profile_id": 1})
+            assert (stored.version, stored.note) == (2, "updated")
+
+            metadata.note = "stale"
+            assert not repo.compare_and_swap_version(metadata, 1)
+            assert repo.find_one(MetadataWithFieldsClass, {
+                "profile_id": 1
+            }).note == "updated"
+        finally:
+            db_conn.rollback()
+
 
 def _test_optimistic_locks(profile_num: int, threads_per_profile: int):
     threads = []
@@ -0,0 +1,45 @@
+from gainy.data_access.connection_pool import ConnectionPool
+from gainy.data_access.prepared_statements import PreparedStatement
+from gainy.utils import db_connect
+
+
+def _get_prepared_statements(conn) -> set:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM pg_prepared_statements")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def test_prepared_statement():
+    statement = PreparedStatement(
+        "test_prepared_statement",
+        "select %(b)s::int + %(a)s::int + %(b)s::int where 5 = ANY(%(ids)s);")
+    assert statement.param_names == ["b", "a", "ids"]
+    assert statement.prepare_statement == "PREPARE test_prepared_statement AS select $1::int + $2::int + $1::int where 5 = ANY($3)"
+    assert statement.execute_statement == "EXECUTE test_prepared_statement(%s, %s, %s)"
+
+    with db_connect() as db_conn:
+        with db_conn.cursor() as cursor:
+            statement.execute(cursor, {"a": 1, "b": 2, "ids": [4, 5]})
+            assert cursor.fetchone()[0] == 5
+
+            # prepared once per session, a rollback does not drop it
+            db_conn.rollback()
+            statement.execute(cursor, {"a": 3, "b": 2, "ids": []})
+            assert cursor.fetchone() is None
+
+        assert "test_prepared_statement" in _get_prepared_statements(db_conn)
+
+
+def test_pool_reset():
+    statement = PreparedStatement("test_pool_reset", "select 1")
+
+    pool = ConnectionPool(max_size=1)
+    try:
+        for _ in range(2):
+            with pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    statement.execute(cursor)
+                    assert cursor.fetchone()[0] == 1
+                assert _get_prepared_statements(conn) == {"test_pool_reset"}
+    finally:
+        pool.closeall()
@@ -0,0 +1,309 @@
+import datetime
+from decimal import Decimal
+from typing import List
+
+import pytest
+
+from gainy.data_access import repository as repository_module
+from gainy.data_access.models import BaseModel, classproperty
+from gainy.data_access.operators import OperatorOr, OperatorLt, OperatorGt, OperatorIn, OperatorNot
+from gainy.data_access.repository import Repository
+from gainy.utils import db_connect
+
+
+class DataClass(BaseModel):
+    id = None
+    profile_id = None
+    symbol = None
+    value_list = None
+    amount = None
+    data = None
+    created_at = None
+
+    key_fields = ["profile_id", "symbol"]
+
+    db_excluded_fields = ["created_at"]
+    non_persistent_fields = ["id", "created_at"]
+
+    @classproperty
+    def schema_name(self) -> str:
+        return "app"
+
+    @classproperty
+    def table_name(self) -> str:
+        return "repository_test_data"
+
+
+class KeylessDataClass(DataClass):
+    key_fields = []
+
+
+@pytest.fixture(scope="function")
+def data_table(request):
+    data_table = f"{DataClass.schema_name}.{DataClass.table_name}"
+
+    def table_teardown():
+        with db_connect() as db_conn:
+            with db_conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {data_table}")
+
+    table_teardown()  # Clean from previous executions if needed
+
+    with db_connect() as db_conn:
+        with db_conn.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS app")
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {data_table} (
+                    id serial,
+                    profile_id int4,
+                    symbol varchar NOT NULL,
+                    value_list varchar[],
+                    amount numeric,
+                    data json,
+                    created_at timestamptz NOT NULL default now(),
+                    PRIMARY KEY(profile_id, symbol)
+                )
+            """)
+
+    request.addfinalizer(table_teardown)
+    yield data_table
+
+
+def _create_entities(count: int, profile_id: int) -> List[DataClass]:
+    entities = []
+    for i in range(count):
+        entity = DataClass()
+        entity.profile_id = profile_id
+        entity.symbol = f"S\t{i}\\"
+        entity.value_list = [f'"{i}"', None, "a,b"]
+        entity.amount = Decimal(i) / 3
+        entity.data = '{"line": "a\\nb"}'
+        entities.append(entity)
+    return entities
+
+
+@pytest.mark.parametrize("bulk_persist_threshold", [1, 100000])
+def test_persist(data_table, monkeypatch, bulk_persist_threshold):
+    monkeypatch.setattr(repository_module, "BULK_PERSIST_THRESHOLD",
+                        bulk_persist_threshold)
+
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+
+        entities = _create_entities(250, 1)
+        repo.persist(entities)
+        for entity in entities:
+            assert entity.id is not None
+            assert isinstance(entity.created_at, datetime.datetime)
+
+        entities[0].amount = Decimal(100)
+        repo.persist(entities)
+
+        loaded = {
+            entity.symbol: entity
+            for entity in repo.find_all(DataClass, {"profile_id": 1})
+        }
+
+    assert len(loaded) == len(entities)
+    for entity in entities:
+        loaded_entity = loaded[entity.symbol]
+        assert loaded_entity.id == entity.id
+        assert loaded_entity.value_list == entity.value_list
+        assert loaded_entity.amount == entity.amount
+        assert loaded_entity.data == {"line": "a\nb"}
+
+
+def test_can_persist_bulk(monkeypatch):
+    monkeypatch.setattr(repository_module, "BULK_PERSIST_THRESHOLD", 2)
+    repo = Repository(None)
+
+    assert not repo._can_persist_bulk(_create_entities(1, 1))
+    assert repo._can_persist_bulk(_create_entities(2, 1))
+    assert not repo._can_persist_bulk(
+        _create_entities(2, 1) + _create_entities(1, 1))
+
+
+def test_get_chunk_size(monkeypatch):
+    monkeypatch.setattr(repository_module, "MAX_STATEMENT_SIZE", 10000)
+    repo = Repository(None)
+
+    narrow_entities = _create_entities(10, 1)
+    assert 1 < repo._get_chunk_size(
+        narrow_entities) <= repository_module.MAX_TRANSACTION_SIZE
+
+    wide_entities = _create_entities(10, 1)
+    for entity in wide_entities:
+        entity.data = "x" * 1000
+    assert repo._get_chunk_size(wide_entities) < repo._get_chunk_size(
+        narrow_entities)
+    assert repo._get_chunk_size(wide_entities) <= 10000 // 1000
+
+    monkeypatch.setattr(repository_module, "MAX_STATEMENT_PARAMETERS", 10)
+    assert repo._get_chunk_size(narrow_entities) == 10 // 5
+
+
+def test_insert_statement_cache(data_table):
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+
+        repo.persist(_create_entities(2, 1))
+        cache_size = len(repository_module._insert_statements_cache)
+        repo.persist(_create_entities(2, 2))
+
+        assert len(repository_module._insert_statements_cache) == cache_size
+
+
+def test_iterate_all_stream(data_table):
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+        entities = _create_entities(25, 1)
+        repo.persist(entities)
+
+        symbols = []
+        for entity in repo.iterate_all(DataClass, {"profile_id": 1},
+                                       [("id", "asc")],
+                                       stream=True,
+                                       itersize=10):
+            symbols.append(entity.symbol)
+            # the cursor is declared WITH HOLD and survives commits
+            repo.commit()
+
+    assert symbols == [entity.symbol for entity in entities]
+
+
+@pytest.mark.parametrize("page_size", [1, 7, 25, 100])
+def test_iterate_all_paginated(data_table, page_size):
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+        repo.persist(_create_entities(25, 1) + _create_entities(5, 2))
+
+        entities = []
+        for entity in repo.iterate_all_paginated(DataClass, {"profile_id": 1},
+                                                 page_size=page_size):
+            entities.append(entity)
+            repo.commit()
+
+        all_entities = list(
+            repo.iterate_all_paginated(DataClass, page_size=page_size))
+
+    assert len(entities) == 25
+    assert len(set(e.symbol for e in entities)) == 25
+    assert len(all_entities) == 30
+
+
+def test_find_many_by_keys(data_table):
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+        repo.persist(_create_entities(3, 1) + _create_entities(3, 2))
+
+        keys = [(1, "S\t0\\"), (2, "S\t1\\"), (1, "S\t0\\"), (3, "S\t0\\")]
+        entities = repo.find_many_by_keys(DataClass, keys, chunk_size=2)
+
+        # (1, "S\t1\\") and (2, "S\t0\\") match the per-field filters but were not requested
+        assert set(entities.keys()) == {(1, "S\t0\\"), (2, "S\t1\\")}
+        for (profile_id, symbol), entity in entities.items():
+            assert entity.profile_id == profile_id
+            assert entity.symbol == symbol
+            assert entity.id is not None
+
+        assert repo.find_many_by_keys(DataClass, []) == {}
+
+
+def test_where_clause_cache():
+    query1, params1 = Repository(None)._get_query(
+        DataClass, {
+            "profile_id": 1,
+            "symbol": OperatorNot(OperatorIn(["A"]))
+        }, [("symbol", "desc")])
+    query2, params2 = Repository(None)._get_query(
+        DataClass, {
+            "profile_id": 2,
+            "symbol": OperatorNot(OperatorIn(["B", "C"]))
+        }, [("symbol", "desc")])
+
+    assert query1 is query2
+    assert params1 == {"profile_id": 1, "symbol": ["A"]}
+    assert params2 == {"profile_id": 2, "symbol": ["B", "C"]}
+
+
+def test_operator_or_same_field(data_table):
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+        repo.persist(_create_entities(5, 1))
+
+        filter_by = {"amount": OperatorOr([OperatorLt(0.5), OperatorGt(1)])}
+        where_clause, params = repo._where_clause_statement(filter_by)
+        assert params == {"amount": 0.5, "amount_1": 1}
+
+        entities = repo.find_all(DataClass, {"profile_id": 1, **filter_by})
+        assert sorted(round(entity.amount * 3)
+                      for entity in entities) == [0, 1, 4]
+
+
+@pytest.mark.parametrize("autocommit", [True, False])
+def test_persist_bulk_after_error(data_table, monkeypatch, autocommit):
+    monkeypatch.setattr(repository_module, "BULK_PERSIST_THRESHOLD", 1)
+
+    # a `with` block would open a transaction even in autocommit mode
+    db_conn = db_connect()
+    try:
+        db_conn.autocommit = autocommit
+        repo = Repository(db_conn)
+
+        failing_entities = _create_entities(3, 1)
+        failing_entities[1].data = "{"
+        with pytest.raises(Exception):
+            repo.persist(failing_entities)
+        if not autocommit:
+            repo.rollback()
+
+        for profile_id in [1, 2]:
+            entities = _create_entities(3, profile_id)
+            repo.persist(entities)
+            assert all(entity.id is not None for entity in entities)
+    finally:
+        db_conn.close()
+
+
+def test_persist_bulk_returned_fields(data_table, monkeypatch):
+    monkeypatch.setattr(repository_module, "BULK_PERSIST_THRESHOLD", 1)
+
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+        repo.persist(_create_entities(5, 1)[::2])
+        ids = {
+            entity.symbol: entity.id
+            for entity in repo.find_all(DataClass, {"profile_id": 1})
+        }
+
+        # existing rows are updated in between the new ones
+        entities = list(reversed(_create_entities(5, 1)))
+        repo.persist(entities)
+
+        loaded = {
+            entity.symbol: entity
+            for entity in repo.find_all(DataClass, {"profile_id": 1})
+        }
+    for entity in entities:
+        assert entity.id == loaded[entity.symbol].id
+        assert entity.created_at == loaded[entity.symbol].created_at
+        if entity.symbol in ids:
+            assert entity.id == ids[entity.symbol]
+
+    assert not Repository(None)._can_persist_bulk(_create_entities(1, None))
+
+
+def test_iterate_all_paginated_invalid_keys(data_table, monkeypatch):
+    with pytest.raises(ValueError):
+        next(Repository(None).iterate_all_paginated(KeylessDataClass))
+
+    with db_connect() as db_conn:
+        repo = Repository(db_conn)
+        repo.persist(_create_entities(3, 1))
+
+        # a nullable key, the first page ends with a NULL
+        monkeypatch.setattr(DataClass, "key_fields", ["amount"])
+        with db_conn.cursor() as cursor:
+            cursor.execute(f"update {data_table} set amount = null")
+        with pytest.raises(ValueError):
+            list(repo.iterate_all_paginated(DataClass, page_size=2))
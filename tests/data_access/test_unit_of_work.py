@@ -0,0 +1,111 @@
+from gainy.data_access.operators import OperatorIn
+from gainy.data_access.repository import Repository
+from gainy.data_access.unit_of_work import UnitOfWork
+from gainy.tests.mocks.repository_mocks import mock_record_calls, mock_noop
+from gainy.trading.drivewealth.models import DriveWealthAccount, DriveWealthFund
+
+
+def test_find_one(monkeypatch):
+    account = DriveWealthAccount()
+    account.ref_id = "ref_id"
+    account.trading_account_id = 1
+
+    find_one_calls = []
+
+    def mock_find_one(cls, filter_by=None, order_by=None):
+        mock_record_calls(find_one_calls)(cls, filter_by)
+        if cls == DriveWealthAccount and filter_by.get("ref_id") in [
+                "ref_id", None
+        ]:
+            return account
+        return None
+
+    repository = Repository(None)
+    monkeypatch.setattr(repository, "find_one", mock_find_one)
+
+    unit_of_work = UnitOfWork(repository)
+    assert unit_of_work.find_one(DriveWealthAccount,
+                                 {"trading_account_id": 1}) == account
+    assert unit_of_work.find_one(DriveWealthAccount,
+                                 {"trading_account_id": 1}) == account
+    # registered by key fields on the first lookup
+    assert unit_of_work.find_one(DriveWealthAccount,
+                                 {"ref_id": "ref_id"}) == account
+    assert len(find_one_calls) == 1
+
+    # misses are remembered too
+    assert unit_of_work.find_one(DriveWealthFund, {"ref_id": "fund"}) is None
+    assert unit_of_work.find_one(DriveWealthFund, {"ref_id": "fund"}) is None
+    assert len(find_one_calls) == 2
+
+    # non-equality filters are not cached
+    unit_of_work.find_one(DriveWealthAccount,
+                          {"ref_id": OperatorIn(["ref_id"])})
+    unit_of_work.find_one(DriveWealthAccount,
+                          {"ref_id": OperatorIn(["ref_id"])})
+    assert len(find_one_calls) == 4
+
+
+def test_flush(monkeypatch):
+    fund1 = DriveWealthFund()
+    fund1.ref_id = "fund1"
+    fund2 = DriveWealthFund()
+    account = DriveWealthAccount()
+
+    persist_calls = []
+    repository = Repository(None)
+    monkeypatch.setattr(repository, "persist",
+                        mock_record_calls(persist_calls))
+    monkeypatch.setattr(repository, "commit", mock_noop)
+
+    unit_of_work = UnitOfWork(repository)
+    unit_of_work.persist(fund1)
+    unit_of_work.persist([fund2, account, fund1])
+    assert not persist_calls
+
+    assert unit_of_work.find_one(DriveWealthFund, {"ref_id": "fund1"}) == fund1
+
+    unit_of_work.commit()
+    assert persist_calls == [(([fund1, fund2, account], ), {})]
+
+    unit_of_work.commit()
+    assert len(persist_calls) == 1
+
+
+def test_find_many_by_keys(monkeypatch):
+    fund1 = DriveWealthFund()
+    fund1.ref_id = "fund1"
+    fund2 = DriveWealthFund()
+    fund2.ref_id = "fund2"
+
+    find_many_by_keys_calls = []
+
+    def mock_find_many_by_keys(cls, keys):
+        mock_record_calls(find_many_by_keys_calls)(cls, keys)
+        return {
+            (i.ref_id, ): i
+            for i in [fund1, fund2] if (i.ref_id, ) in keys
+        }
+
+    repository = Repository(None)
+    monkeypatch.setattr(repository, "find_many_by_keys",
+                        mock_find_many_by_keys)
+    monkeypatch.setattr(repository, "find_one", mock_noop)
+
+    unit_of_work = UnitOfWork(repository)
+    assert unit_of_work.find_one(DriveWealthFund, {"ref_id": "fund3"}) is None
+    assert unit_of_work.find_many_by_keys(DriveWealthFund,
+                                          ["fund1", "fund3"]) == {
+                                              ("fund1", ): fund1
+                                          }
+    assert unit_of_work.find_many_by_keys(DriveWealthFund,
+                                          ["fund1", "fund2", "fund3"]) == {
+                                              ("fund1", ): fund1,
+                                              ("fund2", ): fund2,
+                                          }
+    assert unit_of_work.find_one(DriveWealthFund, {"ref_id": "fund2"}) == fund2
+
+    assert find_many_by_keys_calls == [
+        ((DriveWealthFund, [("fund1", )]), {}),
+        ((DriveWealthFund, [("fund2", )]), {}),
+    ]
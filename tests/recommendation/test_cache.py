@@ -0,0 +1,122 @@
+import pytest
+
+from gainy.recommendation.cache import TTLCache
+from gainy.recommendation.job import MatchScoreJob
+from gainy.recommendation.repository import RecommendationRepository, RecommendedCollectionAlgorithm
+from gainy.recommendation.serivce import RecommendationService, invalidate_recommended_collections_cache
+from gainy.tests.mocks.repository_mocks import mock_noop
+
+
+def test_ttl_cache():
+    now = 0
+    cache = TTLCache(10, max_size=2, clock=lambda: now)
+    loads = []
+
+    def load(value):
+        loads.append(value)
+        return value
+
+    assert cache.get_or_load("a", lambda: load(1)) == 1
+    assert cache.get_or_load("a", lambda: load(2)) == 1
+
+    now = 10
+    assert cache.get_or_load("a", lambda: load(3)) == 3
+    assert loads == [1, 3]
+
+    cache.get_or_load("b", lambda: load(4))
+    cache.get_or_load("c", lambda: load(5))
+    assert len(cache) == 2
+    assert cache.get_or_load("a", lambda: load(6)) == 6
+
+    cache.invalidate(lambda key: key == "a")
+    assert cache.get_or_load("a", lambda: load(7)) == 7
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+@pytest.fixture
+def recommended_collections_cache():
+    invalidate_recommended_collections_cache()
+    yield
+    invalidate_recommended_collections_cache()
+
+
+def test_get_recommended_collections_cache(monkeypatch,
+                                           recommended_collections_cache):
+    repository = RecommendationRepository(None)
+    calls = []
+
+    def mock_get_recommended_collections(profile_id, limit, algorithm):
+        calls.append((profile_id, limit, algorithm))
+        return [(algorithm.value, f"0_{algorithm.value}")]
+
+    monkeypatch.setattr(repository, "get_recommended_collections",
+                        mock_get_recommended_collections)
+    version = 1
+    monkeypatch.setattr(repository, "get_collection_match_scores_version",
+                        lambda profile_id: version)
+    service = RecommendationService(repository)
+
+    top_performance = RecommendedCollectionAlgorithm.TOP_PERFORMANCE
+    match_score = RecommendedCollectionAlgorithm.MATCH_SCORE
+    for profile_id in [1, 2]:
+        assert service._get_recommended_collections(profile_id, 5,
+                                                    top_performance) == [
+                                                        (4, "0_4")
+                                                    ]
+    assert len(calls) == 1
+
+    service._get_recommended_collections(1, 5, match_score)
+    service._get_recommended_collections(1, 5, match_score)
+    assert len(calls) == 2
+
+    version = 2
+    service._get_recommended_collections(1, 5, match_score)
+    assert len(calls) == 3
+
+    invalidate_recommended_collections_cache(1)
+    service._get_recommended_collections(1, 5, match_score)
+    service._get_recommended_collections(1, 5, top_performance)
+    assert len(calls) == 4
+
+    invalidate_recommended_collections_cache()
+    service._get_recommended_collections(1, 5, top_performance)
+    assert len(calls) == 5
+
+
+def test_match_score_job_invalidates_cache(monkeypatch,
+                                           recommended_collections_cache):
+    repository = RecommendationRepository(None)
+    calls = []
+
+    def mock_get_recommended_collections(profile_id, limit, algorithm):
+        calls.append(profile_id)
+        return [(profile_id, f"0_{profile_id}")]
+
+    monkeypatch.setattr(repository, "get_recommended_collections",
+                        mock_get_recommended_collections)
+    monkeypatch.setattr(repository, "get_collection_match_scores_version",
+                        lambda profile_id: 1)
+    service = RecommendationService(repository)
+    match_score = RecommendedCollectionAlgorithm.MATCH_SCORE
+    for profile_id in [1, 2]:
+        service._get_recommended_collections(profile_id, 5, match_score)
+
+    monkeypatch.setattr(repository, "get_tickers_to_update_ms", lambda: [])
+    monkeypatch.setattr(repository, "get_profiles_to_update_ms", lambda: [1])
+    monkeypatch.setattr(repository, "read_ms_batch_profile_ids",
+                        lambda batch_size: iter([]))
+    for method in [
+            "save_tickers_state", "save_profiles_state",
+            "save_collections_state", "generate_ticker_match_scores",
+            "generate_collection_match_scores"
+    ]:
+        monkeypatch.setattr(repository, method, mock_noop)
+    monkeypatch.setattr(repository, "get_collections_to_update_ms", lambda: [])
+    monkeypatch.setattr(repository, "get_ticker_collections",
+                        lambda tickers: [])
+    MatchScoreJob(repository, 10, incremental=True).run()
+
+    for profile_id in [1, 2]:
+        service._get_recommended_collections(profile_id, 5, match_score)
+    assert calls == [1, 2, 1]
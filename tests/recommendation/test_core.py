@@ -0,0 +1,201 @@
+import numpy as np
+
+from gainy.recommendation.core import DimVector, DimVectorSpace
+from gainy.recommendation.match_score import get_category_similarity, get_interest_similarity, \
+    get_interest_similarities, get_category_similarities, get_risk_similarity, get_risk_similarities, MatchScore, \
+    SimilarityLevel, MatchScoreComponent
+
+
+def test_dim_vector_space():
+    profiles = [
+        DimVector(1, {
+            "a": 1.,
+            "b": 2.
+        }),
+        DimVector(2, {}),
+        DimVector(3, {"c": 3.}),
+    ]
+    tickers = [
+        DimVector("AAPL", {
+            "b": 1.,
+            "c": 1.
+        }),
+        DimVector("MSFT", {
+            "a": 2.,
+            "d": 1.
+        }),
+    ]
+
+    space = DimVectorSpace()
+    profiles_m = space.matrix(profiles)
+    tickers_m = space.matrix(tickers)
+    assert profiles_m.shape == (3, 3)
+    assert tickers_m.shape == (2, 4)
+
+    expected_dot_products = np.array(
+        [[DimVector.dot_product(profile, ticker) for ticker in tickers]
+         for profile in profiles])
+    assert np.allclose(space.dot_product(profiles_m, tickers_m),
+                       expected_dot_products)
+
+    assert np.allclose(space.norm(profiles_m),
+                       [DimVector.norm(profile) for profile in profiles])
+    assert np.allclose(space.norm(tickers_m, order=1),
+                       [DimVector.norm(ticker, order=1) for ticker in tickers])
+
+    expected_cosine_similarity = np.array(
+        [[profile.cosine_similarity(ticker) for ticker in tickers]
+         for profile in profiles])
+    assert np.allclose(space.cosine_similarity(profiles_m, tickers_m),
+                       expected_cosine_similarity)
+
+    [vector] = space.to_vectors(profiles_m[:1], ["x"])
+    assert vector.name == "x"
+    assert vector._coordinates == {"a": 1., "b": 2.}
+
+
+def test_interest_similarity():
+    interest_score, interest_matches = get_interest_similarity(
+        [DimVector(5, {
+            "a": 1,
+            "b": 1
+        }), DimVector(7, {
+            "b": 1,
+            "c": 1
+        })], DimVector("AAPL", {
+            "b": 0.5,
+            "c": 0.25,
+            "d": 1
+        }))
+    assert abs(interest_score - 0.3867295401695068) < 1e-9
+    assert interest_matches == [7, 5]
+
+    assert get_interest_similarity([DimVector(5, {})],
+                                   DimVector("AAPL", {"a": 1})) == (0.0, [])
+
+
+def test_category_similarity():
+    category_similarity, category_matches = get_category_similarity(
+        DimVector(1, {
+            "2": 1,
+            "5": 1,
+            "7": 1
+        }), DimVector("AAPL", {
+            "7": 0.5,
+            "2": 0.1,
+            "3": 1
+        }))
+    assert abs(category_similarity - 0.3086066999241838) < 1e-9
+    assert category_matches == [2, 7]
+
+
+def _strip_padding(matches) -> list:
+    return [int(i) for i in matches if i != -1]
+
+
+def test_batch_similarities():
+    profile_interest_vs = [
+        [DimVector(5, {
+            "a": 1,
+            "b": 1
+        }), DimVector(7, {
+            "b": 1,
+            "c": 1
+        })],
+        [DimVector(3, {"d": 1})],
+        [],
+    ]
+    profile_category_vs = [
+        DimVector(1, {
+            "2": 1,
+            "5": 1,
+            "7": 1
+        }),
+        DimVector(2, {"3": 1}),
+        DimVector(3, {}),
+    ]
+    ticker_industry_vs = [
+        DimVector("AAPL", {
+            "b": 0.5,
+            "c": 0.25,
+            "d": 1
+        }),
+        DimVector("MSFT", {"a": 1}),
+    ]
+    ticker_category_vs = [
+        DimVector("AAPL", {
+            "7": 0.5,
+            "2": 0.1,
+            "3": 1
+        }),
+        DimVector("MSFT", {"5": 1}),
+    ]
+    risk_mapping = {"2": 1, "3": 3, "5": 2, "7": 2}
+
+    interest_similarities, interest_matches = get_interest_similarities(
+        profile_interest_vs, ticker_industry_vs)
+    category_similarities, category_matches = get_category_similarities(
+        profile_category_vs, ticker_category_vs)
+    risk_similarities = get_risk_similarities(profile_category_vs,
+                                              ticker_category_vs, risk_mapping)
+    assert interest_similarities.shape == (3, 2)
+    assert interest_matches.shape == (3, 2, 2)
+    assert category_matches.shape == (3, 2, 3)
+
+    for i in range(3):
+        for j in range(2):
+            if profile_interest_vs[i]:
+                interest_similarity, matches = get_interest_similarity(
+                    profile_interest_vs[i], ticker_industry_vs[j])
+            else:
+                interest_similarity, matches = 0.0, []
+            assert abs(interest_similarities[i, j] -
+                       interest_similarity) < 1e-9
+            assert _strip_padding(interest_matches[i, j]) == matches
+
+            category_similarity, matches = get_category_similarity(
+                profile_category_vs[i], ticker_category_vs[j])
+            assert abs(category_similarities[i, j] -
+                       category_similarity) < 1e-9
+            assert _strip_padding(category_matches[i, j]) == matches
+
+            assert abs(risk_similarities[i, j] - get_risk_similarity(
+                profile_category_vs[i], ticker_category_vs[j], risk_mapping)
+                       ) < 1e-9
+
+    explainer = MatchScore.similarity_explainer
+    explanations = explainer.explanations(risk_similarities,
+                                          category_similarities,
+                                          category_matches,
+                                          interest_similarities,
+                                          interest_matches)
+    assert explanations.shape == (3, 2)
+    for i in range(3):
+        for j in range(2):
+            explanation = explainer.explanation(
+                risk_similarities[i, j], category_similarities[i, j],
+                _strip_padding(category_matches[i, j]),
+                interest_similarities[i, j],
+                _strip_padding(interest_matches[i, j]))
+            assert explanations[
+                i, j]["risk_level"] == explanation.risk_level.value
+            assert explanations[
+                i, j]["category_level"] == explanation.category_level.value
+            assert explanations[
+                i, j]["interest_level"] == explanation.interest_level.value
+            assert _strip_padding(explanations[
+                i, j]["category_matches"]) == explanation.category_matches
+            assert _strip_padding(explanations[
+                i, j]["interest_matches"]) == explanation.interest_matches
+
+
+def test_explainer_levels():
+    explainer = MatchScore.similarity_explainer
+    levels = explainer.levels(np.array([0., 0.29, 0.3, 0.69, 0.7, 1., np.nan]),
+                              MatchScoreComponent.RISK)
+    assert levels.tolist() == [
+        SimilarityLevel.LOW.value, SimilarityLevel.LOW.value,
+        SimilarityLevel.MID.value, SimilarityLevel.MID.value,
+        SimilarityLevel.HIGH.value, SimilarityLevel.HIGH.value,
+        SimilarityLevel.LOW.value
+    ]
@@ -0,0 +1,222 @@
+import os
+
+import pytest
+
+from gainy.recommendation.job import MatchScoreJob, ENGINE_SQL_FEATURES
+from gainy.recommendation.repository import RecommendationRepository
+from gainy.tests.mocks.repository_mocks import mock_noop, mock_record_calls
+from gainy.utils import db_connect
+
+
+def test_incremental_run(monkeypatch):
+    repo = RecommendationRepository(None)
+    monkeypatch.setattr(repo, "get_tickers_to_update_ms", lambda: ["AAPL"])
+    monkeypatch.setattr(repo, "get_profiles_to_update_ms", lambda: [1])
+    monkeypatch.setattr(repo, "get_collections_to_update_ms", lambda: ["0_2"])
+    monkeypatch.setattr(repo, "get_ticker_collections",
+                        lambda tickers: ["0_1"] if tickers == ["AAPL"] else [])
+    monkeypatch.setattr(repo, "read_ms_batch_profile_ids",
+                        lambda batch_size: iter([[1, 2, 3]]))
+    for method in [
+            "save_tickers_state", "save_profiles_state",
+            "save_collections_state"
+    ]:
+        monkeypatch.setattr(repo, method, mock_noop)
+
+    ticker_calls = []
+    monkeypatch.setattr(repo, "generate_ticker_match_scores",
+                        mock_record_calls(ticker_calls))
+    collection_calls = []
+    monkeypatch.setattr(repo, "generate_collection_match_scores",
+                        mock_record_calls(collection_calls))
+
+    MatchScoreJob(repo, 15, incremental=True).run()
+
+    assert ticker_calls == [(([2, 3], ), {"tickers": ["AAPL"]}), (([1], ), {})]
+    assert collection_calls == [(([1], ), {}), (([2, 3], ["0_1", "0_2"]), {})]
+
+
+def test_features_engine(monkeypatch):
+    repo = RecommendationRepository(None)
+    monkeypatch.setattr(repo, "get_tickers_to_update_ms", lambda: ["AAPL"])
+    monkeypatch.setattr(repo, "get_profiles_to_update_ms", lambda: [1])
+    monkeypatch.setattr(repo, "read_ms_batch_profile_ids",
+                        lambda batch_size: iter([[1, 2]]))
+    for method in [
+            "save_tickers_state", "save_profiles_state",
+            "save_collections_state", "generate_collection_match_scores",
+            "commit"
+    ]:
+        monkeypatch.setattr(repo, method, mock_noop)
+
+    refresh_calls = []
+    monkeypatch.setattr(repo, "refresh_ticker_match_score_features",
+                        mock_record_calls(refresh_calls))
+    ticker_calls = []
+    monkeypatch.setattr(repo, "generate_ticker_match_scores",
+                        mock_record_calls(ticker_calls))
+
+    MatchScoreJob(repo, 15, ENGINE_SQL_FEATURES).run()
+
+    assert len(refresh_calls) == 1
+    assert ticker_calls == [(([2], ), {
+        "tickers": ["AAPL"],
+        "from_features": True
+    }), (([1], ), {
+        "tickers": None,
+        "from_features": True
+    })]
+
+
+def _read_collection_match_scores(db_conn, profile_id) -> dict:
+    with db_conn.cursor() as cursor:
+        cursor.execute(
+            "select collection_uniq_id, match_score from app.profile_collection_match_score where profile_id = %(profile_id)s",
+            {"profile_id": profile_id})
+        return dict(cursor.fetchall())
+
+
+def test_changed_collections():
+    profile_id = 2101
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    """insert into app.profiles (id, email) values (%(profile_id)s, 'collections@example.com');
+                       insert into app.profile_scoring_settings (profile_id, risk_score) values (%(profile_id)s, 2);
+                       insert into collection_ticker_actual_weights (profile_id, collection_id, collection_uniq_id, symbol, weight)
+                       values (null, 9001, '0_9001', 'AAPL', 0.5), (null, 9001, '0_9001', 'MARK', 0.5),
+                              (null, 9002, '0_9002', 'ADBE', 1);""",
+                    {"profile_id": profile_id})
+
+            repo.generate_ticker_match_scores([profile_id])
+            repo.generate_collection_match_scores([profile_id])
+            repo.save_collections_state()
+            assert repo.get_collections_to_update_ms() == []
+            assert {"0_9001"} <= set(repo.get_ticker_collections(["MARK"]))
+
+            match_scores = _read_collection_match_scores(db_conn, profile_id)
+            assert {"0_9001", "0_9002"} <= match_scores.keys()
+
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "update app.profile_ticker_match_score set match_score = 0 where profile_id = %(profile_id)s",
+                    {"profile_id": profile_id})
+                cursor.execute(
+                    "update collection_ticker_actual_weights set weight = 2 where collection_uniq_id = '0_9002'"
+                )
+            assert repo.get_collections_to_update_ms() == ["0_9002"]
+
+            repo.generate_collection_match_scores([profile_id], ["0_9002"])
+            updated_match_scores = _read_collection_match_scores(
+                db_conn, profile_id)
+            assert updated_match_scores["0_9001"] == match_scores["0_9001"]
+            assert updated_match_scores["0_9002"] == 0
+
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "delete from collection_ticker_actual_weights where collection_uniq_id = '0_9002'"
+                )
+                # now() is constant within the test transaction
+                cursor.execute(
+                    "update app.profile_collection_match_score set updated_at = now() - interval '1 minute' where profile_id = %(profile_id)s",
+                    {"profile_id": profile_id})
+            assert repo.get_collections_to_update_ms() == ["0_9002"]
+
+            repo.generate_collection_match_scores([profile_id], ["0_9002"])
+            assert "0_9002" not in _read_collection_match_scores(
+                db_conn, profile_id)
+
+            repo.save_collections_state()
+            assert repo.get_collections_to_update_ms() == []
+        finally:
+            db_conn.rollback()
+
+
+def test_parallel_run(monkeypatch):
+    with db_connect() as db_conn:
+        repo = RecommendationRepository(db_conn)
+        profile_ids = [
+            profile_id for batch in repo.read_ms_batch_profile_ids(100)
+            for profile_id in batch
+        ]
+        assert profile_ids
+
+        with db_conn.cursor() as cursor:
+            cursor.execute("select now()")
+            [started_at] = cursor.fetchone()
+        db_conn.commit()
+
+        try:
+            monkeypatch.setattr(repo, "get_tickers_to_update_ms", lambda: [])
+            monkeypatch.setattr(repo, "get_profiles_to_update_ms",
+                                lambda: profile_ids)
+            job = MatchScoreJob(repo, 1, workers=2)
+            job.run()
+
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "select distinct profile_id from app.profile_ticker_match_score where updated_at > %(started_at)s",
+                    {"started_at": started_at})
+                assert sorted(i for i, in cursor.fetchall()) == profile_ids
+
+            progress = job.progress.get()
+            assert sum(i["profiles"]
+                       for i in progress.values()) == 2 * len(profile_ids)
+            assert os.getpid() not in progress
+        finally:
+            db_conn.rollback()
+
+
+def test_features_engine_empty_snapshot(monkeypatch):
+    profile_id = 1
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            repo.generate_ticker_match_scores([profile_id])
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "select symbol, match_score from app.profile_ticker_match_score where profile_id = %(profile_id)s",
+                    {"profile_id": profile_id})
+                expected = dict(cursor.fetchall())
+                cursor.execute(
+                    "delete from app.profile_ticker_match_score where profile_id = %(profile_id)s",
+                    {"profile_id": profile_id})
+                cursor.execute("delete from app.ticker_match_score_features")
+            assert expected
+
+            # no ticker changed since the last plain sql run
+            monkeypatch.setattr(repo, "get_tickers_to_update_ms", lambda: [])
+            monkeypatch.setattr(repo, "get_profiles_to_update_ms",
+                                lambda: [profile_id])
+            monkeypatch.setattr(repo, "commit", mock_noop)
+            MatchScoreJob(repo, 15, ENGINE_SQL_FEATURES,
+                          incremental=True).run()
+
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "select symbol, match_score from app.profile_ticker_match_score where profile_id = %(profile_id)s",
+                    {"profile_id": profile_id})
+                assert dict(cursor.fetchall()) == expected
+        finally:
+            db_conn.rollback()
+
+
+def test_features_engine_missing_snapshot(monkeypatch):
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            with db_conn.cursor() as cursor:
+                cursor.execute("drop table app.ticker_match_score_features")
+
+            ticker_calls = []
+            monkeypatch.setattr(repo, "generate_ticker_match_scores",
+                                mock_record_calls(ticker_calls))
+            with pytest.raises(Exception, match="ticker_match_score_features"):
+                MatchScoreJob(repo, 15, ENGINE_SQL_FEATURES).run()
+            assert ticker_calls == []
+        finally:
+            db_conn.rollback()
@@ -1,8 +1,12 @@
+import random
 from typing import Any, Dict
 
 from gainy.context_container import ContextContainer
 from psycopg2.extras import RealDictCursor
 
+from gainy.recommendation.repository import RecommendationRepository
+from gainy.utils import db_connect
+
 
 def test_ticker_match_score():
     profile_id = 1
@@ -78,3 +82,147 @@ def test_ticker_match_score():
     assert collection_match_score["risk_level"] == 2
     assert collection_match_score["category_level"] == 2
     assert collection_match_score["interest_level"] == 2
+
+
+def _read_personalized_collection(db_conn, profile_ids,
+                                  collection_id) -> tuple:
+    with db_conn.cursor() as cursor:
+        cursor.execute(
+            """select profile_id, symbol from app.personalized_ticker_collections
+               where profile_id = ANY (%(profile_ids)s) and collection_id = %(collection_id)s
+               order by profile_id, symbol""", {
+                "profile_ids": profile_ids,
+                "collection_id": collection_id
+            })
+        tickers = cursor.fetchall()
+        cursor.execute(
+            """select profile_id, size from app.personalized_collection_sizes
+               where profile_id = ANY (%(profile_ids)s) and collection_id = %(collection_id)s
+               order by profile_id""", {
+                "profile_ids": profile_ids,
+                "collection_id": collection_id
+            })
+        return tickers, cursor.fetchall()
+
+
+def test_update_top_collection_tickers():
+    profile_ids = [2111, 2112, 2113]
+    collection_id = 231
+    limit = 2
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "select symbol from tickers order by symbol limit 4")
+                symbols = [i for i, in cursor.fetchall()]
+                for profile_id in profile_ids:
+                    cursor.execute(
+                        "insert into app.profiles (id, email) values (%(profile_id)s, %(email)s)",
+                        {
+                            "profile_id": profile_id,
+                            "email": f"top_{profile_id}@example.com"
+                        })
+                # the last profile has no match scores
+                for profile_id in profile_ids[:2]:
+                    for i, symbol in enumerate(symbols):
+                        cursor.execute(
+                            """insert into app.profile_ticker_match_score (profile_id, symbol, match_score)
+                               values (%(profile_id)s, %(symbol)s, %(match_score)s)""",
+                            {
+                                "profile_id": profile_id,
+                                "symbol": symbol,
+                                "match_score": (i * profile_id) % 7
+                            })
+                # stale rows are replaced
+                cursor.execute(
+                    """insert into app.personalized_ticker_collections (profile_id, collection_id, symbol)
+                       values (%(profile_id)s, %(collection_id)s, %(symbol)s);
+                       insert into app.personalized_collection_sizes (profile_id, collection_id, size)
+                       values (%(profile_id)s, %(collection_id)s, 1);""", {
+                        "profile_id": profile_ids[0],
+                        "collection_id": collection_id,
+                        "symbol": symbols[0]
+                    })
+
+            for profile_id in profile_ids:
+                repo.update_personalized_collection(
+                    profile_id, collection_id,
+                    repo.read_top_match_score_tickers(profile_id, limit))
+            expected = _read_personalized_collection(db_conn, profile_ids,
+                                                     collection_id)
+            assert len(expected[0]) == 4
+            assert expected[1] == [(2111, 2), (2112, 2), (2113, 0)]
+
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    """update app.personalized_collection_sizes set size = 5
+                       where profile_id = ANY (%(profile_ids)s)""",
+                    {"profile_ids": profile_ids})
+
+            repo.update_top_collection_tickers(profile_ids, collection_id,
+                                               limit)
+            assert _read_personalized_collection(db_conn, profile_ids,
+                                                 collection_id) == expected
+        finally:
+            db_conn.rollback()
+
+
+def test_read_top_k_collection_match_scores():
+    profile_id = 2121
+    collection_ids = list(range(9101, 9109))
+    rng = random.Random(2121)
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "select symbol from tickers order by symbol limit 6")
+                symbols = [i for i, in cursor.fetchall()]
+
+                cursor.execute(
+                    "insert into app.profiles (id, email) values (%(profile_id)s, 'top_k@example.com')",
+                    {"profile_id": profile_id})
+                for symbol in symbols:
+                    cursor.execute(
+                        """insert into app.profile_ticker_match_score (profile_id, symbol, match_score, interest_similarity, risk_similarity, category_similarity)
+                           values (%(profile_id)s, %(symbol)s, %(match_score)s, %(interest_similarity)s, 0.5, 0.5)""",
+                        {
+                            "profile_id": profile_id,
+                            "symbol": symbol,
+                            "match_score": rng.randint(0, 100),
+                            "interest_similarity": rng.random()
+                        })
+                for collection_id in collection_ids:
+                    cursor.execute(
+                        """insert into collections (id, name, enabled, personalized, size)
+                           values (%(collection_id)s, 'top_k', %(enabled)s, '0', 3)""",
+                        {
+                            "collection_id": collection_id,
+                            # disabled collections are not ranked
+                            "enabled": "0" if collection_id == 9101 else "1"
+                        })
+                    for symbol in rng.sample(symbols, 3):
+                        cursor.execute(
+                            """insert into collection_ticker_actual_weights (profile_id, collection_id, collection_uniq_id, symbol, weight)
+                               values (null, %(collection_id)s, %(collection_uniq_id)s, %(symbol)s, %(weight)s)""",
+                            {
+                                "collection_id": collection_id,
+                                "collection_uniq_id": f"0_{collection_id}",
+                                "symbol": symbol,
+                                "weight": rng.random()
+                            })
+
+            repo.generate_collection_match_scores([profile_id])
+            for limit in range(1, len(collection_ids) + 2):
+                expected = repo._read_sorted_collection_match_scores(
+                    profile_id, limit)
+                assert repo.read_top_k_collection_match_scores(
+                    profile_id, limit) == expected
+                if limit < len(collection_ids):
+                    assert len(expected) == limit
+            assert 9101 not in expected
+        finally:
+            db_conn.rollback()
@@ -0,0 +1,181 @@
+import json
+
+import pytest
+
+from gainy.recommendation import match_score_engine
+from gainy.recommendation.match_score_engine import MatchScoreEngine
+from gainy.recommendation.repository import RecommendationRepository, TICKER_MATCH_SCORE_FIELDS
+from gainy.utils import db_connect
+
+PROFILE_IDS = [2001, 2002, 2003, 2004, 2005]
+
+
+def _seed(db_conn) -> list[str]:
+    with db_conn.cursor() as cursor:
+        cursor.execute(
+            "select symbol from tickers where ms_enabled and symbol not in ('AAPL', 'MARK') order by symbol limit 3"
+        )
+        symbols = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(
+            "insert into app.profiles (id, email) select id, 'engine' || id || '@example.com' from unnest(%(ids)s) id",
+            {"ids": PROFILE_IDS})
+        cursor.execute(
+            """insert into app.profile_scoring_settings (profile_id, risk_score)
+               values (2001, 1), (2002, 2), (2003, 3), (2005, null)""")
+        cursor.execute(
+            """insert into app.profile_categories (profile_id, category_id)
+               values (2001, 2), (2001, 5), (2001, 6), (2001, 7), (2002, 6), (2004, 6), (2005, 7), (2005, 99)"""
+        )
+        cursor.execute(
+            """insert into app.profile_interests (profile_id, interest_id)
+               values (2001, 5), (2001, 12), (2001, 17), (2002, 39), (2003, 5), (2003, 40)"""
+        )
+        cursor.execute(
+            "insert into app.profile_holdings (quantity, security_id, profile_id) values (1, 49, 2002)"
+        )
+
+        cursor.execute(
+            """insert into ticker_risk_scores (symbol, risk_score)
+               values (%(s0)s, 0.1), (%(s1)s, 0.9), (%(s2)s, null)""", {
+                "s0": symbols[0],
+                "s1": symbols[1],
+                "s2": symbols[2]
+            })
+        cursor.execute(
+            """insert into ticker_categories_continuous (id, category_id, symbol, sim_dif)
+               values ('engine_1', 6, %(s0)s, 0.3), ('engine_2', 7, %(s0)s, 0.9), ('engine_3', 2, %(s0)s, 0.1),
+                      ('engine_4', 6, %(s1)s, -0.2), ('engine_5', 7, %(s1)s, null)""",
+            {
+                "s0": symbols[0],
+                "s1": symbols[1]
+            })
+        cursor.execute(
+            """insert into ticker_interests (id, interest_id, symbol, sim_dif)
+               values ('engine_1', 40, %(s0)s, 0.95), ('engine_2', 5, %(s1)s, -0.5), ('engine_3', 39, %(s1)s, null)""",
+            {
+                "s0": symbols[0],
+                "s1": symbols[1]
+            })
+
+    return symbols
+
+
+def _read_match_scores(db_conn, tickers=None) -> dict:
+    with db_conn.cursor() as cursor:
+        cursor.execute(
+            f"""select {", ".join(TICKER_MATCH_SCORE_FIELDS)}
+                from app.profile_ticker_match_score
+                where profile_id = ANY(%(profile_ids)s)
+                  and (%(tickers)s::varchar[] is null or symbol = ANY(%(tickers)s::varchar[]))""",
+            {
+                "profile_ids": PROFILE_IDS,
+                "tickers": tickers
+            })
+        return {(row[0], row[1]): row for row in cursor.fetchall()}
+
+
+def _assert_same(expected: dict, actual: dict):
+    assert expected.keys() == actual.keys()
+    assert expected
+
+    for key, expected_row in expected.items():
+        expected_row = dict(zip(TICKER_MATCH_SCORE_FIELDS, expected_row))
+        actual_row = dict(zip(TICKER_MATCH_SCORE_FIELDS, actual[key]))
+        for field in ["category_matches", "interest_matches"]:
+            # the order of matches with equal sim_dif is not defined in SQL
+            assert sorted(json.loads(actual_row.pop(field))) == sorted(
+                json.loads(expected_row.pop(field))), (key, field)
+        for field in [
+                "risk_similarity", "category_similarity", "interest_similarity"
+        ]:
+            assert actual_row.pop(field) == pytest.approx(
+                expected_row.pop(field), abs=1e-12), (key, field)
+        assert actual_row == expected_row, key
+
+
+def test_parity_with_sql():
+    with db_connect() as db_conn:
+        try:
+            symbols = _seed(db_conn)
+            repo = RecommendationRepository(db_conn)
+
+            repo.generate_ticker_match_scores(PROFILE_IDS)
+            expected = _read_match_scores(db_conn)
+            assert {profile_id
+                    for profile_id, _ in expected} == {2001, 2002, 2003, 2005}
+            assert expected[(2001, "AAPL")][7] == "[7, 6]"
+
+            computed = {
+                (row[0], row[1]): row
+                for row in MatchScoreEngine(repo).compute(PROFILE_IDS)
+            }
+            _assert_same(expected, computed)
+            assert computed[(2001, "AAPL")][7] == "[7, 6]"
+
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "delete from app.profile_ticker_match_score where profile_id = ANY(%(profile_ids)s)",
+                    {"profile_ids": PROFILE_IDS})
+            MatchScoreEngine(
+                repo, batch_size=2).generate_ticker_match_scores(PROFILE_IDS)
+            _assert_same(expected, _read_match_scores(db_conn))
+
+            tickers = symbols[:2] + ["AAPL"]
+            repo.generate_ticker_match_scores(PROFILE_IDS, tickers=tickers)
+            expected = _read_match_scores(db_conn, tickers)
+            computed = {
+                (row[0], row[1]): row
+                for row in MatchScoreEngine(repo, tickers).compute(PROFILE_IDS)
+            }
+            _assert_same(expected, computed)
+        finally:
+            db_conn.rollback()
+
+
+def test_features_parity_with_sql():
+    with db_connect() as db_conn:
+        try:
+            symbols = _seed(db_conn)
+            repo = RecommendationRepository(db_conn)
+
+            repo.generate_ticker_match_scores(PROFILE_IDS)
+            expected = _read_match_scores(db_conn)
+
+            repo.refresh_ticker_match_score_features()
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "select category_ids, category_sim_difs from app.ticker_match_score_features where symbol = %(symbol)s",
+                    {"symbol": symbols[0]})
+                assert cursor.fetchone() == ([7, 6, 2], [0.9, 0.3, 0.1])
+                cursor.execute(
+                    "delete from app.profile_ticker_match_score where profile_id = ANY(%(profile_ids)s)",
+                    {"profile_ids": PROFILE_IDS})
+
+            repo.generate_ticker_match_scores(PROFILE_IDS, from_features=True)
+            _assert_same(expected, _read_match_scores(db_conn))
+
+            tickers = symbols[:2] + ["AAPL"]
+            repo.generate_ticker_match_scores(PROFILE_IDS, tickers=tickers)
+            expected = _read_match_scores(db_conn, tickers)
+            repo.generate_ticker_match_scores(PROFILE_IDS,
+                                              tickers=tickers,
+                                              from_features=True)
+            _assert_same(expected, _read_match_scores(db_conn, tickers))
+        finally:
+            db_conn.rollback()
+
+
+def test_chunks(monkeypatch):
+    with db_connect() as db_conn:
+        try:
+            _seed(db_conn)
+            repo = RecommendationRepository(db_conn)
+
+            expected = list(MatchScoreEngine(repo).compute(PROFILE_IDS))
+            monkeypatch.setattr(match_score_engine,
+                                "MATCH_SCORE_ENGINE_CHUNK_SIZE", 1)
+            assert list(
+                MatchScoreEngine(repo).compute(PROFILE_IDS)) == expected
+        finally:
+            db_conn.rollback()
@@ -0,0 +1,208 @@
+import random
+import threading
+
+import pytest
+
+from gainy.recommendation import serivce
+from gainy.recommendation.profile_scorer import ProfileScorer, invalidate_scoring_data
+from gainy.recommendation.repository import RecommendationRepository, RecommendedCollectionAlgorithm
+from gainy.recommendation.serivce import RecommendationService, invalidate_recommended_collections_cache, \
+    persist_match_score_async
+from gainy.tests.mocks.repository_mocks import mock_record_calls
+from gainy.utils import db_connect
+
+PROFILE_ID = 1
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # scoring data may be loaded from uncommitted rows of a test transaction
+    invalidate_scoring_data()
+    invalidate_recommended_collections_cache()
+    yield
+    invalidate_scoring_data()
+    invalidate_recommended_collections_cache()
+
+
+def _seed_collections(db_conn, collection_ids):
+    rng = random.Random(2424)
+    with db_conn.cursor() as cursor:
+        cursor.execute(
+            "select symbol from tickers where ms_enabled order by symbol limit 10"
+        )
+        symbols = [i for i, in cursor.fetchall()]
+
+        for collection_id in collection_ids:
+            cursor.execute(
+                """insert into collections (id, name, enabled, personalized, size)
+                   values (%(collection_id)s, 'profile_scorer', '1', '0', 4)""",
+                {"collection_id": collection_id})
+            for symbol in rng.sample(symbols, 4):
+                cursor.execute(
+                    """insert into collection_ticker_actual_weights (profile_id, collection_id, collection_uniq_id, symbol, weight)
+                       values (null, %(collection_id)s, %(collection_uniq_id)s, %(symbol)s, %(weight)s)""",
+                    {
+                        "collection_id": collection_id,
+                        "collection_uniq_id": f"0_{collection_id}",
+                        "symbol": symbol,
+                        "weight": rng.random()
+                    })
+
+
+def test_parity_with_sql():
+    collection_ids = list(range(9201, 9209))
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            _seed_collections(db_conn, collection_ids)
+
+            repo.generate_ticker_match_scores([PROFILE_ID])
+            repo.generate_collection_match_scores([PROFILE_ID])
+
+            scorer = ProfileScorer(repo)
+            for limit in [1, 3, 5, 100]:
+                expected = repo.get_recommended_collections(
+                    PROFILE_ID, limit,
+                    RecommendedCollectionAlgorithm.MATCH_SCORE)
+                assert scorer.get_recommended_collections(PROFILE_ID,
+                                                          limit) == expected
+            assert set(collection_ids) <= {i for i, _ in expected}
+
+            # profiles without scoring settings are not scored
+            assert scorer.get_recommended_collections(-1, 10) == []
+        finally:
+            db_conn.rollback()
+
+
+def test_personalized_fast_scoring(monkeypatch):
+    collection_ids = list(range(9211, 9215))
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            _seed_collections(db_conn, collection_ids)
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "delete from app.profile_collection_match_score where profile_id = %(profile_id)s",
+                    {"profile_id": PROFILE_ID})
+
+            def compute_match_score(*args, **kwargs):
+                raise AssertionError("match scores must not be computed")
+
+            persisted = []
+            monkeypatch.setattr(serivce, "RECOMMENDATION_FAST_SCORING_ENABLED",
+                                True)
+            monkeypatch.setattr(serivce, "persist_match_score_async",
+                                mock_record_calls(persisted))
+            service = RecommendationService(repo)
+            monkeypatch.setattr(service, "compute_match_score",
+                                compute_match_score)
+
+            collections = service._get_recommended_collections_personalized(
+                PROFILE_ID, 3)
+            assert collections == ProfileScorer(
+                repo).get_recommended_collections(PROFILE_ID, 3)
+            assert len(collections) == 3
+            assert persisted == [((PROFILE_ID, ), {})]
+        finally:
+            db_conn.rollback()
+
+
+def test_persist_match_score_async(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    persisted = []
+
+    def persist_match_score(profile_id):
+        started.set()
+        release.wait(5)
+        persisted.append(profile_id)
+        with serivce._persist_lock:
+            serivce._persisting_profile_ids.discard(profile_id)
+
+    monkeypatch.setattr(serivce, "_persist_match_score", persist_match_score)
+
+    future = persist_match_score_async(2424)
+    assert started.wait(5)
+    # the profile is already being persisted
+    assert persist_match_score_async(2424) is None
+
+    release.set()
+    future.result(5)
+    assert persisted == [2424]
+
+    persist_match_score_async(2424).result(5)
+    assert persisted == [2424, 2424]
+
+
+def test_recommended_collections_cache_follows_batch_updates():
+    collection_ids = list(range(9221, 9225))
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            _seed_collections(db_conn, collection_ids)
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "delete from app.profile_collection_match_score where profile_id = %(profile_id)s",
+                    {"profile_id": PROFILE_ID})
+
+            service = RecommendationService(repo)
+            match_score = RecommendedCollectionAlgorithm.MATCH_SCORE
+            assert service._get_recommended_collections(
+                PROFILE_ID, 100, match_score) == []
+
+            # the batch recalculation does not touch the recommendations metadata
+            repo.generate_ticker_match_scores([PROFILE_ID])
+            repo.generate_collection_match_scores([PROFILE_ID])
+            collections = service._get_recommended_collections(
+                PROFILE_ID, 100, match_score)
+            assert set(collection_ids) <= {i for i, _ in collections}
+            assert collections == repo.get_recommended_collections(
+                PROFILE_ID, 100, match_score)
+        finally:
+            db_conn.rollback()
+
+
+def test_concurrent_scoring():
+    collection_ids = list(range(9231, 9239))
+
+    with db_connect() as db_conn:
+        try:
+            repo = RecommendationRepository(db_conn)
+            _seed_collections(db_conn, collection_ids)
+
+            # profiles are read from the db, only the scoring is concurrent
+            profiles = repo.read_match_score_profiles([PROFILE_ID])
+            repo.read_match_score_profiles = lambda profile_ids: profiles
+            scorer = ProfileScorer(repo)
+            expected = scorer.get_recommended_collections(PROFILE_ID, 5)
+
+            data = scorer._get_scoring_data()
+            state = [
+                dict(vars(data.ticker_features.categories)),
+                dict(vars(data.ticker_features.interests))
+            ]
+
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    scorer.get_recommended_collections(PROFILE_ID, 5)))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+            assert results == [expected] * len(threads)
+            # nothing is cached per profile in the shared scoring data
+            assert state == [
+                vars(data.ticker_features.categories),
+                vars(data.ticker_features.interests)
+            ]
+            with pytest.raises(ValueError):
+                data.ticker_features.categories.values[0, 0] = 1.
+        finally:
+            db_conn.rollback()
@@ -1,7 +1,9 @@
 import pytest
 
 from gainy.context_container import ContextContainer
-from gainy.recommendation.serivce import RecommendationService
+from gainy.recommendation.repository import RecommendationRepository
+from gainy.recommendation.serivce import RecommendationService, invalidate_recommended_collections_cache
+from gainy.utils import db_connect
 
 
 def test_get_recommended_collections_personalized():
@@ -31,6 +33,7 @@ def test_get_recommended_collections_personalized():
 
 def test_get_recommended_collections_global():
     profile_id = 1
+    invalidate_recommended_collections_cache()
 
     with ContextContainer() as context_container:
         limit = 10
@@ -85,3 +88,42 @@ def get_test_data():
 def test_calculate_risk_score(payload, expected_score):
     service = RecommendationService(None)
     assert expected_score == service.calculate_risk_score(payload)
+
+
+def test_compute_risk_scores():
+    profile_ids = [2102, 2103]
+
+    with db_connect() as db_conn:
+        try:
+            with db_conn.cursor() as cursor:
+                for (payload, _), profile_id in zip(get_test_data(),
+                                                    profile_ids):
+                    cursor.execute(
+                        """insert into app.profiles (id, email) values (%(profile_id)s, %(email)s);
+                           insert into app.profile_scoring_settings (profile_id, risk_level, average_market_return,
+                                investment_horizon, unexpected_purchases_source, damage_of_failure,
+                                stock_market_risk_level, trading_experience, if_market_drops_20_i_will_buy,
+                                if_market_drops_40_i_will_buy, risk_score)
+                           values (%(profile_id)s, %(risk_level)s, %(average_market_return)s,
+                                %(investment_horizon)s, %(unexpected_purchases_source)s, %(damage_of_failure)s,
+                                %(stock_market_risk_level)s, %(trading_experience)s, %(if_market_drops_20_i_will_buy)s,
+                                %(if_market_drops_40_i_will_buy)s, 1)""", {
+                            **payload, "profile_id": profile_id,
+                            "email": f"risk_score_{profile_id}@example.com"
+                        })
+
+            service = RecommendationService(RecommendationRepository(db_conn))
+            risk_scores = service.compute_risk_scores(profile_ids + [2104])
+            assert risk_scores == {
+                profile_id: expected_score
+                for (_, expected_score
+                     ), profile_id in zip(get_test_data(), profile_ids)
+            }
+
+            with db_conn.cursor() as cursor:
+                cursor.execute(
+                    "select profile_id, risk_score from app.profile_scoring_settings where profile_id = ANY (%(profile_ids)s)",
+                    {"profile_ids": profile_ids})
+                assert dict(cursor.fetchall()) == risk_scores
+        finally:
+            db_conn.rollback()
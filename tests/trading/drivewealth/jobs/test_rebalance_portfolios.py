@@ -2,7 +2,7 @@ import datetime
 
 from decimal import Decimal
 
-from gainy.tests.mocks.repository_mocks import mock_find, mock_record_calls, mock_persist, mock_noop, mock_calls_list
+from gainy.tests.mocks.repository_mocks import mock_find, mock_find_many_by_keys, mock_record_calls, mock_persist, mock_noop, mock_calls_list
 from gainy.trading.drivewealth.provider.provider import DriveWealthProvider
 from gainy.trading.drivewealth import DriveWealthRepository
 from gainy.trading.drivewealth.jobs.rebalance_portfolios import RebalancePortfoliosJob
@@ -392,14 +392,12 @@ def test_automatic_sell(monkeypatch):
 
     repository = TradingRepository(None)
     monkeypatch.setattr(
-        repository, "find_one",
-        mock_find([
-            (DriveWealthFund, {
-                "ref_id": fund1_ref_id
-            }, fund1),
+        repository, "find_many_by_keys",
+        mock_find_many_by_keys([
             (DriveWealthFund, {
-                "ref_id": fund2_ref_id
-            }, fund2),
+                (fund1_ref_id, ): fund1,
+                (fund2_ref_id, ): fund2,
+            }),
         ]))
 
     def mock_get_buying_power_minus_pending_fees(_profile_id):
@@ -6,7 +6,7 @@ from decimal import Decimal
 from gainy.analytics.service import AnalyticsService
 from gainy.data_access.operators import OperatorIn, OperatorNot
 from gainy.services.notification import NotificationService
-from gainy.tests.mocks.repository_mocks import mock_find, mock_persist, mock_noop, mock_record_calls
+from gainy.tests.mocks.repository_mocks import mock_find, mock_find_many_by_keys, mock_persist, mock_noop, mock_record_calls
 from gainy.tests.mocks.trading.drivewealth.api_mocks import mock_get_user_accounts, mock_get_account_money, \
     mock_get_account_positions, mock_get_account, PORTFOLIO_STATUS, FUND1_ID, USER_ID, PORTFOLIO, PORTFOLIO_REF_ID, \
     FUND1_TARGET_WEIGHT, FUND2_ID, CASH_ACTUAL_VALUE, PORTFOLIO_STATUS_EQUITY_VALUE, CASH_TARGET_WEIGHT, \
@@ -690,12 +690,14 @@ def test_create_portfolio_holdings_from_status(monkeypatch):
             (DriveWealthPortfolio, {
                 "ref_id": PORTFOLIO_REF_ID
             }, portfolio),
+        ]))
+    monkeypatch.setattr(
+        repository, "find_many_by_keys",
+        mock_find_many_by_keys([
             (DriveWealthFund, {
-                "ref_id": FUND1_ID
-            }, fund1),
-            (DriveWealthFund, {
-                "ref_id": FUND2_ID
-            }, fund2),
+                (FUND1_ID, ): fund1,
+                (FUND2_ID, ): fund2,
+            }),
         ]))
     monkeypatch.setattr(repository, "persist", mock_persist(persisted_objects))
     delete_by_calls = []
@@ -5,7 +5,8 @@ from itertools import groupby
 import pytest
 
 from gainy.data_access.operators import OperatorIn
-from gainy.tests.mocks.repository_mocks import mock_record_calls, mock_persist, mock_find
+from gainy.exceptions import EntityNotFoundException
+from gainy.tests.mocks.repository_mocks import mock_record_calls, mock_persist, mock_find, mock_find_many_by_keys
 from gainy.trading.drivewealth.provider.transaction_handler import DriveWealthTransactionHandler
 from gainy.trading.drivewealth.repository import DriveWealthRepository
 from gainy.trading.drivewealth.models import DriveWealthPortfolioStatus, \
@@ -711,22 +712,35 @@ def test_get_portfolio_symbol_weights(monkeypatch):
         fund_id2: fund_holding_2,
     }
 
+    fund_id3 = "fund_id3"
+    portfolio_status.holdings[fund_id3] = DriveWealthPortfolioStatusHolding(
+        {"holdings": [{
+            "symbol": symbol2,
+            "value": value3
+        }]})
+
     drivewealth_repository = DriveWealthRepository(None)
-    monkeypatch.setattr(
-        drivewealth_repository, "find_one",
-        mock_find([
-            (DriveWealthFund, {
-                "ref_id": fund_id1
-            }, fund1),
-            (DriveWealthFund, {
-                "ref_id": fund_id2
-            }, fund2),
-        ]))
+    requested_keys = []
+    find_many_by_keys = mock_find_many_by_keys([
+        (DriveWealthFund, {
+            (fund_id1, ): fund1,
+            (fund_id2, ): fund2,
+        }),
+    ])
+
+    def mock_find_many_by_keys_recorded(cls, keys):
+        requested_keys.extend(keys)
+        return find_many_by_keys(cls, keys)
+
+    monkeypatch.setattr(drivewealth_repository, "find_many_by_keys",
+                        mock_find_many_by_keys_recorded)
 
     handler = DriveWealthTransactionHandler(None, drivewealth_repository, None,
                                             None)
 
+    # fund3 does not hold symbol1 and is not loaded
     weights = handler._get_portfolio_symbol_weights(symbol1, portfolio_status)
+    assert requested_keys == [fund_id1, fund_id2]
     assert len(weights) == 2
     for c_id, w in weights:
         if c_id is None:
@@ -738,6 +752,10 @@ def test_get_portfolio_symbol_weights(monkeypatch):
 
         assert abs(w - expected_weigth) < Decimal(1e-10)
 
+    # fund3 holds symbol2, but is missing
+    with pytest.raises(EntityNotFoundException, match=fund_id3):
+        handler._get_portfolio_symbol_weights(symbol2, portfolio_status)
+
 
 def test_get_actual_price_from_account_positions(monkeypatch):
     symbol = "symbol"
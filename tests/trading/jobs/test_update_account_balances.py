@@ -1,4 +1,4 @@
-from gainy.tests.mocks.repository_mocks import mock_find, mock_record_calls
+from gainy.tests.mocks.repository_mocks import mock_find, mock_record_calls, mock_noop
 from gainy.trading.drivewealth.provider.provider import DriveWealthProvider
 from gainy.trading.drivewealth import DriveWealthRepository
 from gainy.trading.drivewealth.models import DriveWealthPortfolio, DriveWealthAccount
@@ -14,8 +14,9 @@ def test_update_account_balances_job(monkeypatch):
     monkeypatch.setattr(trading_account, "id", account_id)
 
     repository = DriveWealthRepository(None)
+    monkeypatch.setattr(repository, "commit", mock_noop)
     monkeypatch.setattr(
-        repository, "iterate_all",
+        repository, "iterate_all_paginated",
         mock_find([
             (TradingAccount, None, [trading_account]),
         ]))
@@ -38,8 +39,9 @@ def test_update_funding_accounts(monkeypatch):
     monkeypatch.setattr(funding_account, "id", account_id)
 
     repository = DriveWealthRepository(None)
+    monkeypatch.setattr(repository, "commit", mock_noop)
     monkeypatch.setattr(
-        repository, "iterate_all",
+        repository, "iterate_all_paginated",
         mock_find([
             (FundingAccount, None, [funding_account]),
         ]))
@@ -69,8 +71,9 @@ def test_update_portfolios(monkeypatch):
                         drivewealth_account_id)
 
     repository = DriveWealthRepository(None)
+    monkeypatch.setattr(repository, "commit", mock_noop)
     monkeypatch.setattr(
-        repository, "iterate_all",
+        repository, "iterate_all_paginated",
         mock_find([
             (DriveWealthPortfolio, None, [portfolio]),
         ]))